@@ -4,13 +4,9 @@ import cv2
 import pandas as pd
 import numpy as np
 import cv2
-import torch
-import torch
-from ultralytics import YOLO
+from utils import get_model, default_device
 
-model = YOLO(r'models\shuttle_detection\weights\best.pt')  # Ensure you have the correct model file
-device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-model.to(device)
+SHUTTLE_MODEL_PATH = 'models/shuttle_detection/weights/best.pt'
 
 
 def group_similar_coordinates(coords, threshold=10):
@@ -108,6 +104,8 @@ prev_k_frame = deque(maxlen=10)
 def real_time_detection_and_tracking(video_path):
     global global_coord_frequency, stationary_coords
 
+    model = get_model(SHUTTLE_MODEL_PATH, device=default_device())
+
     cap = cv2.VideoCapture(video_path)
     fps = cap.get(cv2.CAP_PROP_FPS)
     print(f"FPS: {fps}")
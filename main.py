@@ -1,14 +1,29 @@
-from utils import (read_video, write_video, read_video_few_frames)
+from utils import (encode_frames, FrameSource, Pipeline, warm_up, default_device, CourtGeometry,
+                   InferenceCache, inference_key, PlayerDetectionStore, load_json, save_json,
+                   ChunkCheckpoints, DEFAULT_CHECKPOINT_DIR, get_tracking_state, set_tracking_state,
+                   OverlayRenderer)
 from trackers import (
     PlayerTracker,
     ShuttleTracker,
     Doubles_Tracking,
-    real_time_detection_and_tracking,
-    draw_shuttle_predictions,
+    detect_shuttle_candidates,
+    detect_and_track_rally,
+    detect_players_parallel,
+    DetectionScheduler,
+    DetectionPlan,
+    ShuttleCandidates,
+    SHUTTLE_MODEL_PATH,
+    RallyTracker,
+    ShuttleHypothesisTracker,
+    save_rally_results,
+    StationaryObjectDetector,
+    shuttle_annotations,
+    scoreboard_annotations,
     interpolate_shuttle_tracking
 )
 from commentary import display_and_generate_commentary
 import argparse
+import itertools
 import cv2
 import copy
 from tqdm import tqdm
@@ -19,9 +34,9 @@ from torchvision.transforms import functional as F
 import os
 from models.court_and_net_detection.src.tools.utils import write_json, clear_file, is_video_detect, find_reference
 
-from models.court_and_net_detection.src.models.CourtDetect import CourtDetect
-from models.court_and_net_detection.src.models.NetDetect import NetDetect
-from models.court_and_net_detection.om import draw_court_and_net_on_frames
+from models.court_and_net_detection.src.models.CourtDetect import CourtDetect, COURT_MODEL_PATH
+from models.court_and_net_detection.src.models.NetDetect import NetDetect, NET_MODEL_PATH
+from models.court_and_net_detection.om import CourtOverlay
 import logging
 import traceback
 import warnings
@@ -57,22 +72,35 @@ def convert_to_number(obj):
 def main():
     parser = argparse.ArgumentParser(description="A script for court and player tracking")
     parser.add_argument("-doubles", action='store_true', help="doubles tracking")
-    parser.add_argument("--buffer", action='store_true', help="load data from buffer rather than inferencing again")
+    parser.add_argument("--buffer", action='store_true', help="kept for compatibility, detections are now reused from the inference cache automatically")
     parser.add_argument("--video_path", type=str, required=True, help="Path to the input video")
     parser.add_argument("-speech", action='store_true', help="Display and Generate speech")
+    parser.add_argument("--batch_size", type=int, default=8, help="number of frames per model call for player and shuttle detection")
+    parser.add_argument("--no_cache", action='store_true', help="always run inference, without reading or writing the inference cache")
+    parser.add_argument("--cache_dir", type=str, default="record/cache", help="directory of the inference cache")
+    parser.add_argument("--cache_size_gb", type=float, default=4, help="size limit of the inference cache, least recently used results are evicted first")
+    parser.add_argument("--chunk_size", type=int, default=1800, help="frames per chunk, an interrupted run resumes after the last completed chunk")
+    parser.add_argument("--workers", type=int, default=1, help="processes for player detection, each with its own model; with more than one, overlapping segments of the video are tracked in parallel and their tracks stitched")
+    parser.add_argument("--draw_workers", type=int, default=2, help="threads drawing the output frames")
+    parser.add_argument("--checkpoint_dir", type=str, default=DEFAULT_CHECKPOINT_DIR, help="directory of the per-chunk checkpoints")
+    parser.add_argument("-smooth_feet", action='store_true', help="Kalman filter the players' foot positions before measuring speed and distance")
+    parser.add_argument("--shuttle_stride", type=int, default=1, help="run the shuttle model on every n-th frame only, the Kalman tracker bridges the frames in between")
+    parser.add_argument("--adaptive_stride", type=int, default=1, help="largest stride of the adaptive detection scheduler: while the rally is idle and the shuttle track is calm, the shuttle and player models skip up to n-1 frames in a row; 1 runs them on every frame")
     # parser.add_argument("--nodrop_path", type=str, required=True, help="Path to the no drop video")
 
     args = parser.parse_args()
 
-    read_from_record = args.buffer
     bool_doubles = args.doubles
     # input_video = args.video_path  # Get video from the user
     input_video = args.video_path
     # nodrop_video = args.nodrop_path
     bool_speech = args.speech
+    batch_size = args.batch_size
 
     # Read Video
-    frames, video_fps = read_video(input_video)
+    # Each chunk of the video is decoded once for all the analysis stages below (see Pipeline)
+    source = FrameSource(input_video)
+    video_fps = source.fps
     output_video = "output.mp4"
 
     # Court and Net Detection
@@ -86,13 +114,11 @@ def main():
     if not os.path.exists(full_video_path):
         os.makedirs(full_video_path)
 
-    # Open the video file
-    video = cv2.VideoCapture(input_video, cv2.CAP_FFMPEG)
     # Get video properties
-    fps = video.get(cv2.CAP_PROP_FPS)
-    height = int(video.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    width = int(video.get(cv2.CAP_PROP_FRAME_WIDTH))
-    total_frames = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = source.fps
+    height = source.height
+    width = source.width
+    total_frames = source.total_frames
     print(height)
     print("HEYY")
     # Write video information
@@ -106,113 +132,326 @@ def main():
 
     write_json(video_dict, video_name, full_video_path)
 
-    # Initialize detection classes
-    court_detect = CourtDetect()
-    net_detect = NetDetect()
-
     reference_path = find_reference(video_name)
     if reference_path is None:
         print("There is no reference frame! Now try to find it automatically.")
     else:
         print(f"The reference frame is {reference_path}. ")
 
-    # Read only the first frame from the video
-    ret, frame = video.read()
-    if not ret:
-        print("Error: Could not read the first frame.")
-        video.release()
-
-    # Perform court and net detection on the first frame
-    court_info, have_court = court_detect.get_court_info(frame)
-    net_info, have_net = net_detect.get_net_info(frame)
-    court_lines = court_detect.hori_lines_in_court(frame)
-
-    if have_court:
-        normal_court_info = court_info
+    def detect_court_and_net(frames):
+        # Read only the first frame from the video
+        frame = next(iter(frames), None)
+        if frame is None:
+            print("Error: Could not read the first frame.")
+            return None
+
+        # Initialize detection classes
+        court_detect = CourtDetect()
+        net_detect = NetDetect()
+
+        # Perform court and net detection on the first frame
+        court_info, have_court = court_detect.get_court_info(frame)
+        net_info, have_net = net_detect.get_net_info(frame)
+        court_lines = court_detect.hori_lines_in_court(frame)
+
+        if have_court:
+            normal_court_info = court_info
+
+            begin_frame = 0  # Since we're only processing the first frame
+            next_frame = 1  # Placeholder as there's no further processing
+        else:
+            print("No court detected in the first frame.")
+            normal_court_info = None
+            begin_frame = -1
+            next_frame = -1
+
+        if have_net:
+            normal_net_info = net_info
+        else:
+            print("No net detected in the first frame.")
+            normal_net_info = None
+
+        # Correct net position if detected
+        if normal_net_info is not None and normal_court_info is not None:
+            normal_net_info[1][1], normal_net_info[2][1] = \
+                normal_court_info[2][1], normal_court_info[3][1]
+
+        court_dict = {
+            "first_rally_frame": begin_frame,
+            "next_rally_frame": next_frame,
+            "court_info": normal_court_info,
+            "net_info": normal_net_info,
+            "line_info": court_lines
+        }
+        print(court_dict)
+
+        return court_dict
+
+    def save_court_dict(court_dict):
+        with open(f"{result_path}/courts/court_kp/coordinates.json", 'w') as f:
+            json.dump(court_dict, f, cls=CustomJSONEncoder, indent=4)
+
+        # write_json(court_dict, video_name, f"{result_path}/courts/court_kp", "w")
 
-        begin_frame = 0  # Since we're only processing the first frame
-        next_frame = 1  # Placeholder as there's no further processing
-    else:
-        print("No court detected in the first frame.")
-        normal_court_info = None
-        begin_frame = -1
-        next_frame = -1
-
-    if have_net:
-        normal_net_info = net_info
+    # Inference and Tracking
+    # Players
+    if bool_doubles:
+        player_model_path = "models/player_detection/weights/doubles/yolov8m.pt"
+        track_players = Doubles_Tracking(player_model_path, batch_size=batch_size)
     else:
-        print("No net detected in the first frame.")
-        normal_net_info = None
-
-    # Correct net position if detected
-    if normal_net_info is not None and normal_court_info is not None:
-        normal_net_info[1][1], normal_net_info[2][1] = \
-            normal_court_info[2][1], normal_court_info[3][1]
-
-    court_dict = {
-        "first_rally_frame": begin_frame,
-        "next_rally_frame": next_frame,
-        "court_info": normal_court_info,
-        "net_info": normal_net_info,
-        "line_info": court_lines
-    }
-    print(court_dict)
-    import json
+        player_model_path = "models/player_detection/weights/only_player/best.pt"
+        track_players = PlayerTracker(player_model_path, batch_size=batch_size)
 
-    with open(f"{result_path}/courts/court_kp/coordinates.json", 'w') as f:
-        json.dump(court_dict, f, cls=CustomJSONEncoder, indent=4)
+    def detect_players(frames, plan=None):
+        return track_players.detect_frames(frames, plan=plan)
 
-    with open('result/court_and_net/courts/court_kp/coordinates.json', 'r') as f:
-        data = json.load(f)
-        data = convert_to_number(data)
-
-    # write_json(court_dict, video_name, f"{result_path}/courts/court_kp", "w")
-
-    # Release the video capture object after processing the first frame
-    video.release()
+    # ShuttleCock
+    def detect_shuttle(frames):
+        return detect_shuttle_candidates(frames, batch_size, stride=args.shuttle_stride)
+
+    # With --adaptive_stride the rally tracker runs during shuttle detection and picks the frames the shuttle
+    # and player models run on (a DetectionPlan per chunk); --shuttle_stride is then not used
+    scheduler = DetectionScheduler(video_fps, max_stride=args.adaptive_stride) if args.adaptive_stride > 1 else None
+    # Settings that change the detections, for the cache keys. The scheduled frames also depend on the batch
+    # size (decisions lag the tracker by one batch) and the chunk size (every chunk starts on a detected frame).
+    # Parallel player detection does not follow the schedule
+    adaptive_schedule = {'adaptive_stride': args.adaptive_stride, 'batch_size': batch_size} if scheduler is not None else {}
+    if scheduler is not None:
+        shuttle_schedule = dict(adaptive_schedule, chunk_size=args.chunk_size)
+    else:
+        shuttle_schedule = {'stride': args.shuttle_stride}
+    player_schedule = shuttle_schedule if scheduler is not None and args.workers <= 1 else {}
+
+    # Reuse the results of an earlier run on the same video with the same models
+    court_dict, detected_players, shuttle_candidates = None, None, None
+    if not args.no_cache:
+        cache = InferenceCache(args.cache_dir, max_bytes=int(args.cache_size_gb * (1 << 30)))
+        court_key = cache.key("court_and_net", input_video, [COURT_MODEL_PATH, NET_MODEL_PATH])
+        player_key = cache.key("players", input_video, [player_model_path], key_by=track_players.key_by,
+                               **player_schedule)
+        shuttle_key = cache.key("shuttle", input_video, [SHUTTLE_MODEL_PATH], **shuttle_schedule)
+
+        court_dict = cache.get(court_key, ".json", load_json)
+        detected_players = cache.get(player_key, ".npz", PlayerDetectionStore.load)
+        shuttle_candidates = cache.get(shuttle_key, ".npz", ShuttleCandidates.load)
+
+    if court_dict is not None:
+        print("Court and net keypoints loaded from the inference cache")
+    if detected_players is not None:
+        print("Player detections loaded from the inference cache")
+    if shuttle_candidates is not None:
+        print("Shuttle detections loaded from the inference cache")
+
+    # The stages that still need the frames
+    run_court = court_dict is None
+    run_players = detected_players is None
+    run_shuttle = shuttle_candidates is None
+
+    if run_players and args.workers > 1:
+        # Player detection on several cores: segments of the video are tracked in parallel processes and
+        # the track ids stitched across segments, the finished segments are checkpointed
+        segment_key = inference_key("player_segments", input_video, [player_model_path], key_by=track_players.key_by,
+                                    segment_size=args.chunk_size)
+        segment_checkpoints = ChunkCheckpoints(os.path.join(args.checkpoint_dir, segment_key))
+        detected_players = detect_players_parallel(input_video, type(track_players), player_model_path,
+                                                   workers=args.workers, segment_size=args.chunk_size,
+                                                   batch_size=batch_size, checkpoints=segment_checkpoints)
+        segment_checkpoints.clear()
+        if not args.no_cache:
+            cache.put(player_key, ".npz", detected_players, PlayerDetectionStore.save)
+        run_players = False
+
+    # The match is processed in chunks of chunk_size frames. After each chunk, its detections and the
+    # tracker state are checkpointed, so an interrupted run resumes after the last completed chunk
+    chunk_size = args.chunk_size
+    checkpoints = None
+    if run_court or run_players or run_shuttle:
+        job_key = inference_key("chunks", input_video,
+                                [COURT_MODEL_PATH, NET_MODEL_PATH, player_model_path, SHUTTLE_MODEL_PATH],
+                                stages=[run_court, run_players, run_shuttle], key_by=track_players.key_by,
+                                chunk_size=chunk_size, shuttle_stride=args.shuttle_stride, **adaptive_schedule)
+        checkpoints = ChunkCheckpoints(os.path.join(args.checkpoint_dir, job_key))
+        completed = checkpoints.completed()
+        if completed:
+            print(f"Resuming after {completed} completed chunks ({completed * chunk_size} frames)")
+
+    if run_shuttle:
+        # Load the weights and set up the predictor before the frames start flowing
+        warm_up(SHUTTLE_MODEL_PATH, device=default_device())
+
+    def start_rally(court):
+        # Court keypoints of this video, shared by every stage below
+        geometry = CourtGeometry.from_dict(court)
+        # Stationary false positives are black listed online while the rally / score logic runs,
+        # so they are picked up (and released) wherever they appear in the match. The shuttle is
+        # followed by Kalman filtered tracks, which also bridge the frames without a detection
+        return geometry, RallyTracker(video_fps, stationary_detector=StationaryObjectDetector(video_fps),
+                                      court_geometry=geometry, shuttle_tracker=ShuttleHypothesisTracker(video_fps))
+
+    court_geometry = None
+    rally = None
+    player_chunks, shuttle_chunks = [], []
+    scoreboard, tracking_data, points = [], {}, {}
+    # Track state of the player model to restore when a chunk follows one loaded from a checkpoint
+    player_tracking = None
+    start = 0
+    for index in itertools.count():
+        chunk = checkpoints.load(index) if checkpoints is not None else None
+        resumed = chunk is not None
+        if not resumed:
+            chunk = {}
+            if scheduler is not None and run_shuttle and rally is None:
+                # The rally tracker drives the detectors from the first frame on, so it needs the court first
+                if run_court:
+                    chunk["court"] = detect_court_and_net(FrameSource(input_video, max_frames=1))
+                court_dict = chunk.get("court", court_dict)
+                court_geometry, rally = start_rally(court_dict)
+            run_court_stage = run_court and index == 0 and "court" not in chunk
+
+            if run_court_stage or run_players or run_shuttle:
+                # Decode this chunk once and hand it to all the stages that still need to run, every stage
+                # on its own thread behind a bounded queue so that decoding and the models run concurrently
+                pipeline = Pipeline()
+                frames = pipeline.source("decode", FrameSource(input_video, start_frame=start, max_frames=chunk_size))
+                if run_court_stage:
+                    court_stage = pipeline.consume("court_and_net", detect_court_and_net, frames, max_items=1)
+                plan = None
+                if scheduler is not None:
+                    # The frames of this chunk the detectors run on, decided as the shuttle stage goes
+                    # or, with cached shuttle detections, those the shuttle model ran on then
+                    plan = (scheduler.start_plan() if run_shuttle else
+                            DetectionPlan.fixed(shuttle_candidates.slice(start, start + chunk_size).detected))
+                if run_players:
+                    if player_tracking is not None:
+                        # Carry on with the tracks of the last checkpointed chunk
+                        set_tracking_state(track_players.model, player_tracking)
+                        player_tracking = None
+                    player_stage = pipeline.consume("players", lambda frames: detect_players(frames, plan), frames)
+                if run_shuttle and scheduler is not None:
+                    shuttle_stage = pipeline.consume(
+                        "shuttle", lambda frames: detect_and_track_rally(frames, rally, scheduler, batch_size), frames)
+                elif run_shuttle:
+                    shuttle_stage = pipeline.consume("shuttle", detect_shuttle, frames)
+                pipeline.run()
+
+                if run_court_stage:
+                    chunk["court"] = court_stage.result()
+                if run_players:
+                    chunk["players"] = player_stage.result()
+                    chunk["player_tracking"] = get_tracking_state(track_players.model)
+                if run_shuttle and scheduler is not None:
+                    # Already through the rally tracker
+                    chunk["shuttle"], chunk["scoreboard"], chunk["tracking_data"], chunk["points"] = shuttle_stage.result()
+                elif run_shuttle:
+                    chunk["shuttle"] = shuttle_stage.result()
+
+            if run_shuttle:
+                chunk["frames"] = len(chunk["shuttle"])
+            elif run_players:
+                chunk["frames"] = len(chunk["players"])
+            else:
+                chunk["frames"] = max(0, min(chunk_size, len(shuttle_candidates) - start))
+            if chunk["frames"] == 0:
+                break
+
+        if rally is None:
+            court_dict = chunk.get("court", court_dict)
+            court_geometry, rally = start_rally(court_dict)
+
+        if resumed:
+            rally.load_state_dict(chunk["rally"])
+            if scheduler is not None and "scheduler" in chunk:
+                scheduler.load_state_dict(chunk["scheduler"])
+            player_tracking = chunk.get("player_tracking")
+        else:
+            if "tracking_data" not in chunk:
+                candidates = chunk["shuttle"] if run_shuttle else shuttle_candidates.slice(start, start + chunk["frames"])
+                chunk["scoreboard"], chunk["tracking_data"], chunk["points"] = rally.process(candidates)
+            chunk["rally"] = rally.state_dict()
+            if scheduler is not None:
+                chunk["scheduler"] = scheduler.state_dict()
+            if checkpoints is not None:
+                checkpoints.save(index, chunk)
+                print(f"Checkpointed chunk {index}: frames {start} to {start + chunk['frames'] - 1}")
+
+        if run_players:
+            player_chunks.append(chunk["players"])
+        if run_shuttle:
+            shuttle_chunks.append(chunk["shuttle"])
+        scoreboard.extend(chunk["scoreboard"])
+        tracking_data.update(chunk["tracking_data"])
+        points.update(chunk["points"])
+
+        start += chunk["frames"]
+        if chunk["frames"] < chunk_size:
+            break
+
+    if run_court:
+        # A failed detection is not cached, the next run tries again
+        if not args.no_cache and court_dict is not None and court_dict["court_info"] is not None:
+            cache.put(court_key, ".json", court_dict, save_json)
+    save_court_dict(court_dict)
+
+    if run_players:
+        detected_players = PlayerDetectionStore.concatenate(player_chunks)
+        if not args.no_cache:
+            cache.put(player_key, ".npz", detected_players, PlayerDetectionStore.save)
+
+    if run_shuttle:
+        shuttle_candidates = ShuttleCandidates.concatenate(shuttle_chunks)
+        if not args.no_cache:
+            cache.put(shuttle_key, ".npz", shuttle_candidates, ShuttleCandidates.save)
+
+    if scheduler is not None:
+        scheduler.report(shuttle_candidates.detected)
+
+    # The whole match is done, the checkpoints are not needed any more
+    if checkpoints is not None:
+        checkpoints.clear()
+
+    save_rally_results(points, tracking_data)
+    track_players.court_geometry = court_geometry
 
     # Detect speed and distance
-    speed_and_distance_estimation = SpeedAndDistance_Estimator()
+    speed_and_distance_estimation = SpeedAndDistance_Estimator(court_geometry, smooth_feet=args.smooth_feet,
+                                                               fps=video_fps)
 
-    # Inference and Tracking
-    # Players
     if bool_doubles:
-        track_players = Doubles_Tracking("models/player_detection/weights/doubles/yolov8m.pt")
-        detected_players = track_players.detect_frames(frames, read_from_record,
-                                                       record_path="record/player_detections.pkl")
         speed_and_distance_estimation.speed_n_distance_doubles(detected_players)
     else:
-        track_players = PlayerTracker("models/player_detection/weights/only_player/best.pt")
-        detected_players = track_players.detect_frames(frames, read_from_record,
-                                                       record_path="record/player_detections.pkl")
         speed_and_distance_estimation.speed_n_distance(detected_players)
 
     # Save Player Data
     track_players.save_player_data(detected_players, "result/player_data/player_data.json")
 
-    # Draw Boxes
-    # ShuttleCock
-    sframes, svideo_fps = read_video_few_frames(input_video)
-    black = real_time_detection_and_tracking(sframes, svideo_fps, find_black_list=1, black_list=[])
-
-    output_frames, tracking_data = real_time_detection_and_tracking(frames, video_fps, find_black_list=0,
-                                                                    black_list=black)
-
     # Interpolation
-    tracking_data = interpolate_shuttle_tracking(tracking_data)
-
-    output_frames = draw_shuttle_predictions(output_frames, tracking_data)
-
-    output_frames = track_players.draw_boxes(output_frames, detected_players)
-
-    # output_frames = track_shuttle.draw_boxes(output_frames, detected_shuttle)
-
-    output_frames = speed_and_distance_estimation.draw_speed_and_distance(output_frames, detected_players)
-    # output_frames = speed_and_distance_estimation.draw_speed_and_distance(output_frames, detected_shuttle)
-
-    output_frames = draw_court_and_net_on_frames(output_frames)
-    # output_frames = draw_shuttle_predictions(output_frames, shuttle_tracking_data, rest_coords, listt)
-    write_video(output_frames, output_video, video_fps)
+    tracking_data = interpolate_shuttle_tracking(tracking_data, video_fps, court_geometry)
+
+    # Draw everything frame by frame while streaming the video again. Interpolation needs the whole
+    # shuttle trajectory first, and keeping the decoded frames around instead would hold the whole match.
+    # Every subsystem hands its annotations of a frame to the renderer, which draws them in one pass;
+    # the court lines are the same on every frame, so they are rendered once and pasted.
+    def player_annotations(frame_num):
+        player_dict = detected_players[frame_num]
+        return (track_players.box_annotations(player_dict) +
+                speed_and_distance_estimation.speed_and_distance_annotations(player_dict))
+
+    renderer = OverlayRenderer([
+        lambda frame_num: scoreboard_annotations(scoreboard[frame_num], height),
+        lambda frame_num: shuttle_annotations(tracking_data, frame_num),
+        player_annotations,
+        CourtOverlay(court_geometry.court_pixels, court_geometry.net_pixels),
+    ])
+
+    def render_frame(video_frame):
+        return renderer.render(video_frame.image, video_frame.index)
+
+    # Decode, draw and encode run concurrently, drawing on several threads (frames stay in order)
+    pipeline = Pipeline()
+    frames = pipeline.source("decode", FrameSource(input_video).indexed())
+    drawn = pipeline.map("draw", render_frame, frames, workers=args.draw_workers)
+    pipeline.consume("encode", lambda frames: encode_frames(frames, output_video, video_fps), drawn)
+    pipeline.run()
 
     # Display output video and generate commentary
     if bool_speech:
@@ -6,10 +6,12 @@ import matplotlib.pyplot as plt
 from torchvision.transforms import transforms
 from torchvision.transforms import functional as F
 import os
-from src.tools.utils import write_json, clear_file, is_video_detect, find_next, find_reference
+# Run from the repository root, where the model weights and the utils package are:
+#   python -m models.court_and_net_detection.main --folder_path <videos> --result_path <results>
+from models.court_and_net_detection.src.tools.utils import write_json, clear_file, is_video_detect, find_next, find_reference
 
-from src.models.CourtDetect import CourtDetect
-from src.models.NetDetect import NetDetect
+from models.court_and_net_detection.src.models.CourtDetect import CourtDetect
+from models.court_and_net_detection.src.models.NetDetect import NetDetect
 import argparse
 
 import logging
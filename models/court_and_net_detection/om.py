@@ -1,32 +1,85 @@
+import threading
+
 import cv2
 import numpy as np
 import json
 
-def draw_court_and_net_on_frames(frames):
-    with open('./result/court_and_net/courts/court_kp/coordinates.json', 'r') as file:
-        data = json.load(file)
+from utils import draw_annotations, Line, StaticLayer
 
-    court_info = data['court_info']
-    net_info = data['net_info']
+def load_court_and_net(json_path='./result/court_and_net/courts/court_kp/coordinates.json'):
+    with open(json_path, 'r') as file:
+        data = json.load(file)
 
     # Convert coordinates to numpy arrays for drawing lines
-    court_info = np.array(court_info, np.int32)
-    net_info = np.array(net_info, np.int32)
+    court_info = np.array(data['court_info'], np.int32)
+    net_info = np.array(data['net_info'], np.int32)
+
+    return court_info, net_info
+
+def draw_court_and_net_on_frames(frames, court_info=None, net_info=None):
+    # Keypoints default to coordinates.json, read once for all the frames
+    if court_info is None or net_info is None:
+        court_info, net_info = load_court_and_net()
+    overlay = CourtOverlay(court_info, net_info)
 
     # Process each frame
     processed_frames = []
     for frame in frames:
-        # Draw lines between all points in court_info
-        for i in range(len(court_info)):
-            for j in range(i + 1, len(court_info)):  # Start from i + 1 to avoid drawing line twice for the same pair
-                cv2.line(frame, tuple(court_info[i]), tuple(court_info[j]), (0, 255, 0), 2)  # Green for court
+        # Append the processed frame to the list
+        processed_frames.append(overlay.apply(frame))
 
-        # Draw lines between all points in net_info
-        for i in range(len(net_info)):
-            for j in range(i + 1, len(net_info)):  # Start from i + 1 to avoid drawing line twice for the same pair
-                cv2.line(frame, tuple(net_info[i]), tuple(net_info[j]), (0, 0, 255), 2)  # Red for net
+    return processed_frames
 
-        # Append the processed frame to the list
-        processed_frames.append(frame)
+class CourtOverlay:
+    """
+    The court and net lines pre-rendered into a StaticLayer, so each frame gets one masked
+    copy of the lines' bounding box instead of O(k^2) cv2.line calls. The layer is rendered
+    again only when update() is given different keypoints or the frame size changes.
+    """
+    def __init__(self, court_info, net_info):
+        self.court_info = np.asarray(court_info, np.int32)
+        self.net_info = np.asarray(net_info, np.int32)
+        self.layer = None
+        self.renders = 0
+        # apply() is called from several draw threads, only one of them renders the layer
+        self.lock = threading.Lock()
+
+    def update(self, court_info, net_info):
+        """
+        Sets the keypoints of the frames to come, returns True when they changed.
+        """
+        court_info = np.asarray(court_info, np.int32)
+        net_info = np.asarray(net_info, np.int32)
+        if np.array_equal(court_info, self.court_info) and np.array_equal(net_info, self.net_info):
+            return False
+        self.court_info, self.net_info = court_info, net_info
+        self.layer = None
+        return True
+
+    def apply(self, frame):
+        layer = self.layer
+        if layer is None or layer.shape != frame.shape:
+            with self.lock:
+                layer = self.layer
+                if layer is None or layer.shape != frame.shape:
+                    layer = StaticLayer(court_and_net_annotations(self.court_info, self.net_info), frame.shape)
+                    self.layer = layer
+                    self.renders += 1
+        return layer.apply(frame)
+
+def draw_court_and_net_on_frame(frame, court_info, net_info):
+    return draw_annotations(frame, court_and_net_annotations(court_info, net_info))
+
+def court_and_net_annotations(court_info, net_info):
+    records = []
+    # Lines between all points in court_info
+    for i in range(len(court_info)):
+        for j in range(i + 1, len(court_info)):  # Start from i + 1 to avoid drawing line twice for the same pair
+            records.append(Line(tuple(court_info[i]), tuple(court_info[j]), (0, 255, 0), 2))  # Green for court
+
+    # Lines between all points in net_info
+    for i in range(len(net_info)):
+        for j in range(i + 1, len(net_info)):  # Start from i + 1 to avoid drawing line twice for the same pair
+            records.append(Line(tuple(net_info[i]), tuple(net_info[j]), (0, 0, 255), 2))  # Red for net
 
-    return processed_frames
\ No newline at end of file
+    return records
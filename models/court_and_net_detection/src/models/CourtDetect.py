@@ -8,11 +8,16 @@ from torchvision.transforms import transforms
 from torchvision.transforms import functional as F
 import os
 
+from utils import get_model
+
 import json
 
 print(os.getcwd())
 print(os.path.exists("./src/models/weights"))
 
+COURT_MODEL_PATH = 'models/court_and_net_detection/src/models/weights/court_kpRCNN.pth'
+
+
 class CourtDetect(object):
     '''
     Tasks involving Keypoint RCNNs
@@ -29,9 +34,8 @@ class CourtDetect(object):
         self.normal_court_info = None
 
     def setup_RCNN(self):
-        device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-        self.__court_kpRCNN = torch.load('models/court_and_net_detection/src/models/weights/court_kpRCNN.pth', device)
-        self.__court_kpRCNN.to(self.device).eval()
+        # Loaded once per process and shared by every CourtDetect
+        self.__court_kpRCNN = get_model(COURT_MODEL_PATH, kind='torch', device=self.device)
 
     def del_RCNN(self):
         del self.__court_kpRCNN
@@ -8,9 +8,14 @@ from torchvision.transforms import transforms
 from torchvision.transforms import functional as F
 import os
 
+from utils import get_model
 
 
 
+
+NET_MODEL_PATH = 'models/court_and_net_detection/src/models/weights/net_kpRCNN.pth'
+
+
 class NetDetect(object):
     '''
     Tasks involving Keypoint RCNNs
@@ -27,9 +32,8 @@ class NetDetect(object):
         self.normal_net_info = None
 
     def setup_RCNN(self):
-        device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-        self.__net_kpRCNN = torch.load('models/court_and_net_detection/src/models/weights/net_kpRCNN.pth', device)
-        self.__net_kpRCNN.to(self.device).eval()
+        # Loaded once per process and shared by every NetDetect
+        self.__net_kpRCNN = get_model(NET_MODEL_PATH, kind='torch', device=self.device)
 
     def del_RCNN(self):
         del self.__net_kpRCNN
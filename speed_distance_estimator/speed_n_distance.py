@@ -1,129 +1,239 @@
 import cv2
 import sys
+from collections import namedtuple
 
-sys.path.append('../')
-from utils import measure_distance , get_foot_position
-import json
+import numpy as np
 
-with open('result/court_and_net/courts/court_kp/coordinates.json', 'r') as f:
-    data = json.load(f)
+sys.path.append('../')
+from utils import measure_distances, get_foot_position, get_foot_positions, load_court_geometry, PlayerDetectionStore
+from utils import KalmanFilterBank
+from utils import draw_annotations, Text
 
-court_coord = data["court_info"]
-net_coord = data["net_info"]
+# Every detection of one player in frame order: frame indices, (n, 4) boxes, (n, 2) foot positions
+# and the rows of the detections in the PlayerDetectionStore (when there is one)
+PlayerTrajectory = namedtuple('PlayerTrajectory', ['frames', 'boxes', 'feet', 'rows'])
 
 class SpeedAndDistance_Estimator():
-    def __init__(self):
+    def __init__(self, court_geometry=None, smooth_feet=False, fps=60):
         self.frame_window = 5
-        self.frame_rate = 60
-
-    def speed_n_distance_doubles(self, detected_players):
-        # To store the total distance traveled by each player
-        total_distance = {}
-
+        # Frame rate of the video, for the speeds in km/h and the time step of the foot filters
+        self.frame_rate = fps
+        # Court keypoints of the current video, read from coordinates.json when not given
+        self.court_geometry = court_geometry
+        # Per-player trajectories of the last estimate, e.g. for heatmaps
+        self.trajectories = {}
+        # Kalman smoothing of the foot positions, so box jitter does not add to the distance
+        self.smooth_feet = smooth_feet
+        self.foot_std_a = 800.0     # pixels/s^2
+        self.foot_std_meas = 4.0    # pixels
+        self.foot_std_v0 = 300.0    # pixels/s
+        self.foot_max_gap = 30      # frames without a detection before a player's filter restarts
+
+    def get_court_geometry(self):
+        if self.court_geometry is None:
+            return load_court_geometry()
+        return self.court_geometry
+
+    def player_trajectories(self, detected_players):
+        """
+        Splits the detections into one PlayerTrajectory per player id. detected_players is a
+        PlayerDetectionStore or a list of per-frame player dictionaries.
+        """
+        if isinstance(detected_players, PlayerDetectionStore):
+            # Already columnar, only the grouping by player is left
+            ids, player_index = np.unique(detected_players.keys, return_inverse=True)
+            player_ids = {player_id: index for index, player_id in enumerate(ids.tolist())}
+            frame_index = detected_players.frame
+            all_boxes = detected_players.boxes.astype(np.float64)
+        else:
+            # One flat pass over the detections
+            player_ids = {}
+            frame_index = []
+            player_index = []
+            coordinates = []
+            for frame_num, player_dict in enumerate(detected_players):
+                for player_id, track_info in player_dict.items():
+                    frame_index.append(frame_num)
+                    player_index.append(player_ids.setdefault(player_id, len(player_ids)))
+                    coordinates.extend(track_info['coordinates'])
+
+            frame_index = np.array(frame_index, dtype=np.int64)
+            player_index = np.array(player_index, dtype=np.int64)
+            all_boxes = np.array(coordinates, dtype=np.float64).reshape(-1, 4)
+
+        # Stable sort keeps every player's detections in frame order
+        order = np.argsort(player_index, kind='stable')
+        bounds = np.searchsorted(player_index[order], np.arange(len(player_ids) + 1))
+
+        trajectories = {}
+        for player_id, index in player_ids.items():
+            rows = order[bounds[index]:bounds[index + 1]]
+            player_boxes = all_boxes[rows]
+            trajectories[player_id] = PlayerTrajectory(frame_index[rows], player_boxes,
+                                                       get_foot_positions(player_boxes), rows)
+        if self.smooth_feet:
+            trajectories = self.smooth_foot_positions(trajectories)
+        return trajectories
+
+    def smooth_foot_positions(self, trajectories):
+        """
+        Trajectories with Kalman filtered foot positions. The filters of all the players are
+        in one KalmanFilterBank, stepped once per frame. A player's filter starts at their
+        first detection and again after foot_max_gap frames without one.
+        """
+        if not trajectories:
+            return trajectories
+
+        frames = np.concatenate([trajectory.frames for trajectory in trajectories.values()])
+        players = np.concatenate([np.full(len(trajectory.frames), index)
+                                  for index, trajectory in enumerate(trajectories.values())])
+        feet = np.concatenate([trajectory.feet for trajectory in trajectories.values()])
+
+        # Detections grouped by frame
+        order = np.argsort(frames, kind='stable')
+        bounds = np.searchsorted(frames[order], np.arange(frames.max() + 2))
+
+        bank = KalmanFilterBank(self.frame_rate, std_a=self.foot_std_a,
+                                std_x=self.foot_std_meas, std_y=self.foot_std_meas)
+        initial_covariance = [self.foot_std_meas ** 2, self.foot_std_v0 ** 2, self.foot_std_a ** 2] * 2
+        filters = {}
+        last_seen = {}
+        smoothed = np.empty_like(feet)
+        for frame_num in range(len(bounds) - 1):
+            bank.predict()
+            rows = order[bounds[frame_num]:bounds[frame_num + 1]]
+            if not len(rows):
+                continue
+
+            stale = [player for player, seen in last_seen.items() if frame_num - seen > self.foot_max_gap]
+            bank.remove([filters.pop(player) for player in stale])
+            for player in stale:
+                del last_seen[player]
+
+            measured = [row for row in rows.tolist() if players[row] in filters]
+            bank.update([filters[players[row]] for row in measured], feet[measured])
+            for row in rows.tolist():
+                player = players[row]
+                if player not in filters:
+                    filters[player] = bank.add(*feet[row], covariance=initial_covariance)
+                last_seen[player] = frame_num
+
+            smoothed[rows] = bank.positions[bank.rows([filters[player] for player in players[rows].tolist()])]
+
+        start = 0
+        for player_id, trajectory in trajectories.items():
+            end = start + len(trajectory.frames)
+            trajectories[player_id] = trajectory._replace(feet=smoothed[start:end])
+            start = end
+        return trajectories
+
+    def window_estimates(self, trajectory, number_of_frames, court_geometry, court_filter=False):
+        """
+        Distance covered by one player in each window of frames. Window k runs from frame
+        k * frame_window to the first frame of the next window (or the last frame of the video)
+        and counts when the player is detected at both ends.
+
+        Returns the mask of the windows that count, the distance covered in each window
+        (0 where it does not count) and the first and last frame of every window.
+        """
+        starts = np.arange(0, number_of_frames, self.frame_window)
+        lasts = np.minimum(starts + self.frame_window, number_of_frames - 1)
+
+        # Position of each frame in the trajectory, -1 where the player is not detected
+        position = np.full(number_of_frames, -1)
+        position[trajectory.frames] = np.arange(len(trajectory.frames))
+
+        valid = (position[starts] >= 0) & (position[lasts] >= 0) & (lasts > starts)
+
+        if court_filter:
+            # Only count windows that start with the player's feet inside the court area
+            court_coord = court_geometry.court_info
+            net_coord = court_geometry.net_info
+            start_boxes = trajectory.boxes[position[starts]]
+            inside = ((start_boxes[:, 2] >= net_coord[0][0]) & (start_boxes[:, 2] <= net_coord[2][0])
+                      & (start_boxes[:, 3] >= court_coord[0][1]) & (start_boxes[:, 3] <= court_coord[5][1]))
+            valid &= inside
+
+        distances = np.zeros(len(starts))
+        # Same as measure_distances on the boxes, unless the feet are smoothed
+        distances[valid] = court_geometry.projection.distances(trajectory.feet[position[starts[valid]]],
+                                                               trajectory.feet[position[lasts[valid]]])
+
+        return valid, distances, starts, lasts
+
+    def estimate(self, detected_players, court_filter, speed_unit):
+        court_geometry = self.get_court_geometry()
         number_of_frames = len(detected_players)
-
-        for frame_num in range(0, number_of_frames, self.frame_window):
-            last_frame = min(frame_num + self.frame_window, number_of_frames - 1)
-
-            for player_id in detected_players[frame_num].keys():
-                if player_id not in detected_players[last_frame]:
-                    continue
-
-                elif detected_players[frame_num][player_id]['coordinates'][2] < net_coord[0][0] or detected_players[frame_num][player_id]['coordinates'][2] > net_coord[2][0] or detected_players[frame_num][player_id]['coordinates'][3] < court_coord[0][1] or detected_players[frame_num][player_id]['coordinates'][3] > court_coord[5][1]:
-                    continue
-
-                start_position = detected_players[frame_num][player_id]['coordinates']
-                end_position = detected_players[last_frame][player_id]['coordinates']
-
-                # Calculate the distance covered between the frames
-                distance_covered = measure_distance(start_position, end_position)
-
-                time_elapsed = (last_frame - frame_num)/self.frame_rate
-
-                if time_elapsed == 0:
-                    continue
-
-                speed_metres_per_seconds = distance_covered / time_elapsed
-                speed_km_per_hour = speed_metres_per_seconds * 3.6
-
-                if player_id not in total_distance:
-                    total_distance[player_id] = 0
-
-                # Update the total distance covered by the player
-                total_distance[player_id] += distance_covered
-
-                # Update the speed and distance for each frame in the frame window
-                for frame_num_batch in range(frame_num, last_frame + 1):
-                    if player_id not in detected_players[frame_num_batch]:
-                        continue
-
-                    detected_players[frame_num_batch][player_id]['speed'] = speed_km_per_hour
-                    detected_players[frame_num_batch][player_id]['distance'] = total_distance[player_id]
+        self.trajectories = self.player_trajectories(detected_players)
+
+        for player_id, trajectory in self.trajectories.items():
+            valid, distances, starts, lasts = self.window_estimates(trajectory, number_of_frames,
+                                                                    court_geometry, court_filter)
+            if not valid.any():
+                continue
+
+            speeds = np.zeros(len(starts))
+            speeds[valid] = distances[valid] / (lasts[valid] - starts[valid]) * speed_unit
+            total_distance = np.cumsum(distances)
+
+            # Every detection takes the window it starts in, or the window it ends when that
+            # one does not count (a window's last frame is the next window's first frame)
+            window = trajectory.frames // self.frame_window
+            ends_previous = (~valid[window]) & (trajectory.frames % self.frame_window == 0) & (window > 0)
+            window = np.where(ends_previous, window - 1, window)
+            assigned = np.flatnonzero(valid[window])
+
+            if isinstance(detected_players, PlayerDetectionStore):
+                detected_players.speed[trajectory.rows[assigned]] = speeds[window[assigned]]
+                detected_players.distance[trajectory.rows[assigned]] = total_distance[window[assigned]]
+                continue
+
+            # Scatter back into the per-frame dictionaries
+            frames = trajectory.frames[assigned].tolist()
+            window_speeds = speeds[window[assigned]].tolist()
+            window_distances = total_distance[window[assigned]].tolist()
+            for frame_num, speed, distance in zip(frames, window_speeds, window_distances):
+                detected_players[frame_num][player_id]['speed'] = speed
+                detected_players[frame_num][player_id]['distance'] = distance
 
         return detected_players
 
-    def speed_n_distance(self, detected_players):
-        # To store the total distance traveled by each player
-        total_distance = {}
-
-        number_of_frames = len(detected_players)
+    def speed_n_distance_doubles(self, detected_players):
+        # Speed in km/h over each window of frames, for players inside the court area
+        return self.estimate(detected_players, court_filter=True, speed_unit=self.frame_rate * 3.6)
 
-        for frame_num in range(0, number_of_frames, self.frame_window):
-            last_frame = min(frame_num + self.frame_window, number_of_frames - 1)
+    def speed_n_distance(self, detected_players):
+        # Speed in metres per frame over each window of frames
+        return self.estimate(detected_players, court_filter=False, speed_unit=1)
 
-            for player_id in detected_players[frame_num].keys():
-                if player_id not in detected_players[last_frame]:
-                    continue
+    def draw_speed_and_distance(self, frames, detected_players):
 
-                start_position = detected_players[frame_num][player_id]['coordinates']
-                end_position = detected_players[last_frame][player_id]['coordinates']
+        output_frames = []
+        for frame_num, frame in enumerate(frames):
+            output_frames.append(self.draw_speed_and_distance_frame(frame, detected_players[frame_num]))
 
-                # Calculate the distance covered between the frames
-                distance_covered = measure_distance(start_position, end_position)
+        return output_frames
 
-                time_elapsed = (last_frame - frame_num)
+    def draw_speed_and_distance_frame(self, frame, player_dict):
+        return draw_annotations(frame, self.speed_and_distance_annotations(player_dict))
 
-                if time_elapsed == 0:
+    def speed_and_distance_annotations(self, player_dict):
+        # Speed and distance written under the feet of every player of a single frame
+        records = []
+        for player_id, track_info in player_dict.items():
+            if "speed" in track_info:
+                speed = track_info.get('speed', None)
+                distance = track_info.get('distance', None)
+                if speed is None or distance is None:
                     continue
 
-                speed_pixels_per_frame = distance_covered / time_elapsed
+                bbox = track_info['coordinates']
+                position = get_foot_position(bbox)
+                position = list(position)
+                position[1] += 40
 
-                if player_id not in total_distance:
-                    total_distance[player_id] = 0
+                position = tuple(map(int, position))
+                records.append(Text(f"{speed:.2f} km/hr", position, 0.5, (0, 0, 0), 2))
+                records.append(Text(f"{distance:.2f} metres", (position[0], position[1] + 20), 0.5, (0, 0, 0), 2))
 
-                # Update the total distance covered by the player
-                total_distance[player_id] += distance_covered
-
-                # Update the speed and distance for each frame in the frame window
-                for frame_num_batch in range(frame_num, last_frame + 1):
-                    if player_id not in detected_players[frame_num_batch]:
-                        continue
-
-                    detected_players[frame_num_batch][player_id]['speed'] = speed_pixels_per_frame
-                    detected_players[frame_num_batch][player_id]['distance'] = total_distance[player_id]
-
-        return detected_players
-
-    def draw_speed_and_distance(self, frames, detected_players):
-
-        output_frames = []
-        for frame_num, frame in enumerate(frames):
-            for player_id, track_info in detected_players[frame_num].items():
-                if "speed" in track_info:
-                    speed = track_info.get('speed', None)
-                    distance = track_info.get('distance', None)
-                    if speed is None or distance is None:
-                        continue
-
-                    bbox = track_info['coordinates']
-                    position = get_foot_position(bbox)
-                    position = list(position)
-                    position[1] += 40
-
-                    position = tuple(map(int, position))
-                    cv2.putText(frame, f"{speed:.2f} km/hr", position, cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 2)
-                    cv2.putText(frame, f"{distance:.2f} metres", (position[0], position[1] + 20), cv2.FONT_HERSHEY_SIMPLEX,
-                                0.5, (0, 0, 0), 2)
-            output_frames.append(frame)
-
-        return output_frames
\ No newline at end of file
+        return records
@@ -1,4 +1,25 @@
 from .player_tracking import PlayerTracker
 from .shuttle_tracking import ShuttleTracker
 from .doubles_tracking import Doubles_Tracking
-from .kalman_filter_tracking_2 import real_time_detection_and_tracking, draw_shuttle_predictions, interpolate_shuttle_tracking
\ No newline at end of file
+from .stationary_objects import Blacklist, StationaryObjectDetector
+from .detection_scheduler import DetectionScheduler, DetectionPlan
+from .parallel_detection import detect_players_parallel, stitch_segments, match_tracks, plan_segments
+from .kalman_filter_tracking_2 import (
+    real_time_detection_and_tracking,
+    detect_shuttle_candidates,
+    detect_and_track_rally,
+    SHUTTLE_MODEL_PATH,
+    track_rally,
+    RallyTracker,
+    ShuttleHypothesisTracker,
+    save_rally_results,
+    ShuttleCandidates,
+    draw_shuttle_predictions,
+    draw_shuttle_predictions_frame,
+    shuttle_annotations,
+    draw_scoreboard,
+    draw_scoreboard_frame,
+    scoreboard_annotations,
+    interpolate_shuttle_tracking,
+    smooth_shuttle_trajectory
+)
\ No newline at end of file
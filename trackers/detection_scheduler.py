@@ -0,0 +1,150 @@
+import copy
+import math
+import threading
+from collections import Counter
+
+import numpy as np
+
+
+class DetectionPlan:
+    """
+    Which frames of a chunk the detectors run on, in frame order. The DetectionScheduler
+    appends its decisions while the shuttle stage reads the frames; another stage (the
+    player detection) waits for the decision of each frame with wait(i). Once the plan is
+    closed, frames without a decision are detected.
+    """
+    def __init__(self, decisions=()):
+        self.decisions = list(decisions)
+        self.closed = False
+        self.changed = threading.Condition()
+
+    @classmethod
+    def fixed(cls, detected):
+        """
+        Plan of frames decided beforehand, e.g. the detected flags of cached shuttle candidates.
+        """
+        plan = cls(bool(flag) for flag in detected)
+        plan.close()
+        return plan
+
+    def append(self, detect):
+        with self.changed:
+            self.decisions.append(detect)
+            self.changed.notify_all()
+
+    def close(self):
+        with self.changed:
+            self.closed = True
+            self.changed.notify_all()
+
+    def wait(self, i):
+        with self.changed:
+            self.changed.wait_for(lambda: i < len(self.decisions) or self.closed)
+            return self.decisions[i] if i < len(self.decisions) else True
+
+
+class DetectionScheduler:
+    """
+    Adaptive frame skipping for the shuttle and player detectors, driven by the rally tracker.
+    While the rally is idle and the shuttle track (if any) is slow and its predicted position
+    certain, the stride between detected frames grows by one with every detected frame, up to
+    max_stride, the knob trading accuracy for throughput (1 detects every frame). Detection
+    goes back to every frame as soon as the rally starts, the shuttle moves fast, the predicted
+    position gets uncertain, or the track is lost (then for recovery frames, to pick it up again).
+
+    decide() gives the decision for the next frame and records it in the plan of the chunk,
+    observe(rally, detected) updates the stride from the tracker state after that frame.
+    report(detected) prints the frames detected and skipped, and why the scheduler ran every frame.
+    """
+    def __init__(self, fps, max_stride=4, max_std=10.0, fast_speed=None, recovery=None):
+        self.fps = fps
+        self.max_stride = max_stride
+        # Pixels, standard deviation of the predicted shuttle position above which every frame is detected
+        self.max_std = max_std
+        # Pixels per second above which the shuttle counts as moving fast, 10 pixels per frame by default
+        self.fast_speed = fast_speed if fast_speed is not None else 10 * fps
+        self.recovery = recovery if recovery is not None else max(1, int(fps) // 2)
+
+        self.stride = 1
+        # Frames skipped since the last detected frame
+        self.since_detection = 0
+        self.since_lost = self.recovery
+        self.had_track = False
+        self.plan = None
+
+        # Frames observed with a reason to detect every frame, per reason
+        self.reasons = Counter()
+
+    def start_plan(self):
+        """
+        New plan for the next chunk. Its first frame is always detected, so the player
+        detections of every chunk start from a detected frame.
+        """
+        self.plan = DetectionPlan()
+        self.since_detection = self.max_stride
+        return self.plan
+
+    def decide(self):
+        detect = self.since_detection + 1 >= self.stride
+        if detect:
+            self.since_detection = 0
+        else:
+            self.since_detection += 1
+        if self.plan is not None:
+            self.plan.append(detect)
+        return detect
+
+    def busy_reason(self, rally):
+        """
+        Why every frame needs detection right now, or None when frames can be skipped.
+        """
+        if rally.relay_flag:
+            return 'rally'
+        if self.since_lost < self.recovery:
+            return 'lost track'
+        tracker = rally.shuttle_tracker
+        best = tracker.best if tracker is not None else None
+        if best is None:
+            return None
+        if math.hypot(*best.velocity) > self.fast_speed:
+            return 'fast motion'
+        if best.position_std > self.max_std:
+            return 'uncertain'
+        return None
+
+    def observe(self, rally, detected):
+        tracker = rally.shuttle_tracker
+        has_track = tracker is not None and tracker.best is not None
+        self.since_lost = 0 if self.had_track and not has_track else self.since_lost + 1
+        self.had_track = has_track
+
+        reason = self.busy_reason(rally)
+        if reason is not None:
+            self.stride = 1
+            self.reasons[reason] += 1
+        elif detected:
+            self.stride = min(self.stride + 1, self.max_stride)
+
+    def state_dict(self):
+        state = dict(vars(self))
+        # The plan belongs to the chunk being processed
+        state['plan'] = None
+        return copy.deepcopy(state)
+
+    def load_state_dict(self, state):
+        vars(self).update(copy.deepcopy(state))
+
+    def report(self, detected):
+        """
+        detected: per frame flags of the whole video, e.g. ShuttleCandidates.detected,
+        so that chunks resumed from checkpoints or the inference cache count too.
+        """
+        total = len(detected)
+        if not total:
+            return
+        skipped = total - int(np.count_nonzero(detected))
+        print(f"Detection scheduler: detectors ran on {total - skipped} of {total} frames, "
+              f"skipped {skipped} ({skipped / total:.0%}), max stride {self.max_stride}")
+        if self.reasons:
+            reasons = ", ".join(f"{reason} {count}" for reason, count in self.reasons.most_common())
+            print(f"  frames detected every frame because of: {reasons}")
@@ -16,21 +16,14 @@ from numpy.linalg import inv
 import numpy as np
 import math
 import cv2
-import torch
 from matplotlib import pyplot as plt
 import pickle as pkl
 import os
 
-import torch
-from ultralytics import YOLO
+from utils import get_model, default_device
 
 print("Current working directory:", os.getcwd())
-model = YOLO('models/shuttle_detection/weights/best.pt')
-
-
-# Ensure to use the GPU if available
-device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-model.to(device)
+SHUTTLE_MODEL_PATH = 'models/shuttle_detection/weights/best.pt'
 
 def draw_prediction(img: np.ndarray,
                     class_name: str,
@@ -273,6 +266,8 @@ def real_time_detection_and_tracking(frames):
     fps = 60
     print(f"FPS: {fps}")
 
+    model = get_model(SHUTTLE_MODEL_PATH, device=default_device())
+
     # Initialize Kalman filter (assuming one object for now)
     # filter_multi = [KalmanFilter(fps=fps, xinit=60, yinit=150, std_x=0.000025, std_y=0.0001)]
 
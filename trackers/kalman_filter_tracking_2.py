@@ -6,29 +6,27 @@ Automatically generated by Colab.
 Original file is located at
     https://colab.research.google.com/drive/1l9RFsI9qVdL0loR3WH1h4x7ax9TeAClw
 """
+import copy
 import os
+from collections import deque
 
+import lap
 import pandas as pd
-from numpy.linalg import inv
 import numpy as np
 import math
 import cv2
-import torch
 from matplotlib import pyplot as plt
 
-import torch
-from ultralytics import YOLO
+from utils import batch_frames, get_model, default_device, CourtGeometry, load_court_geometry
+from utils import draw_annotations, Rect, Text
+from utils import KalmanFilterBank, rts_smooth
+from .stationary_objects import Blacklist, cluster_by_proximity
 
 SINGLES_WIDTH = 5.18
 DOUBLES_WIDTH = 6.1
 VERTICAL_LENGTH = 13.4
 
-
-model = YOLO('models/shuttle_detection/weights/best.pt')
-
-# Ensure to use the GPU if available
-device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-model.to(device)
+SHUTTLE_MODEL_PATH = 'models/shuttle_detection/weights/best.pt'
 
 def draw_prediction(img: np.ndarray,
                     class_name: str,
@@ -54,7 +52,8 @@ class KalmanFilter():
                  std_a: float = 0.001,
                  std_x: float = 0.0045,
                  std_y: float = 0.01,
-                 cov: float = 100000) -> None:
+                 cov: float = 100000,
+                 history: int = 300) -> None:
 
         # State Matrix
         self.S = np.array([xinit, 0, 0, yinit, 0, 0])
@@ -121,10 +120,11 @@ class KalmanFilter():
         # Kalman Gain
         self.K = None
 
-        # Storing all the State, Kalman Gain and Estimate Uncertainity
-        self.S_hist = [self.S]
-        self.K_hist = []
-        self.P_hist = [self.P]
+        # Storing the last `history` State, Kalman Gain and Estimate Uncertainity in ring buffers
+        # (history=None keeps the whole run)
+        self.S_hist = deque([self.S], maxlen=history)
+        self.K_hist = deque(maxlen=history)
+        self.P_hist = deque([self.P], maxlen=history)
 
     def pred_new_state(self):
         self.S_pred = self.F.dot(self.S)
@@ -133,8 +133,10 @@ class KalmanFilter():
         self.P_pred = self.F.dot(self.P).dot(self.F.T) + self.Q
 
     def get_Kalman_gain(self):
-        self.K = self.P_pred.dot(self.H.T).dot(
-            inv(self.H.dot(self.P_pred).dot(self.H.T) + self.R))
+        # K = P_pred H^T (H P_pred H^T + R)^-1, with the 2x2 innovation covariance inverted in closed form
+        PHt = self.P_pred.dot(self.H.T)
+        (a, b), (c, d) = self.H.dot(PHt) + self.R
+        self.K = PHt.dot(np.array([[d, -b], [-c, a]]) / (a * d - b * c))
         self.K_hist.append(self.K)
 
     def state_correction(self, z):
@@ -152,6 +154,7 @@ class KalmanFilter():
                 self.R).dot(self.K.T)
         self.P_hist.append(self.P)
 
+
 def cost_fun(a, b):
     '''
     Cost function for filter Assignment
@@ -163,52 +166,187 @@ def cost_fun(a, b):
         sm += (a[i] - b[i])**2
     return sm
 
+# Chi-square value with 2 degrees of freedom below which 99% of the true detections fall
+GATE_99 = 9.21
+
+
+class ShuttleHypothesis:
+    """
+    One track of the shuttle (or of a false positive), a filter of the tracker's KalmanFilterBank.
+    """
+    def __init__(self, track_id, bank, frame_index, origin):
+        self.track_id = track_id
+        self.bank = bank
+        self.hits = 1
+        # Where the track started, and whether a detection of it has since been further than the
+        # tracker's move_distance from there (a static false positive never moves)
+        self.origin = origin
+        self.moved = False
+        # Frames the detector ran on without a detection for this track, reset on a hit
+        self.misses = 0
+        self.last_hit = frame_index
+        # Whether the last frame had a detection for this track, otherwise the position is predicted
+        self.updated = True
+
+    @property
+    def position(self):
+        state = self.bank.state(self.track_id)
+        return float(state[0]), float(state[3])
+
+    @property
+    def velocity(self):
+        state = self.bank.state(self.track_id)
+        return float(state[1]), float(state[4])
+
+    @property
+    def position_std(self):
+        # Standard deviation of the position predicted for the next frame, along the less certain axis
+        covariance = self.bank.predicted_covariance(self.track_id)
+        return math.sqrt(max(covariance[0, 0], covariance[3, 3]))
+
+
+class ShuttleHypothesisTracker:
+    """
+    Multi-hypothesis shuttle tracker. Every candidate track has its own Kalman filter (the
+    constant acceleration model of KalmanFilter, in pixels), all of them in one
+    KalmanFilterBank. On each frame all the tracks are predicted in one call, detections are gated by their Mahalanobis distance to each prediction and assigned to
+    the tracks with the Hungarian algorithm; unassigned detections start new tracks.
+
+    A track is reported once it has min_hits detections. Tracks are kept through max_gap
+    frames without a detection, so the shuttle is bridged through occlusions, missed
+    detections and frames the detector did not run on (update(None)), and a false positive
+    does not take over the moment the shuttle is lost for a frame.
+
+    After update(), moving flags the detections of the frame that joined a track which has
+    moved more than move_distance pixels since it started: a shuttle, even while it rests,
+    and never a static false positive.
+    """
+    def __init__(self, fps, std_a=3000.0, std_meas=3.0, std_v0=1500.0, gate=GATE_99, min_hits=2, max_gap=None,
+                 max_hypotheses=8, move_distance=30):
+        self.fps = fps
+        self.std_a = std_a
+        self.std_meas = std_meas
+        self.std_v0 = std_v0
+        self.gate = gate
+        self.min_hits = min_hits
+        self.max_gap = max_gap if max_gap is not None else max(2, int(fps) // 3)
+        self.max_hypotheses = max_hypotheses
+        self.move_distance = move_distance
+
+        self.bank = KalmanFilterBank(fps, std_a=std_a, std_x=std_meas, std_y=std_meas, capacity=2 * max_hypotheses)
+        # The position is the detection, the velocity is anything a shuttle can do
+        self.initial_covariance = np.array([std_meas ** 2, std_v0 ** 2, std_a ** 2] * 2)
+        self.hypotheses = []
+        self.best = None
+        self.frame_index = 0
+        self.moving = np.zeros(0, dtype=bool)
+
+    def _new_hypothesis(self, x, y):
+        track_id = self.bank.add(x, y, self.initial_covariance)
+        return ShuttleHypothesis(track_id, self.bank, self.frame_index, (x, y))
+
+    def mahalanobis(self, centers):
+        """
+        Squared Mahalanobis distances (hypotheses x detections) between the predicted
+        positions and the detections, under the innovation covariance of each track.
+        """
+        # The bank keeps the order the hypotheses were added in, and so the order of the list
+        return self.bank.mahalanobis(centers)
+
+    def update(self, centers):
+        """
+        Advances by one frame with the shuttle detections of that frame as an (n, 2) array,
+        or None when the detector did not run on it. Returns the tracked shuttle, a
+        ShuttleHypothesis, or None when there is no confirmed track.
+        """
+        self.bank.predict()
+
+        assigned = set()
+        self.moving = np.zeros(0, dtype=bool)
+        if centers is not None:
+            centers = np.asarray(centers, dtype=np.float64).reshape(-1, 2)
+            self.moving = np.zeros(len(centers), dtype=bool)
+            matches = np.full(len(self.hypotheses), -1)
+            if len(self.hypotheses) and len(centers):
+                _, matches, _ = lap.lapjv(self.mahalanobis(centers), extend_cost=True, cost_limit=self.gate)
+
+            matched = np.flatnonzero(matches >= 0)
+            self.bank.update([self.hypotheses[row].track_id for row in matched.tolist()], centers[matches[matched]])
+            for hypothesis, detection in zip(self.hypotheses, matches):
+                if detection >= 0:
+                    hypothesis.hits += 1
+                    hypothesis.misses = 0
+                    hypothesis.last_hit = self.frame_index
+                    assigned.add(int(detection))
+                    if not hypothesis.moved:
+                        x, y = centers[detection]
+                        hypothesis.moved = math.hypot(x - hypothesis.origin[0], y - hypothesis.origin[1]) > self.move_distance
+                    self.moving[detection] = hypothesis.moved
+                else:
+                    hypothesis.misses += 1
+
+        # Tracks without a detection coast on their prediction
+        for hypothesis in self.hypotheses:
+            hypothesis.updated = hypothesis.last_hit == self.frame_index
+
+        # Tracks die after max_gap frames without a detection, tentative ones on their first miss
+        alive = [hypothesis for hypothesis in self.hypotheses
+                 if self.frame_index - hypothesis.last_hit <= self.max_gap and
+                 (hypothesis.hits >= self.min_hits or hypothesis.misses == 0)]
+        self._drop(self.hypotheses, alive)
+
+        if centers is not None:
+            for detection, (x, y) in enumerate(centers.tolist()):
+                if detection not in assigned:
+                    self.hypotheses.append(self._new_hypothesis(x, y))
+
+        if len(self.hypotheses) > self.max_hypotheses:
+            ranked = sorted(self.hypotheses, key=lambda hypothesis: (hypothesis is self.best, hypothesis.hits),
+                            reverse=True)
+            self._drop(self.hypotheses, ranked[:self.max_hypotheses])
+
+        self.best = self._select()
+        self.frame_index += 1
+        return self.best
+
+    def _drop(self, hypotheses, kept):
+        # Keeps the list in the order of the bank's rows
+        kept_ids = {hypothesis.track_id for hypothesis in kept}
+        self.bank.remove([hypothesis.track_id for hypothesis in hypotheses if hypothesis.track_id not in kept_ids])
+        self.hypotheses = [hypothesis for hypothesis in hypotheses if hypothesis.track_id in kept_ids]
+
+    def _select(self):
+        # A track detected on this frame beats one coasting on its prediction (e.g. the old track after
+        # a hit reversed the shuttle), then the current track is kept, then the one with the most hits
+        confirmed = [hypothesis for hypothesis in self.hypotheses if hypothesis.hits >= self.min_hits]
+        if not confirmed:
+            return None
+        return max(confirmed, key=lambda hypothesis: (hypothesis.updated, hypothesis is self.best, hypothesis.hits))
+
+
 import json
 import numpy as np
 import cv2
 from collections import Counter
 
-def identify_stationary_objects(threshold=10):
+def identify_stationary_objects(threshold=10, coord_frequency=None):
     """
     Identifies stationary objects by grouping similar coordinates based on frequency of occurrence
     and merging those that are close together.
+    coord_frequency defaults to the global frequency dictionary.
     """
     global global_coord_frequency, stationary_coords
+    if coord_frequency is None:
+        coord_frequency = global_coord_frequency
 
-    # Get the list of coordinates and their frequencies from the global frequency dictionary
-    coords_with_freq = list(global_coord_frequency.items())
-
-    def group_coordinates_by_proximity(coords_with_freq, threshold):
-        """
-        Groups coordinates in the global frequency dictionary by proximity and sums their frequencies.
-        """
-        grouped_freq = []
-        used = [False] * len(coords_with_freq)
+    # Get the list of coordinates and their frequencies from the frequency dictionary
+    coords_with_freq = list(coord_frequency.items())
 
-        for i in range(len(coords_with_freq)):
-            if used[i]:
-                continue
-
-            current_group = [coords_with_freq[i][0]]  # Start a new group with the current coordinate
-            total_freq = coords_with_freq[i][1]  # Initialize total frequency with current frequency
-            used[i] = True
-
-            for j in range(i + 1, len(coords_with_freq)):
-                # Compute the Euclidean distance between the coordinates
-                dist = np.linalg.norm(np.array(coords_with_freq[i][0]) - np.array(coords_with_freq[j][0]))
-                if dist < threshold:
-                    current_group.append(coords_with_freq[j][0])
-                    total_freq += coords_with_freq[j][1]
-                    used[j] = True
-
-            # Average the grouped coordinates
-            avg_coord = tuple(np.mean(current_group, axis=0))
-            grouped_freq.append((avg_coord, total_freq))
-
-        return grouped_freq
-
-    # Group the coordinates by proximity
-    grouped_coords_with_freq = group_coordinates_by_proximity(coords_with_freq, threshold)
+    # Group the coordinates by proximity and sum their frequencies
+    coords = [coord for coord, freq in coords_with_freq]
+    freqs = [freq for coord, freq in coords_with_freq]
+    grouped_coords_with_freq = [(avg_coord, total_freq) for avg_coord, total_freq, _ in
+                                cluster_by_proximity(coords, freqs, threshold)]
 
     # Define a threshold for considering an object stationary based on frequency
     stationary_threshold = 10  # You can adjust this value
@@ -218,50 +356,28 @@ def identify_stationary_objects(threshold=10):
 
     return stationary_coords
 
-def group_similar_coordinates(coords, threshold=10):
+def group_similar_coordinates(coords, threshold=10, coord_frequency=None):
     """
     Groups coordinates that are within a threshold distance from each other.
     Returns a list of unique coordinates (averaged within the group).
-    Also updates the global frequency dictionary.
+    Also updates the frequency dictionary, the global one unless coord_frequency is given.
     """
+    if coord_frequency is None:
+        coord_frequency = global_coord_frequency
     grouped_coords = []
-    used = [False] * len(coords)
-
-    for i in range(len(coords)):
-        if used[i]:
-            continue
-
-        # Start a new group with the current coordinate
-        current_group = [coords[i]]
-        used[i] = True
-
-        for j in range(i + 1, len(coords)):
-            # Compute the Euclidean distance between coordinates
-            dist = np.linalg.norm(np.array(coords[i]) - np.array(coords[j]))
-            if dist < threshold:
-                current_group.append(coords[j])
-                used[j] = True
-
-        # Average the grouped coordinates
-        avg_coord = tuple(np.mean(current_group, axis=0))
-        grouped_coords.append((avg_coord, len(current_group)))
-
-        # Update global coordinate frequency
-        if avg_coord in global_coord_frequency:
-            global_coord_frequency[avg_coord] += len(current_group)
+
+    for avg_coord, _, count in cluster_by_proximity(coords, threshold=threshold):
+        grouped_coords.append((avg_coord, count))
+
+        # Update coordinate frequency
+        if avg_coord in coord_frequency:
+            coord_frequency[avg_coord] += count
         else:
-            global_coord_frequency[avg_coord] = len(current_group)
+            coord_frequency[avg_coord] = count
 
     return grouped_coords
 
 
-def is_close_to_blacklist(coord, black_list, threshold=1):
-    for black_coord in black_list:
-        distance = np.sqrt((coord[0] - black_coord[0])**2 + (coord[1] - black_coord[1])**2)
-        if distance <= threshold:
-            return True
-    return False
-
 import cv2
 import json
 import pandas as pd
@@ -283,40 +399,16 @@ def is_shuttle_in_rest(shuttle_coords_queue, number_of_past_frames, threshold=5)
         return True  # Shuttle is at rest
     else:
         return False  # Shuttle is moving
-# print(os.getcwd())
-with open('result/court_and_net/courts/court_kp/coordinates.json', 'r') as f:
-    data = json.load(f)
-
-court_coords = data["court_info"]
-net_coords = data["net_info"]
-
-# print(f"court_coords = {court_coords},")
-# print(f"net_coords = {net_coords},")
 def is_shuttle_in_court(shuttle_coord, court_coords, net_coords):
     """Check if the shuttle is inside the court using cv2.pointPolygonTest."""
-    # Convert court coordinates to a numpy array of shape (n, 1, 2) required by cv2
-    # Court-1 (towards camera)
-    court1 = court_coords[2:]
-    court_polygon = np.array(court1, dtype=np.int32).reshape((-1, 1, 2))
-    # Check if the point is inside the polygon
-    result1 = cv2.pointPolygonTest(court_polygon, shuttle_coord, False)
-
-    # Court-2 (away from camera)
-    court2 = court_coords[:4]
-    court_polygon = np.array(court2, dtype=np.int32).reshape((-1, 1, 2))
-    # Check if the point is inside the polygon
-    result2 = cv2.pointPolygonTest(court_polygon, shuttle_coord, False)
-
     '''
     1: shuttle in court near camera
     2: shuttle in court away from camera
     False: outside
     '''
-    if result1 >= 0:
-        return 1  # Shuttle is inside or on the court
-    if result2 >= 0:
-        return 2
-    return False  # Shuttle is outside the court
+    # The court polygons are precomputed by CourtGeometry, pass one around instead of
+    # calling this in a loop
+    return CourtGeometry(court_coords, net_coords).court_side(shuttle_coord)
 
 def determine_shooter(shuttle_coords_deque):
     """Determine which player shot the shuttle using the deque of shuttle coordinates.
@@ -350,19 +442,23 @@ def determine_shooter(shuttle_coords_deque):
 
     return 0  # No clear direction
 
-def assign_points(shuttle_position, prev_k_frame):
+def assign_points(shuttle_position, prev_k_frame, points=None):
+    # points is the [player 1, player 2] score to update, the global score by default
+    if points is None:
+        points = score
+
     if shuttle_position == 1:
-        score[1] += 1
+        points[1] += 1
 
     elif shuttle_position == 2:
-        score[0] += 1
+        points[0] += 1
 
     else:
         shooter = determine_shooter(prev_k_frame)
         if shooter == 2:
-            score[0] += 1
+            points[0] += 1
         else:
-            score[1] += 1
+            points[1] += 1
 
 def check_shuttle_in_net_rectangle(rest_coord, net_start, net_end, above=30, below=50):
     """
@@ -442,17 +538,19 @@ def is_consistently_increasing(y_coords, window_size=5):
     recent_coords = list(y_coords)[-window_size:]
 
     return all(recent_coords[i] < recent_coords[i+1] for i in range(window_size-1))
-def calculate_speed(coord, lastx, lasty, lastframeno, frame_count, fps):
+def calculate_speed(coord, lastx, lasty, lastframeno, frame_count, fps, court_geometry=None):
     if lastx is None:
         return 0
+    if court_geometry is None:
+        court_geometry = load_court_geometry()
     
     # Ensure all values are float
     coord = [float(coord[0]), float(coord[1])]
     lastx, lasty = float(lastx), float(lasty)
     
-    # Calculate court scaling factors
-    width_scale = SINGLES_WIDTH / (court_coords[5][0] - court_coords[0][0])
-    height_scale = VERTICAL_LENGTH / (court_coords[5][1] - court_coords[0][1])
+    # Court scaling factors
+    width_scale = court_geometry.width_scale
+    height_scale = court_geometry.height_scale
     
     # Calculate distance
     dx = (coord[0] - lastx) * width_scale
@@ -469,238 +567,566 @@ def calculate_speed(coord, lastx, lasty, lastframeno, frame_count, fps):
 
 #
 
-def real_time_detection_and_tracking(frames, fps, find_black_list, black_list):
-    global global_coord_frequency, stationary_coords, relay_flag, relay_start_frame, score
-    print(f"function call: {score}")
-    print(f"FPS: {fps}")
-
-    # Initialize Kalman filter (assuming one object for now)
-    # filter_multi = [KalmanFilter(fps=fps, xinit=60, yinit=150, std_x=0.000025, std_y=0.0001)]
-
-    # Set up the video writer for saving the result
-    frame_height, frame_width = frames[0].shape[:2]
-    out = cv2.VideoWriter('garbage/realtime_tracking_kalman.mp4', cv2.VideoWriter_fourcc(*'mp4v'), fps, (frame_width, frame_height))
-
-    tracking_data = {}
-    scored = False
-    coord_counter = Counter()
-    frame_count = 0
-    shuttle_coords_queue = deque(maxlen=10)
-    prev_k_frame = deque(maxlen=10)
-    black_list = black_list
-    # black_list = [(1894.7992769129137, 303.175568075741), (2333.0154160860784, 1482.0646242436044), (1008.7924158432904, 313.01178965849033)]
-    lastx, lasty, lastframeno = None, None, None
-
-    listt = {}
-    speed_history = []
-    rest_coords = []
-    y_coord_history = deque(maxlen=10)
-    # Rest state tracking
-    rest_state_counter = 0
+def shuttle_centers(boxes, class_ids, shuttle_class=0):
+    """
+    Centers of the detections of the shuttle class, as an (n, 2) array in detection order.
+    """
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    centers = (boxes[:, :2] + boxes[:, 2:]) / 2
+    return centers[np.asarray(class_ids) == shuttle_class]
+
+
+def filter_shuttle_candidates(boxes, class_ids, blacklist, shuttle_class=0):
+    """
+    Vectorized post-processing of one frame of detections: box centers, shuttle class
+    filter and rejection of centers close to a point of the Blacklist.
+    Returns the kept centers as an (n, 2) array, in detection order.
+    """
+    centers = shuttle_centers(boxes, class_ids, shuttle_class)
+    return centers[~blacklist.reject_mask(centers)]
+
+
+def calculate_speeds(coords, lastx, lasty, lastframeno, frame_count, fps, court_geometry=None):
+    """
+    calculate_speed for all the kept centers of a frame at once. As in the per-detection
+    loop, each center is measured against the center accepted just before it.
+    """
+    coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    if court_geometry is None:
+        court_geometry = load_court_geometry()
+
+    previous = np.empty_like(coords)
+    previous[1:] = coords[:-1]
+    previous_frames = np.full(len(coords), frame_count, dtype=np.float64)
+    if lastx is not None:
+        previous[0] = (float(lastx), float(lasty))
+        previous_frames[0] = lastframeno
+    else:
+        previous[0] = coords[0]
+
+    # Court scaling factors
+    width_scale = court_geometry.width_scale
+    height_scale = court_geometry.height_scale
+
+    # Calculate distance
+    dx = (coords[:, 0] - previous[:, 0]) * width_scale
+    dy = (coords[:, 1] - previous[:, 1]) * height_scale
+    distance = np.sqrt(dx**2 + dy**2)
+
+    # Calculate time difference
+    time_diff = (frame_count - previous_frames) / fps
+
+    # Calculate speed
+    speeds = np.zeros(len(coords))
+    moving = time_diff > 0
+    speeds[moving] = distance[moving] / time_diff[moving]
+
+    return speeds
+
+
+class ShuttleCandidates:
+    """
+    Raw shuttle model output for a run of frames, kept as flat arrays instead of one
+    Results object per frame. The detections of frame i are rows offsets[i]:offsets[i + 1]
+    of boxes (xyxy), class_ids and confidences. detected[i] is False for the frames the
+    model skipped; iterating gives (None, None, None) for those.
+    """
+    def __init__(self, boxes, class_ids, confidences, offsets, detected=None):
+        self.boxes = boxes
+        self.class_ids = class_ids
+        self.confidences = confidences
+        self.offsets = offsets
+        if detected is None:
+            detected = np.ones(len(offsets) - 1, dtype=bool)
+        self.detected = np.asarray(detected, dtype=bool)
+
+    @classmethod
+    def from_frames(cls, per_frame, detected=None):
+        """
+        Builds the arrays from a list of (boxes, class_ids, confidences) tuples, one per frame.
+        """
+        counts = [len(boxes) for boxes, _, _ in per_frame]
+        offsets = np.zeros(len(per_frame) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(counts)
+
+        if per_frame:
+            boxes = np.concatenate([b for b, _, _ in per_frame]).reshape(-1, 4).astype(np.float32)
+            class_ids = np.concatenate([c for _, c, _ in per_frame]).astype(np.int32)
+            confidences = np.concatenate([s for _, _, s in per_frame]).astype(np.float32)
+        else:
+            boxes = np.zeros((0, 4), dtype=np.float32)
+            class_ids = np.zeros(0, dtype=np.int32)
+            confidences = np.zeros(0, dtype=np.float32)
+
+        return cls(boxes, class_ids, confidences, offsets, detected)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.frame(i) if self.detected[i] else (None, None, None)
+
+    def frame(self, i):
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return self.boxes[start:end], self.class_ids[start:end], self.confidences[start:end]
+
+    def head(self, n):
+        """
+        Candidates of the first n frames, sharing memory with this object.
+        """
+        return self.slice(0, n)
+
+    def slice(self, start, end):
+        """
+        Candidates of frames start to end (excluded), sharing the box arrays with this object.
+        """
+        end = min(end, len(self))
+        start = min(start, end)
+        first, last = self.offsets[start], self.offsets[end]
+        return ShuttleCandidates(self.boxes[first:last], self.class_ids[first:last], self.confidences[first:last],
+                                 self.offsets[start:end + 1] - first, self.detected[start:end])
+
+    @classmethod
+    def concatenate(cls, parts):
+        """
+        Joins the candidates of consecutive runs of frames, e.g. the chunks of a match.
+        """
+        if not parts:
+            return cls.from_frames([])
+        offsets = [parts[0].offsets[:1]]
+        total = 0
+        for part in parts:
+            offsets.append(part.offsets[1:] - part.offsets[0] + total)
+            total += part.offsets[-1] - part.offsets[0]
+        return cls(np.concatenate([part.boxes for part in parts]),
+                   np.concatenate([part.class_ids for part in parts]),
+                   np.concatenate([part.confidences for part in parts]),
+                   np.concatenate(offsets).astype(np.int64),
+                   np.concatenate([part.detected for part in parts]))
+
+    @property
+    def centers(self):
+        return (self.boxes[:, :2] + self.boxes[:, 2:]) / 2
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            np.savez(f, boxes=self.boxes, class_ids=self.class_ids, confidences=self.confidences, offsets=self.offsets,
+                     detected=self.detected)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            # Files saved before frames could be skipped have every frame detected
+            detected = data['detected'] if 'detected' in data.files else None
+            return cls(data['boxes'], data['class_ids'], data['confidences'], data['offsets'], detected)
+
+
+NO_DETECTIONS = (np.zeros((0, 4), dtype=np.float32), np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float32))
+
+
+def shuttle_rows(result):
+    # (boxes, class_ids, confidences) arrays of one frame of shuttle model output
+    return (result.boxes.xyxy.cpu().numpy(), result.boxes.cls.cpu().int().numpy(), result.boxes.conf.cpu().numpy())
+
+
+def detect_shuttle_candidates(frames, batch_size=16, model_path=SHUTTLE_MODEL_PATH, stride=1):
+    """
+    Runs the shuttle model over the frames, batch_size frames per call, and returns the
+    detections as ShuttleCandidates. This is the only expensive part of shuttle tracking;
+    the rally / score logic in track_rally can be re-run on the result without re-inferencing.
+
+    With stride > 1 the model only sees every stride-th frame, the frames in between are
+    left for the Kalman tracker of RallyTracker to bridge.
+    """
+    # Loaded on first use and cached, on the GPU when there is one
+    model = get_model(model_path, device=default_device())
+
+    detected = []
+
+    def selected_frames():
+        for i, frame in enumerate(frames):
+            detected.append(i % stride == 0)
+            if detected[-1]:
+                yield frame
+
+    found = []
+    for batch in batch_frames(selected_frames(), batch_size):
+        found.extend(shuttle_rows(result) for result in model(batch))
+        print(f"Detected shuttle candidates up to frame {len(detected)}")
+
+    found = iter(found)
+    per_frame = [next(found) if is_detected else NO_DETECTIONS for is_detected in detected]
+    return ShuttleCandidates.from_frames(per_frame, detected)
+
+
+def detect_and_track_rally(frames, rally, scheduler, batch_size=16, model_path=SHUTTLE_MODEL_PATH):
+    """
+    Shuttle detection and the rally tracker run together, so a DetectionScheduler can pick
+    the frames the model runs on from the state of the tracker. Frames are taken in windows
+    of batch_size frames: the scheduler decides each frame as it is read, the detected
+    frames of the window go through the model in one call, then the whole window through the
+    tracker. Decisions so lag the tracker by at most one window.
+
+    Returns the ShuttleCandidates (with the detected flags) and, like RallyTracker.process,
+    the scoreboard records, shuttle tracking data and score of the frames.
+    """
+    model = get_model(model_path, device=default_device())
+
+    per_frame, detected = [], []
+    scoreboard, tracking_data, points = [], {}, {}
+
+    def track(window):
+        batch = [frame for frame, detect in window if detect]
+        results = iter(model(batch) if batch else [])
+        for _, detect in window:
+            found = shuttle_rows(next(results)) if detect else NO_DETECTIONS
+            per_frame.append(found)
+            detected.append(detect)
+            boxes, class_ids, scores = found if detect else (None, None, None)
+            frame_count = rally.frame_count
+            overlay, tracking_data[f"{frame_count}"], points[f"{frame_count}"] = rally.update(boxes, class_ids, scores)
+            scoreboard.append(overlay)
+            scheduler.observe(rally, detect)
+
+    try:
+        for window in batch_frames(((frame, scheduler.decide()) for frame in frames), batch_size):
+            track(window)
+            print(f"Detected shuttle candidates up to frame {len(detected)}")
+    finally:
+        # Stages waiting on the plan (player detection) must not wait for frames that never come
+        if scheduler.plan is not None:
+            scheduler.plan.close()
+
+    return ShuttleCandidates.from_frames(per_frame, detected), scoreboard, tracking_data, points
+
+
+def real_time_detection_and_tracking(frames, fps, find_black_list, black_list, batch_size=16, court_geometry=None):
+    candidates = detect_shuttle_candidates(frames, batch_size)
+    return track_rally(candidates, fps, find_black_list, black_list, court_geometry=court_geometry)
+
+
+class RallyTracker:
+    """
+    The rally and score state machine of track_rally, advanced by one frame of detections at
+    a time. Everything carried from one frame to the next (score, relay flag, last shuttle
+    positions, rest state, online black list...) lives on the tracker, so a match can be
+    processed in chunks: checkpoint state_dict() after a chunk and resume from it with
+    load_state_dict().
+
+    With a ShuttleHypothesisTracker, the shuttle of a frame is the position of its best
+    track, so frames with several detections or none (bridged by the Kalman prediction)
+    still get a shuttle position, instead of only frames with exactly one detection.
+
+    count_coordinates keeps the frequency of every grouped shuttle coordinate of the match in
+    coord_frequency, which identify_stationary_objects needs to find a black list offline;
+    the online StationaryObjectDetector does not, so it is off by default.
+    """
     REST_THRESHOLD = 3  # Number of consecutive frames to consider as "at rest"
 
-    points = {}
-    net_ke_pas = False
-    for frame in frames:
-        if scored and relay_flag:
-            scored = False
-
-        print(f"Processing frame {frame_count}")
-
-        results = model([frame])
-
-        boxes = results[0].boxes.xyxy.cpu().numpy()
-        class_ids = results[0].boxes.cls.cpu().int().numpy()
-        scores = results[0].boxes.conf.cpu().numpy()
-
-        df_current = pd.DataFrame({
-            'xmin': boxes[:, 0],
-            'ymin': boxes[:, 1],
-            'xmax': boxes[:, 2],
-            'ymax': boxes[:, 3],
-            'class_id': class_ids,
-            'confidence': scores
-        })
-
-        current_coords = []
-        if frame_count not in listt:
-            listt[frame_count] = []
-
-        for _, row in df_current.iterrows():
-            coord = [(row['xmin'] + row['xmax']) / 2, (row['ymin'] + row['ymax']) / 2]
-
-            if row['class_id'] == 0:
-                if not is_close_to_blacklist(coord, black_list, threshold=15):
-                    current_coords.append(coord)
-                    
-                    speed = calculate_speed(coord, lastx, lasty, lastframeno, frame_count, fps)
-                    listt[frame_count].append({
-                        'x_center': coord[0],
-                        'y_center': coord[1],
-                        'speed': speed
-                    })
-
-                    lastx, lasty, lastframeno = coord[0], coord[1], frame_count
+    def __init__(self, fps, black_list=(), stationary_detector=None, court_geometry=None, shuttle_tracker=None,
+                 count_coordinates=False):
+        print(f"FPS: {fps}")
+        if court_geometry is None:
+            court_geometry = load_court_geometry()
+
+        self.fps = fps
+        self.court_geometry = court_geometry
+        self.stationary_detector = stationary_detector
+        self.shuttle_tracker = shuttle_tracker
+        self.blacklist = Blacklist(black_list, threshold=15)
+
+        self.frame_count = 0
+        self.score = [0, 0]
+        self.relay_flag = 0
+        self.relay_start_frame = None  # Track the frame where the relay starts
+        self.scored = False
+        # Frequency of the grouped coordinates, for identify_stationary_objects
+        self.coord_frequency = {} if count_coordinates else None
+
+        self.shuttle_coords_queue = deque(maxlen=10)
+        self.prev_k_frame = deque(maxlen=10)
+        self.y_coord_history = deque(maxlen=10)
+        self.lastx, self.lasty, self.lastframeno = None, None, None
+        self.speed_history = []
+        self.rest_coords = []
+        # Rest state tracking
+        self.rest_state_counter = 0
+
+        # Last rest and net events, their text stays on screen for a while
+        self.shuttle_position = None
+        self.text_position = None
+        self.net_ke_pas = False
+        self.net_frame = None
+
+    def state_dict(self):
+        """
+        Copy of the state carried between frames. The court geometry is not part of it, it is
+        passed again when the tracker is re-created to resume.
+        """
+        state = dict(vars(self))
+        del state['court_geometry']
+        return copy.deepcopy(state)
+
+    def load_state_dict(self, state):
+        vars(self).update(copy.deepcopy(state))
+
+    def process(self, candidates):
+        """
+        Runs the state machine over ShuttleCandidates (or any iterable of per-frame
+        (boxes, class_ids, scores), None for frames the detector skipped). Returns the scoreboard records, the shuttle tracking
+        data and the score of these frames, keyed by the frame number in the match.
+        """
+        scoreboard = []
+        tracking_data = {}
+        points = {}
+        for boxes, class_ids, scores in candidates:
+            frame_count = self.frame_count
+            overlay, tracking_data[f"{frame_count}"], points[f"{frame_count}"] = self.update(boxes, class_ids, scores)
+            scoreboard.append(overlay)
+        return scoreboard, tracking_data, points
+
+    def update(self, boxes, class_ids, scores):
+        """
+        Advances by one frame. Returns the scoreboard record, the shuttle tracking record and
+        the score of the frame. boxes is None when the detector did not run on this frame.
+        """
+        court_coords = self.court_geometry.court_info
+        frame_count = self.frame_count
+
+        if self.scored and self.relay_flag:
+            self.scored = False
+
+        # Centers of the shuttle detections that are not near a black listed point
+        detected = boxes is not None
+        if detected:
+            centers = shuttle_centers(boxes, class_ids)
+            kept = ~self.blacklist.reject_mask(centers)
+            coords = centers[kept]
+        else:
+            coords = np.zeros((0, 2))
+        current_coords = coords.tolist()
+
+        detections = []
+        predicted = False
+        if self.shuttle_tracker is not None:
+            # One shuttle per frame, the best track, on its prediction when it has no detection
+            track = self.shuttle_tracker.update(coords if detected else None)
+            if track is not None:
+                x, y = track.position
+                speed = calculate_speed((x, y), self.lastx, self.lasty, self.lastframeno, frame_count, self.fps,
+                                        self.court_geometry)
+                detections.append({'x_center': x, 'y_center': y, 'speed': speed})
+                predicted = not track.updated
+                self.lastx, self.lasty, self.lastframeno = x, y, frame_count
+
+        elif len(coords):
+            speeds = calculate_speeds(coords, self.lastx, self.lasty, self.lastframeno, frame_count, self.fps,
+                                      self.court_geometry)
+            for (x, y), speed in zip(current_coords, speeds.tolist()):
+                detections.append({
+                    'x_center': x,
+                    'y_center': y,
+                    'speed': speed
+                })
+
+            self.lastx, self.lasty, self.lastframeno = current_coords[-1][0], current_coords[-1][1], frame_count
+
+        if detected and self.stationary_detector is not None:
+            # Black listed detections stay in, so static objects stay black listed, but the ones on a
+            # track that has moved are the shuttle, e.g. at rest on the floor, and never get black listed.
+            # The black list is updated for the next frame.
+            static = np.ones(len(centers), dtype=bool)
+            if self.shuttle_tracker is not None:
+                static[np.flatnonzero(kept)[self.shuttle_tracker.moving]] = False
+            self.blacklist = self.stationary_detector.update(frame_count, centers[static])
 
         # Update tracking_data and check for rest state
         is_at_rest = False
-        if frame_count in listt and len(listt[frame_count]) == 1:
-            coord = (listt[frame_count][0]['x_center'], listt[frame_count][0]['y_center'])
-            shuttle_coords_queue.append(coord)
-            prev_k_frame.append(coord)
-            y_coord_history.append(coord[1])
+        if len(detections) == 1:
+            coord = (detections[0]['x_center'], detections[0]['y_center'])
+            self.shuttle_coords_queue.append(coord)
+            self.prev_k_frame.append(coord)
+            self.y_coord_history.append(coord[1])
 
             # Relay start detection
-            if relay_flag == 0 and determine_shooter(prev_k_frame.copy())==1 and is_consistently_decreasing(y_coord_history):
-                relay_flag = 1
-                relay_start_frame = frame_count  # Track when the relay starts
-                # print(f"Relay start at frame {frame_count}")
-            elif relay_flag==0 and determine_shooter(prev_k_frame.copy())==2 and is_consistently_increasing(y_coord_history):
-                relay_flag = 1
-                relay_start_frame = frame_count  # Track when the relay starts
-                # print(f"Relay start at frame {frame_count}")
-            # print(f"shuttle_coords_queue: {shuttle_coords_queue}")
-            if is_shuttle_in_rest(shuttle_coords_queue, 10):
-                rest_state_counter += 1
-                if rest_state_counter >= REST_THRESHOLD:
+            if self.relay_flag == 0 and determine_shooter(self.prev_k_frame.copy()) == 1 and is_consistently_decreasing(self.y_coord_history):
+                self.relay_flag = 1
+                self.relay_start_frame = frame_count  # Track when the relay starts
+            elif self.relay_flag == 0 and determine_shooter(self.prev_k_frame.copy()) == 2 and is_consistently_increasing(self.y_coord_history):
+                self.relay_flag = 1
+                self.relay_start_frame = frame_count  # Track when the relay starts
+
+            if is_shuttle_in_rest(self.shuttle_coords_queue, 10):
+                self.rest_state_counter += 1
+                if self.rest_state_counter >= self.REST_THRESHOLD:
                     is_at_rest = True
-                    rest_coords.append(coord)
-                if is_at_rest and relay_flag == 1:
-                    relay_flag = 0
-                    relay_start_frame = None  # Reset relay start frame
+                    self.rest_coords.append(coord)
+                if is_at_rest and self.relay_flag == 1:
+                    self.relay_flag = 0
+                    self.relay_start_frame = None  # Reset relay start frame
 
             else:
-                rest_state_counter = 0
-
-            speed_history.append(listt[frame_count][0]['speed'])
-            if len(speed_history) > 5:
-                speed_history.pop(0)
-            smoothed_speed = np.mean(speed_history)
-
-            tracking_data[f"{frame_count}"] = {
-              'x_center': coord[0],
-              'y_center': coord[1],
-              'smoothened_speed': smoothed_speed,
-              'is_at_rest': is_at_rest,
-              'relay_active': relay_flag == 1,
+                self.rest_state_counter = 0
+
+            self.speed_history.append(detections[0]['speed'])
+            if len(self.speed_history) > 5:
+                self.speed_history.pop(0)
+            smoothed_speed = np.mean(self.speed_history)
+
+            tracking_record = {
+                'x_center': coord[0],
+                'y_center': coord[1],
+                'smoothened_speed': smoothed_speed,
+                'is_at_rest': is_at_rest,
+                'relay_active': self.relay_flag == 1,
+                'predicted': predicted,
             }
         else:
-            tracking_data[f"{frame_count}"] = {
+            tracking_record = {
                 'x_center': None,
                 'y_center': None,
                 'smoothened_speed': None,
                 'is_at_rest': None,
                 'relay_active': None,
+                'predicted': None,
             }
 
-        grouped_coords = group_similar_coordinates(current_coords, threshold=10)
-        rest_coords = group_similar_coordinates(rest_coords, threshold=10)
-        if rest_coords:
-            rest_coords = [rest_coords[0][0]]
-
-        coord_counter.clear()
-        for coord, count in current_coords:
-            coord_counter[coord] += count
-
-        # Visualization
-
-        dummy = 15
-
-        # for x, y in current_coords:
-        #     cv2.rectangle(frame, (int(x) - dummy, int(y) - dummy),
-        #                   (int(x) + dummy, int(y) + dummy), (0, 255, 0), 2)
-        #
-        #     if str(frame_count) in tracking_data:
-        #         font = cv2.FONT_HERSHEY_SIMPLEX
-        #         speed = tracking_data[str(frame_count)]['smoothened_speed']
-        #         speed_text = f"Speed: {speed:.2f}"
-        #         cv2.putText(frame, speed_text, (int(x) - dummy, int(y) - dummy - 10),
-        #                     font, 0.5, (0, 140, 255), 2)
-
-        # Draw black list rectangles
-        for x, y in black_list:
-            cv2.rectangle(frame, (int(x) - dummy, int(y) - dummy),
-                          (int(x) + dummy, int(y) + dummy), (0, 140, 255), 5)
-            cv2.putText(frame, 'stationary', (int(x) - dummy, int(y) - dummy - 10),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 140, 255), 2)
-
-        # Draw rest state indicator
-        
+        if self.coord_frequency is not None:
+            group_similar_coordinates(current_coords, threshold=10, coord_frequency=self.coord_frequency)
+        # The rest position is the average of the first group of rest coordinates
+        self.rest_coords = group_similar_coordinates(
+            self.rest_coords, threshold=10, coord_frequency=self.coord_frequency if self.coord_frequency is not None else {})
+        if self.rest_coords:
+            self.rest_coords = [self.rest_coords[0][0]]
+
+        # Record what has to be drawn on this frame, the frame itself is not kept so the
+        # caller can stream frames through the tracker (see draw_scoreboard_frame)
+        overlay = {
+            'black_list': self.blacklist.points,
+            'rest': None,
+            'net_text_position': None,
+            'relay_text': None,
+            'score': None,
+        }
+
         if is_at_rest:
-            coordabs = rest_coords[-1]
+            coordabs = self.rest_coords[-1]
             coordabs = (float(coordabs[0]), float(coordabs[1]))
-            if not scored:
-              shuttle_position = is_shuttle_in_court(coordabs, court_coords, net_coords)
-              print(f"Score before assigning: {score}")
-              assign_points(shuttle_position, prev_k_frame.copy())
-              print(f"Score after assigning: {score}")
-              scored = True
-            last_rest_coord = rest_coords[-1]
-            text_position = (int(last_rest_coord[0]), int(last_rest_coord[1]) - 30)
-            cv2.putText(frame, f'Shuttle is at rest: {shuttle_position}', text_position, cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 0), 4)
-            cv2.putText(frame, f'Shuttle is at rest: {shuttle_position}', text_position, cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+            if not self.scored:
+                self.shuttle_position = self.court_geometry.court_side(coordabs)
+                print(f"Score before assigning: {self.score}")
+                assign_points(self.shuttle_position, self.prev_k_frame.copy(), self.score)
+                print(f"Score after assigning: {self.score}")
+                self.scored = True
+            last_rest_coord = self.rest_coords[-1]
+            self.text_position = (int(last_rest_coord[0]), int(last_rest_coord[1]) - 30)
+            overlay['rest'] = (self.text_position, self.shuttle_position)
             if check_shuttle_in_net_rectangle(coordabs, court_coords[2], court_coords[3], above=30, below=50):
-                net_ke_pas = True
-                net_frame = frame_count
-                
-        if net_ke_pas:
-            text_position = (text_position[0], text_position[1] + 90)
-            cv2.putText(frame, 'Shuttle hit the net net net net net', text_position, cv2.FONT_HERSHEY_SIMPLEX, 1.5, (255, 255, 255), 2)
-            if frame_count >= (net_frame + 20):
-                net_ke_pas = False
-        
+                self.net_ke_pas = True
+                self.net_frame = frame_count
+
+        if self.net_ke_pas:
+            self.text_position = (self.text_position[0], self.text_position[1] + 90)
+            overlay['net_text_position'] = self.text_position
+            if frame_count >= (self.net_frame + 20):
+                self.net_ke_pas = False
+
         # Calculate relay time
-        if relay_flag == 1 and relay_start_frame is not None:
-            relay_duration = frame_count - relay_start_frame
+        if self.relay_flag == 1 and self.relay_start_frame is not None:
+            relay_duration = frame_count - self.relay_start_frame
             relay_text = f"Relay Time: {relay_duration} frames"
         else:
             relay_text = "Relay Inactive"
 
-        cv2.putText(frame, relay_text, (50, 100), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
-
-        # Position for score[1] (Player 2's score) at the top-left corner
-        top_left_position = (50, 50)  # (x, y) coordinates for top-left corner
+        overlay['relay_text'] = relay_text
+        overlay['score'] = (self.score[0], self.score[1])
 
-        # Position for score[0] (Player 1's score) at the bottom-left corner
-        bottom_left_position = (50, frame_height - 50)  # (x, y) coordinates for bottom-left corner
+        self.frame_count += 1
 
-        # Draw Player 2's score (top-left)
-        cv2.putText(frame, f"Player 2: {score[1]}", top_left_position, cv2.FONT_HERSHEY_SIMPLEX, 2, (255, 255, 255), 5)
+        return overlay, tracking_record, {'Player 1': self.score[0], 'Player 2': self.score[1]}
 
-        # Draw Player 1's score (bottom-left)
-        cv2.putText(frame, f"Player 1: {score[0]}", bottom_left_position, cv2.FONT_HERSHEY_SIMPLEX, 2, (255, 255, 255), 5)
-
-        points[f"{frame_count}"] = {
-            'Player 1': score[0],
-            'Player 2': score[1]
-        }
-
-        # prev_k_frame.append(coord)
-        frame_count += 1
 
+def save_rally_results(points, tracking_data):
     with open('result/scoring/score.json', 'w') as json_file:
         json.dump(points, json_file, indent=4)
 
     with open('result/shuttle_data/shuttle_data.json', 'w') as json_file:
         json.dump(tracking_data, json_file, indent=4)
-        
-    score = [0,0]
+
+
+def track_rally(candidates, fps, find_black_list, black_list, stationary_detector=None, court_geometry=None):
+    """
+    Rally and score state machine over the detections of detect_shuttle_candidates.
+    Returns the black listed points when find_black_list is set, otherwise the per-frame
+    scoreboard records and the shuttle tracking data.
+
+    With a StationaryObjectDetector, the black list is maintained online from the detections
+    as the frames go by instead of being fixed by black_list. court_geometry defaults to the
+    court in coordinates.json. Use RallyTracker directly to process a match in chunks.
+    """
+    rally = RallyTracker(fps, black_list, stationary_detector, court_geometry, count_coordinates=find_black_list)
+    scoreboard, tracking_data, points = rally.process(candidates)
+    save_rally_results(points, tracking_data)
+
     if find_black_list:
-        stationary_coords = identify_stationary_objects()
-        # print("Stationary coordinates detected:")
-        # print(stationary_coords)
-        final = []
-        for cod, freq in stationary_coords:
-            final.append(cod)
-        
+        stationary_coords = identify_stationary_objects(coord_frequency=rally.coord_frequency)
+        final = [cod for cod, freq in stationary_coords]
         print(f"black_listed points: {final}")
-        global_coord_frequency = {}
-        stationary_coords = []
         return final
-    
-    global_coord_frequency = {}
-    stationary_coords = []
-    return frames, tracking_data
+
+    return scoreboard, tracking_data
+
+def draw_scoreboard(frames, scoreboard):
+    output_frames = []
+    for frame, overlay in zip(frames, scoreboard):
+        output_frames.append(draw_scoreboard_frame(frame, overlay))
+
+    return output_frames
+
+
+def draw_scoreboard_frame(frame, overlay):
+    """
+    Draws the per-frame record produced by real_time_detection_and_tracking: stationary
+    (black listed) objects, rest / net indicators, relay time and the score.
+    """
+    return draw_annotations(frame, scoreboard_annotations(overlay, frame.shape[0]))
+
+
+def scoreboard_annotations(overlay, frame_height):
+    """
+    Annotation records of draw_scoreboard_frame for one frame of the scoreboard.
+    """
+    dummy = 15
+    records = []
+
+    # Black list rectangles
+    for x, y in overlay['black_list']:
+        records.append(Rect((int(x) - dummy, int(y) - dummy), (int(x) + dummy, int(y) + dummy), (0, 140, 255), 5))
+        records.append(Text('stationary', (int(x) - dummy, int(y) - dummy - 10), 0.5, (0, 140, 255), 2))
+
+    # Rest state indicator
+    if overlay['rest'] is not None:
+        text_position, shuttle_position = overlay['rest']
+        records.append(Text(f'Shuttle is at rest: {shuttle_position}', text_position, 0.7, (0, 0, 0), 4))
+        records.append(Text(f'Shuttle is at rest: {shuttle_position}', text_position, 0.7, (255, 255, 255), 2))
+
+    if overlay['net_text_position'] is not None:
+        records.append(Text('Shuttle hit the net net net net net', overlay['net_text_position'], 1.5, (255, 255, 255), 2))
+
+    records.append(Text(overlay['relay_text'], (50, 100), 1, (0, 255, 0), 2))
+
+    # Position for score[1] (Player 2's score) at the top-left corner
+    top_left_position = (50, 50)  # (x, y) coordinates for top-left corner
+
+    # Position for score[0] (Player 1's score) at the bottom-left corner
+    bottom_left_position = (50, frame_height - 50)  # (x, y) coordinates for bottom-left corner
+
+    player1_score, player2_score = overlay['score']
+    records.append(Text(f"Player 2: {player2_score}", top_left_position, 2, (255, 255, 255), 5))
+    records.append(Text(f"Player 1: {player1_score}", bottom_left_position, 2, (255, 255, 255), 5))
+
+    return records
 
 def draw_shuttle_predictions(frames, tracking_data):
     output_frames = []
@@ -715,51 +1141,87 @@ def draw_shuttle_predictions(frames, tracking_data):
 
 
 def draw_shuttle_predictions_frame(frame, tracking_data, i):
-    dummy = 15
+    return draw_annotations(frame, shuttle_annotations(tracking_data, i))
 
-    if i in tracking_data:
-        x = tracking_data[i]['x_center']
-        y = tracking_data[i]['y_center']
-        if np.isnan(x) or np.isnan(y):
-            return frame  
-        speed = tracking_data[i]['smoothened_speed']
 
-        # print("lol")
-        # print(x, y)
-        cv2.rectangle(frame, (int(x) - dummy, int(y) - dummy),
-                      (int(x) + dummy, int(y) + dummy), (0, 255, 0), 2)
-
-        speed_text = f"Speed: {speed:.2f}"
-        cv2.putText(frame, speed_text, (int(x) - dummy, int(y) - dummy - 10),
-                    cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 140, 255), 3)
-
-    return frame
-
-def interpolate_shuttle_tracking(tracking_data):
-    # with open(json_path, 'r') as file:
-    #     tracking_data = json.load(file)
+def shuttle_annotations(tracking_data, i):
+    """
+    Annotation records of the shuttle box and speed of frame i, none when the shuttle
+    is not known in that frame.
+    """
+    dummy = 15
 
-    # Extract the x and y coordinates for each frame from the JSON data
-    shuttle_coordinates_frames = [
-        (frame_data['x_center'], frame_data['y_center'], frame_data['smoothened_speed'])
-        for frame_data in tracking_data.values()
+    if i not in tracking_data:
+        return []
+    x = tracking_data[i]['x_center']
+    y = tracking_data[i]['y_center']
+    if np.isnan(x) or np.isnan(y):
+        return []
+    speed = tracking_data[i]['smoothened_speed']
+
+    speed_text = f"Speed: {speed:.2f}"
+    return [
+        Rect((int(x) - dummy, int(y) - dummy), (int(x) + dummy, int(y) + dummy), (0, 255, 0), 2),
+        Text(speed_text, (int(x) - dummy, int(y) - dummy - 10), 1, (0, 140, 255), 3),
     ]
 
-    # Convert the coordinates into a pandas DataFrame
-    df_shuttle_positions = pd.DataFrame(shuttle_coordinates_frames, columns=['x_center', 'y_center', 'smoothened_speed'])
-
-    # Convert columns to numeric type
-    for col in df_shuttle_positions.columns:
-        df_shuttle_positions[col] = pd.to_numeric(df_shuttle_positions[col], errors='coerce')
-
-    # Interpolate missing values
-    df_shuttle_positions = df_shuttle_positions.interpolate(method='linear')
-
-    # Fill any remaining NaN values (at the start or end) with the nearest valid value
-    df_shuttle_positions = df_shuttle_positions.bfill().ffill()
-
-    # Convert the DataFrame back to a dictionary
-    tracking_data = df_shuttle_positions.to_dict(orient='index')
+def smooth_shuttle_trajectory(z, fps, court_geometry, std_a=3000.0, std_meas=3.0, max_gap=None):
+    """
+    RTS smoothed (x, y, speed) arrays of an (n, 2) array of shuttle positions, NaN where
+    unmeasured. The trajectory is split at gaps of more than max_gap unmeasured frames (half a
+    second by default) and every run is smoothed on its own; the frames of a longer gap are
+    interpolated linearly between the ends of the runs around it, and before the first and
+    after the last run the nearest value is kept. All NaN when nothing was measured.
+    """
+    if max_gap is None:
+        max_gap = max(1, int(fps) // 2)
+
+    x = np.full(len(z), np.nan)
+    y = np.full(len(z), np.nan)
+    speed = np.full(len(z), np.nan)
+    measured = np.flatnonzero(~np.isnan(z).any(axis=1))
+    if not len(measured):
+        return x, y, speed
+
+    # The motion model is not trusted over long gaps, e.g. the shuttle at rest between rallies
+    breaks = np.flatnonzero(np.diff(measured) > max_gap + 1)
+    starts = np.concatenate(([measured[0]], measured[breaks + 1]))
+    ends = np.concatenate((measured[breaks], [measured[-1]]))
+    for start, end in zip(starts, ends):
+        states = rts_smooth(z[start:end + 1], fps, std_a=std_a, std_x=std_meas, std_y=std_meas)
+        x[start:end + 1] = states[:, 0]
+        y[start:end + 1] = states[:, 3]
+        speed[start:end + 1] = np.hypot(states[:, 1] * court_geometry.width_scale,
+                                        states[:, 4] * court_geometry.height_scale)
+
+    # Linear between the runs, the nearest value outside them (like interpolate + bfill/ffill)
+    frames = np.arange(len(z))
+    smoothed = ~np.isnan(x)
+    return (np.interp(frames, frames[smoothed], x[smoothed]), np.interp(frames, frames[smoothed], y[smoothed]),
+            np.interp(frames, frames[smoothed], speed[smoothed]))
+
+
+def interpolate_shuttle_tracking(tracking_data, fps=30, court_geometry=None, std_a=3000.0, std_meas=3.0,
+                                 max_gap=None):
+    """
+    Smooths the shuttle trajectory of tracking_data and fills the frames without a position
+    with smooth_shuttle_trajectory, an offline Kalman (RTS) smoother of the constant acceleration
+    model run between the gaps of more than max_gap frames. Frames where the tracker only
+    predicted the shuttle count as unmeasured. The speed is that of the smoothed velocity, in
+    the units of calculate_speed.
+    """
+    if court_geometry is None:
+        court_geometry = load_court_geometry()
+
+    records = list(tracking_data.values())
+    z = np.array([(np.nan, np.nan) if record['x_center'] is None or record.get('predicted')
+                  else (record['x_center'], record['y_center']) for record in records], dtype=np.float64)
+    x, y, speed = smooth_shuttle_trajectory(z.reshape(-1, 2), fps, court_geometry, std_a, std_meas, max_gap)
+
+    tracking_data = {
+        frame_num: {'x_center': x_center, 'y_center': y_center, 'smoothened_speed': frame_speed}
+        for frame_num, (x_center, y_center, frame_speed) in enumerate(zip(x.tolist(), y.tolist(), speed.tolist()))
+    }
 
     # Save the interpolated data to a JSON file
     with open('result/shuttle_data/shuttle_data.json', 'w') as json_file:
@@ -0,0 +1,163 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import lap
+import numpy as np
+
+from utils import FrameSource, PlayerDetectionStore, box_iou
+
+
+def plan_segments(total_frames, segment_size, overlap):
+    """
+    Splits the video into segments of segment_size frames. Every segment but the first is
+    decoded from `overlap` frames before its start, so its tracker is warmed up by the time
+    it reaches its own frames and the tracks of both segments can be matched on the frames
+    they share. Returns (decode_start, start, end) per segment; the last one has end None
+    and runs to the end of the video, as the container frame count can be off.
+    """
+    starts = list(range(0, max(total_frames, 1), segment_size))
+    segments = []
+    for i, start in enumerate(starts):
+        end = starts[i + 1] if i + 1 < len(starts) else None
+        segments.append((max(0, start - overlap), start, end))
+    return segments
+
+
+def _init_worker(threads):
+    # Split the cores between the workers instead of every model using all of them
+    import cv2
+    import torch
+    torch.set_num_threads(threads)
+    cv2.setNumThreads(1)
+
+
+def segment_frames(video_path, decode_start, end):
+    # The frames of a segment, overlap included. FrameSource starts on exactly decode_start,
+    # so the overlap lines up with the end of the previous segment and with the render pass
+    return FrameSource(video_path, start_frame=decode_start, max_frames=None if end is None else end - decode_start)
+
+
+def _detect_segment(tracker_cls, model_path, batch_size, video_path, decode_start, end):
+    # Runs in a worker process. The model is loaded once per worker by the model registry,
+    # and every segment starts with fresh tracks
+    tracker = tracker_cls(model_path, batch_size=batch_size)
+    return tracker.detect_frames(segment_frames(video_path, decode_start, end))
+
+
+def match_tracks(previous, current, min_iou=0.3):
+    """
+    Matches the tracks of two stores covering the same frames (the overlap of two segments)
+    with the Hungarian algorithm. Two tracks are scored by the IoU of their boxes summed
+    over the frames, divided by the number of frames of the longer of the two, so tracks
+    that only meet briefly score low. Returns {current track id: previous track id} for the
+    pairs scoring at least min_iou.
+    """
+    previous_ids = np.unique(previous.track_id)
+    current_ids = np.unique(current.track_id)
+    if len(previous_ids) == 0 or len(current_ids) == 0:
+        return {}
+
+    overlap_sum = np.zeros((len(previous_ids), len(current_ids)))
+    for frame_num in range(min(len(previous), len(current))):
+        a = slice(previous.offsets[frame_num], previous.offsets[frame_num + 1])
+        b = slice(current.offsets[frame_num], current.offsets[frame_num + 1])
+        if a.start == a.stop or b.start == b.stop:
+            continue
+        rows = np.searchsorted(previous_ids, previous.track_id[a])
+        columns = np.searchsorted(current_ids, current.track_id[b])
+        np.add.at(overlap_sum, (rows[:, None], columns[None, :]), box_iou(previous.boxes[a], current.boxes[b]))
+
+    previous_frames = np.bincount(np.searchsorted(previous_ids, previous.track_id), minlength=len(previous_ids))
+    current_frames = np.bincount(np.searchsorted(current_ids, current.track_id), minlength=len(current_ids))
+    score = overlap_sum / np.maximum(previous_frames[:, None], current_frames[None, :])
+
+    _, assigned, _ = lap.lapjv(1 - score, extend_cost=True, cost_limit=1 - min_iou)
+    return {int(current_ids[column]): int(previous_ids[row])
+            for row, column in enumerate(assigned) if column >= 0 and score[row, column] >= min_iou}
+
+
+def stitch_segments(segments, min_iou=0.3):
+    """
+    Joins the stores of consecutive segments into one store with track ids that are
+    consistent across segment boundaries. segments is a list of (store, head) where the
+    first head frames of a store are the overlap with the end of the previous segment;
+    they are only used to match the tracks and are then dropped.
+
+    A track that cannot be matched gets a new id. Ids are numbered from 1 in the order the
+    tracks first appear.
+    """
+    parts = []
+    previous_map = {}
+    next_id = 1
+    previous_store = None
+    for store, head in segments:
+        matches = {}
+        if previous_store is not None and head:
+            head = min(head, len(store), len(previous_store))
+            matches = match_tracks(previous_store.slice(len(previous_store) - head, len(previous_store)),
+                                   store.slice(0, head), min_iou)
+
+        part = store.slice(head, len(store))
+        id_map = {}
+        # Tracks in order of first appearance in this segment
+        local_ids, first_rows = np.unique(part.track_id, return_index=True)
+        for local_id in local_ids[np.argsort(first_rows)].tolist():
+            if local_id in matches and matches[local_id] in previous_map:
+                id_map[local_id] = previous_map[matches[local_id]]
+            else:
+                id_map[local_id] = next_id
+                next_id += 1
+        # A matched track only seen in the overlap keeps its id for the next segment to match
+        for local_id, previous_id in matches.items():
+            if local_id not in id_map and previous_id in previous_map:
+                id_map[local_id] = previous_map[previous_id]
+
+        if len(part.track_id):
+            part.track_id = np.array([id_map[local_id] for local_id in part.track_id.tolist()], dtype=np.int32)
+        parts.append(part)
+        previous_map = id_map
+        previous_store = store
+
+    return PlayerDetectionStore.concatenate(parts)
+
+
+def detect_players_parallel(video_path, tracker_cls, model_path, workers=None, segment_size=1800, overlap=30,
+                            batch_size=8, checkpoints=None, min_iou=0.3):
+    """
+    Player detection of a whole video on several processes: the video is split into
+    overlapping segments (see plan_segments), each worker process loads its own model and
+    tracks whole segments, and the track ids are stitched across the segment boundaries
+    on the overlapping frames (see stitch_segments).
+
+    tracker_cls is PlayerTracker or Doubles_Tracking. With ChunkCheckpoints, every finished
+    segment is saved and the segments that are already there are not detected again.
+    """
+    workers = workers or os.cpu_count()
+    segments = plan_segments(FrameSource(video_path).total_frames, segment_size, overlap)
+
+    results = [checkpoints.load(i) if checkpoints is not None else None for i in range(len(segments))]
+    pending = [i for i, result in enumerate(results) if result is None]
+    if len(pending) < len(segments):
+        print(f"{len(segments) - len(pending)} of {len(segments)} player segments loaded from checkpoints")
+
+    if pending:
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        # spawn rather than fork: the parent already runs decoder threads and may hold CUDA
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=min(workers, len(pending)), mp_context=context,
+                                 initializer=_init_worker, initargs=(threads,)) as pool:
+            futures = {}
+            for i in pending:
+                decode_start, _, end = segments[i]
+                futures[pool.submit(_detect_segment, tracker_cls, model_path, batch_size, video_path,
+                                    decode_start, end)] = i
+            for future in as_completed(futures):
+                i = futures[future]
+                results[i] = future.result()
+                if checkpoints is not None:
+                    checkpoints.save(i, results[i])
+                print(f"Detected players in segment {i + 1} of {len(segments)}")
+
+    return stitch_segments([(result, start - decode_start) for result, (decode_start, start, _) in zip(results, segments)],
+                           min_iou)
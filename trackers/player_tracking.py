@@ -1,150 +1,172 @@
 import json
 import os
-from ultralytics import YOLO
 import cv2
-import pickle as pkl
+import numpy as np
+from utils import batch_frames, get_model, reset_tracking, load_court_geometry, PlayerDetectionStore
+from utils import draw_annotations, labelled_box
 
-with open('result/court_and_net/courts/court_kp/coordinates.json', 'r') as f:
-    data = json.load(f)
 
-court_coord = data["court_info"]
-net_coord = data["net_info"]
+# (track_ids, class_ids, boxes, confs) of a frame without players
+NO_PLAYERS = (np.empty(0, dtype=np.int64), np.empty(0), np.empty((0, 4), dtype=np.float32), np.empty(0, dtype=np.float32))
 
-class PlayerTracker:
-    def __init__(self, model_path):
-        self.model = YOLO(model_path)
-
-    # Detect players in multiple frames
-    def detect_frames(self, frames, read_from_record=False, record_path=None):
-        detected_players = []
 
-        # read the data from the pkl file if read_from_record is True
+class PlayerTracker:
+    """
+    Detects and tracks the players with a YOLO model, batch_size frames per model.track
+    call (persist=True, so the tracker still advances frame by frame and in order).
+    Doubles_Tracking reuses all of it and only changes which detections are players, how
+    they are keyed and how they are labelled.
+    """
+    # Per-frame player dictionaries are keyed by class id (one player per class)
+    key_by = 'class'
+
+    def __init__(self, model_path, batch_size=1, court_geometry=None):
+        self.model_path = model_path
+        self._model = None
+        self.batch_size = batch_size
+        # Court keypoints of the current video, read from coordinates.json when not given
+        self.court_geometry = court_geometry
+
+    @property
+    def model(self):
+        # Loaded on first use, so nothing is loaded when the detections come from a cache.
+        # Shared with any other tracker using the same weights, but the tracks start fresh
+        if self._model is None:
+            self._model = get_model(self.model_path)
+            reset_tracking(self._model)
+        return self._model
+
+    def get_court_geometry(self):
+        if self.court_geometry is None:
+            return load_court_geometry()
+        return self.court_geometry
+
+    # Detect players in multiple frames, returns a PlayerDetectionStore
+    def detect_frames(self, frames, read_from_record=False, record_path=None, batch_size=None, plan=None):
+        batch_size = batch_size or self.batch_size
+
+        # read the data from the record file if read_from_record is True
         if read_from_record and record_path is not None:
-            with open(record_path, 'rb') as f:
-                detected_players = pkl.load(f)
-            return detected_players
-
-
-        for frame in frames:
-            detected_players.append(self.detect_frame(frame))
-
-        # keep the record of detected players in a pkl file to reduce pre-processing
+            return PlayerDetectionStore.load(record_path, key_by=self.key_by)
+
+        # With a DetectionPlan only the frames it selects go through the model
+        detected = []
+
+        def selected_frames():
+            for i, frame in enumerate(frames):
+                detected.append(plan is None or plan.wait(i))
+                if detected[-1]:
+                    yield frame
+
+        found = []
+        for batch in batch_frames(selected_frames(), batch_size):
+            found.extend(self.detect_batch_rows(batch))
+
+        # A skipped frame keeps the players of the last detected frame
+        frame_rows = []
+        found = iter(found)
+        rows = NO_PLAYERS
+        for is_detected in detected:
+            if is_detected:
+                rows = next(found)
+            frame_rows.append(rows)
+        detected_players = PlayerDetectionStore.from_frame_rows(frame_rows, key_by=self.key_by)
+
+        # keep the record of detected players to reduce pre-processing
         if record_path is not None:
-            os.makedirs(os.path.dirname(record_path), exist_ok=True)
-            with open(record_path, 'wb+') as f:
-                pkl.dump(detected_players, f)
+            detected_players.save(record_path)
 
         return detected_players
 
     # Detect players in a single frame
     def detect_frame(self, frame):
-        results = self.model.track(frame, persist=True)[0]
-        id_name = results.names
+        return self.detect_batch([frame])[0]
 
-        player_dict = {}
+    # Detect players in consecutive frames with one model call, the tracker still
+    # advances through the frames one by one and in order
+    def detect_batch(self, frames):
+        return [self.get_player_dict(result) for result in self.model.track(frames, persist=True)]
 
-        if results.boxes is None:
-            return player_dict
+    # Same as detect_batch, as (track_ids, class_ids, boxes, confs) arrays per frame
+    def detect_batch_rows(self, frames):
+        return [self.get_player_rows(result) for result in self.model.track(frames, persist=True)]
 
-        for box in results.boxes:
-            if box.id is not None:
-                track_id = int(box.id.tolist()[0])
-                result = box.xyxy.tolist()[0]
-                object_class_id = box.cls.tolist()[0]
+    # Convert the tracking result of one frame into arrays of tracked detections
+    def get_player_rows(self, results):
+        boxes = results.boxes
+        if boxes is None or boxes.id is None:
+            return NO_PLAYERS
 
-                player_dict[object_class_id] = {
-                    'coordinates': result,
-                    'class_id': track_id
-                }
+        return (boxes.id.cpu().numpy().astype(np.int64), boxes.cls.cpu().numpy().astype(np.float64),
+                boxes.xyxy.cpu().numpy(), boxes.conf.cpu().numpy())
 
-        return player_dict
+    # Convert the tracking result of one frame into the player dictionary
+    def get_player_dict(self, results):
+        return PlayerDetectionStore.from_frame_rows([self.get_player_rows(results)], key_by=self.key_by)[0]
 
     # Draw boxes around detected players
     def draw_boxes(self, frames, detected_players):
         output_frames = []
 
         for frame, player_dict in zip(frames, detected_players):
-            for track_id, data in player_dict.items():
-                result = data['coordinates']
-                x1, y1, x2, y2 = map(int, result)
-
-                if track_id == 0:
-                    box_color = (0, 0, 255)
-                    text_color = (36, 255, 12)
-                    box_thickness = 3
-                    text_thickness = 3
-                    font_scale = 1
-
-                    cv2.rectangle(frame, (x1, y1), (x2, y2), box_color, box_thickness)
-
-                    text = f"Player 1"
-                    text_size, _ = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, font_scale, text_thickness)
-                    text_w, text_h = text_size
-                    cv2.rectangle(frame, (x1, y1 - text_h - 10), (x1 + text_w, y1), box_color, cv2.FILLED)
-                    cv2.putText(frame, text, (x1, y1 - 5), cv2.FONT_HERSHEY_SIMPLEX, font_scale, text_color, text_thickness)
-
-                else:
-
-                    box_color = (255, 0, 0)
-                    text_color = (36, 255, 12)
-                    box_thickness = 3
-                    text_thickness = 3
-                    font_scale = 1
-
-                    cv2.rectangle(frame, (x1, y1), (x2, y2), box_color, box_thickness)
-
-                    text = f"Player 2"
-                    text_size, _ = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, font_scale, text_thickness)
-                    text_w, text_h = text_size
-                    cv2.rectangle(frame, (x1, y1 - text_h - 10), (x1 + text_w, y1), box_color, cv2.FILLED)
-                    cv2.putText(frame, text, (x1, y1 - 5), cv2.FONT_HERSHEY_SIMPLEX, font_scale, text_color, text_thickness)
-
-                # if y1 < court_coord[2][1]:
-                #
-                #     box_color = (0, 0, 255)
-                #     text_color = (36, 255, 12)
-                #     box_thickness = 3
-                #     text_thickness = 3
-                #     font_scale = 1
-                #
-                #     cv2.rectangle(frame, (x1, y1), (x2, y2), box_color, box_thickness)
-                #
-                #     text = f"Player 2"
-                #     text_size, _ = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, font_scale, text_thickness)
-                #     text_w, text_h = text_size
-                #     cv2.rectangle(frame, (x1, y1 - text_h - 10), (x1 + text_w, y1), box_color, cv2.FILLED)
-                #     cv2.putText(frame, text, (x1, y1 - 5), cv2.FONT_HERSHEY_SIMPLEX, font_scale, text_color, text_thickness)
-                #
-                # else:
-                #     box_color = (255, 0, 0)
-                #     text_color = (36, 255, 12)
-                #     box_thickness = 3
-                #     text_thickness = 3
-                #     font_scale = 1
-                #
-                #     cv2.rectangle(frame, (x1, y1), (x2, y2), box_color, box_thickness)
-                #
-                #     text = f"Player 1"
-                #     text_size, _ = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, font_scale, text_thickness)
-                #     text_w, text_h = text_size
-                #     cv2.rectangle(frame, (x1, y1 - text_h - 10), (x1 + text_w, y1), box_color, cv2.FILLED)
-                #     cv2.putText(frame, text, (x1, y1 - 5), cv2.FONT_HERSHEY_SIMPLEX, font_scale, text_color, text_thickness)
-
-            output_frames.append(frame)
+            output_frames.append(self.draw_boxes_frame(frame, player_dict))
 
         return output_frames
 
+    # Draw boxes around the players detected in a single frame
+    def draw_boxes_frame(self, frame, player_dict):
+        return draw_annotations(frame, self.box_annotations(player_dict))
+
+    # Annotation records of the player boxes of a single frame
+    def box_annotations(self, player_dict):
+        records = []
+        for track_id, data in player_dict.items():
+            if track_id == 0:
+                records.extend(labelled_box(data['coordinates'], "Player 1", (0, 0, 255)))
+            else:
+                records.extend(labelled_box(data['coordinates'], "Player 2", (255, 0, 0)))
+
+            # if y1 < court_coord[2][1]:
+            #
+            #     box_color = (0, 0, 255)
+            #     text_color = (36, 255, 12)
+            #     box_thickness = 3
+            #     text_thickness = 3
+            #     font_scale = 1
+            #
+            #     cv2.rectangle(frame, (x1, y1), (x2, y2), box_color, box_thickness)
+            #
+            #     text = f"Player 2"
+            #     text_size, _ = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, font_scale, text_thickness)
+            #     text_w, text_h = text_size
+            #     cv2.rectangle(frame, (x1, y1 - text_h - 10), (x1 + text_w, y1), box_color, cv2.FILLED)
+            #     cv2.putText(frame, text, (x1, y1 - 5), cv2.FONT_HERSHEY_SIMPLEX, font_scale, text_color, text_thickness)
+            #
+            # else:
+            #     box_color = (255, 0, 0)
+            #     text_color = (36, 255, 12)
+            #     box_thickness = 3
+            #     text_thickness = 3
+            #     font_scale = 1
+            #
+            #     cv2.rectangle(frame, (x1, y1), (x2, y2), box_color, box_thickness)
+            #
+            #     text = f"Player 1"
+            #     text_size, _ = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, font_scale, text_thickness)
+            #     text_w, text_h = text_size
+            #     cv2.rectangle(frame, (x1, y1 - text_h - 10), (x1 + text_w, y1), box_color, cv2.FILLED)
+            #     cv2.putText(frame, text, (x1, y1 - 5), cv2.FONT_HERSHEY_SIMPLEX, font_scale, text_color, text_thickness)
+
+        return records
+
     # Save player data to a JSON file
     def save_player_data(self, detected_players, file_path):
         os.makedirs(os.path.dirname(file_path), exist_ok=True)
 
-        all_data = []
-
-        for player_dict in detected_players:
-            frame_data = {}
-            for track_id, data in player_dict.items():
-                frame_data[track_id] = data
-            all_data.append(frame_data)
+        if isinstance(detected_players, PlayerDetectionStore):
+            all_data = detected_players.to_frames()
+        else:
+            all_data = [dict(player_dict) for player_dict in detected_players]
 
         with open(file_path, 'w') as f:
             json.dump(all_data, f, indent=4)
\ No newline at end of file
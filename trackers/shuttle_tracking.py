@@ -1,13 +1,15 @@
 import json
 import os
-from ultralytics import YOLO
 import cv2
 import pickle as pkl
+from utils import get_model, reset_tracking
 
 
 class ShuttleTracker:
     def __init__(self, model_path):
-        self.model = YOLO(model_path)
+        # Shared with any other tracker using the same weights, but the tracks start fresh
+        self.model = get_model(model_path)
+        reset_tracking(self.model)
 
     # Detect shuttle in multiple frames
     def detect_frames(self, frames, read_from_record=False, record_path=None):
@@ -17,18 +17,15 @@ from numpy.linalg import inv
 import numpy as np
 import math
 import cv2
-import torch
 
 from matplotlib import pyplot as plt
 
-import torch
-from ultralytics import YOLO
+from utils import get_model, default_device
 
-model = YOLO('../models/shuttle_detection/weights/best.pt')
+# Paths are relative to the repository root, run it from there:
+#   python -m trackers.shuttle_tracking_2
+SHUTTLE_MODEL_PATH = 'models/shuttle_detection/weights/best.pt'
 
-# Ensure to use the GPU if available
-device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-model.to(device)
 
 def draw_prediction(img: np.ndarray,
                     class_name: str,
@@ -63,25 +60,7 @@ def convert_video_to_frame(path: str):
 
     cap.release()
     return img, fps
-# Converting Video to image frame by frame for a single and multiple ball
-
-img_multi, fps_multi = convert_video_to_frame('../utils/footages/10sec.mp4')
-#img_sin,# fps_sin = convert_video_to_frame('/content/drive/MyDrive/ass.mp4')
-results_multi = model(img_multi)
-print(results_multi)
-# Assuming the list contains results in a format compatible with pandas conversion
-df_multi_list = []
-for res in results_multi:
-    boxes = res.boxes.xyxy.cpu().numpy()  # Get the bounding boxes
-    class_ids = res.boxes.cls.cpu().int().numpy()  # Get the class IDs
-    scores = res.boxes.conf.cpu().numpy()  # Get the confidence scores
-
-    # Create a DataFrame from the detection results
-    df = pd.DataFrame({'xmin': boxes[:, 0], 'ymin': boxes[:, 1], 'xmax': boxes[:, 2], 'ymax': boxes[:, 3], 'class_id': class_ids, 'confidence': scores})
-    df_multi_list.append(df)
-
-# Concatenate the DataFrames into a single DataFrame
-df_multi = pd.concat(df_multi_list, ignore_index=True)
+
 
 class KalmanFilter():
     def __init__(self,
@@ -190,14 +169,6 @@ class KalmanFilter():
         self.P_hist.append(self.P)
 
 
-
-filter_multi = [
-    KalmanFilter(fps=fps_multi, xinit=60, yinit=150,
-                 std_x=0.000025, std_y=0.0001),
-    KalmanFilter(fps=fps_multi, xinit=620, yinit=150,
-                 std_x=0.000025, std_y=0.0001)
-]
-
 def cost_fun(a, b):
     '''
     Cost function for filter Assignment
@@ -209,66 +180,98 @@ def cost_fun(a, b):
         sm += (a[i] - b[i])**2
     return sm
 
-ind = 0
-out = cv2.VideoWriter('garbage/multiple_balls_kalman.mp4', cv2.VideoWriter_fourcc(*'mp4v'), fps_multi,
-                      (img_multi[0].shape[1], img_multi[0].shape[0]))
-
-assig = []
-for _, row in df_multi.iterrows():
-    coord = [(row['xmin'] + row['xmax']) / 2,
-             (row['ymin'] + row['ymax']) / 2]
 
-    # Determine which filter to use
-    cost0 = cost_fun([filter_multi[0].S_hist[-1][0], filter_multi[0].S_hist[-1][3]], coord)
-    cost1 = cost_fun([filter_multi[1].S_hist[-1][0], filter_multi[1].S_hist[-1][3]], coord)
+def track_two_shuttles(video_path='utils/footages/10sec.mp4', output_path='trackers/garbage/multiple_balls_kalman.mp4'):
+    # The model is resolved here, so importing the module never loads the weights
+    model = get_model(SHUTTLE_MODEL_PATH, device=default_device())
+
+    # Converting Video to image frame by frame for a single and multiple ball
+    img_multi, fps_multi = convert_video_to_frame(video_path)
+    #img_sin,# fps_sin = convert_video_to_frame('/content/drive/MyDrive/ass.mp4')
+    results_multi = model(img_multi)
+    print(results_multi)
+    # Assuming the list contains results in a format compatible with pandas conversion
+    df_multi_list = []
+    for res in results_multi:
+        boxes = res.boxes.xyxy.cpu().numpy()  # Get the bounding boxes
+        class_ids = res.boxes.cls.cpu().int().numpy()  # Get the class IDs
+        scores = res.boxes.conf.cpu().numpy()  # Get the confidence scores
+
+        # Create a DataFrame from the detection results
+        df = pd.DataFrame({'xmin': boxes[:, 0], 'ymin': boxes[:, 1], 'xmax': boxes[:, 2], 'ymax': boxes[:, 3], 'class_id': class_ids, 'confidence': scores})
+        df_multi_list.append(df)
+
+    # Concatenate the DataFrames into a single DataFrame
+    df_multi = pd.concat(df_multi_list, ignore_index=True)
+
+    filter_multi = [
+        KalmanFilter(fps=fps_multi, xinit=60, yinit=150,
+                     std_x=0.000025, std_y=0.0001),
+        KalmanFilter(fps=fps_multi, xinit=620, yinit=150,
+                     std_x=0.000025, std_y=0.0001)
+    ]
+
+    ind = 0
+    out = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*'mp4v'), fps_multi,
+                          (img_multi[0].shape[1], img_multi[0].shape[0]))
+
+    assig = []
+    for _, row in df_multi.iterrows():
+        coord = [(row['xmin'] + row['xmax']) / 2,
+                 (row['ymin'] + row['ymax']) / 2]
+
+        # Determine which filter to use
+        cost0 = cost_fun([filter_multi[0].S_hist[-1][0], filter_multi[0].S_hist[-1][3]], coord)
+        cost1 = cost_fun([filter_multi[1].S_hist[-1][0], filter_multi[1].S_hist[-1][3]], coord)
+
+        if cost0 < cost1:
+            x_cen, y_cen = coord[0], coord[1]
+            assig.append(0)
+        else:
+            x_cen, y_cen = coord[0], coord[1]
+            assig.append(1)
 
-    if cost0 < cost1:
-        x_cen, y_cen = coord[0], coord[1]
-        assig.append(0)
-    else:
-        x_cen, y_cen = coord[0], coord[1]
-        assig.append(1)
+        # Update the Kalman Filters
+        for i in range(len(img_multi)):
+            filter_multi[i].pred_new_state()
+            filter_multi[i].pred_next_uncertainity()
+            filter_multi[i].get_Kalman_gain()
+            filter_multi[i].state_correction([x_cen, y_cen] if assig[-1] == i else [None, None])
+            filter_multi[i].uncertainity_correction([x_cen, y_cen] if assig[-1] == i else [None, None])
 
-    # Update the Kalman Filters
     for i in range(len(img_multi)):
-        filter_multi[i].pred_new_state()
-        filter_multi[i].pred_next_uncertainity()
-        filter_multi[i].get_Kalman_gain()
-        filter_multi[i].state_correction([x_cen, y_cen] if assig[-1] == i else [None, None])
-        filter_multi[i].uncertainity_correction([x_cen, y_cen] if assig[-1] == i else [None, None])
+        tmp_img = img_multi[i].copy()
 
-for i in range(len(img_multi)):
-    tmp_img = img_multi[i].copy()
+        # Draw the predicted positions of the two balls
+        for j, filter in enumerate(filter_multi):
+            color = (255, 0, 0) if j == 0 else (0, 0, 255)
+            predicted_pos = (int(filter.S_hist[i][0]), int(filter.S_hist[i][3]))
+            cv2.circle(tmp_img, predicted_pos, radius=1, color=color, thickness=3)
 
-    # Draw the predicted positions of the two balls
-    for j, filter in enumerate(filter_multi):
-        color = (255, 0, 0) if j == 0 else (0, 0, 255)
-        predicted_pos = (int(filter.S_hist[i][0]), int(filter.S_hist[i][3]))
-        cv2.circle(tmp_img, predicted_pos, radius=1, color=color, thickness=3)
+        # Get detections for the current frame
+        current_detections = df_multi_list[i]
 
-    # Get detections for the current frame
-    current_detections = df_multi_list[i]
+        for _, row in current_detections.iterrows():
+            # Draw bounding box for all detected objects
+            if row['class_id'] == 0:  # Assuming 0 is the class ID for 'sports ball'
+                # Determine which filter this detection is closer to
+                coord = [(row['xmin'] + row['xmax']) / 2, (row['ymin'] + row['ymax']) / 2]
+                cost0 = cost_fun([filter_multi[0].S_hist[i][0], filter_multi[0].S_hist[i][3]], coord)
+                cost1 = cost_fun([filter_multi[1].S_hist[i][0], filter_multi[1].S_hist[i][3]], coord)
 
-    for _, row in current_detections.iterrows():
-        # Draw bounding box for all detected objects
-        if row['class_id'] == 0:  # Assuming 0 is the class ID for 'sports ball'
-            # Determine which filter this detection is closer to
-            coord = [(row['xmin'] + row['xmax']) / 2, (row['ymin'] + row['ymax']) / 2]
-            cost0 = cost_fun([filter_multi[0].S_hist[i][0], filter_multi[0].S_hist[i][3]], coord)
-            cost1 = cost_fun([filter_multi[1].S_hist[i][0], filter_multi[1].S_hist[i][3]], coord)
+                if cost0 < cost1:
+                    color = (255, 0, 0)  # Red for objects closer to filter 0
+                    label = 'Ball 1'
+                else:
+                    color = (0, 0, 255)  # Blue for objects closer to filter 1
+                    label = 'Ball 2'
 
-            if cost0 < cost1:
-                color = (255, 0, 0)  # Red for objects closer to filter 0
-                label = 'Ball 1'
-            else:
-                color = (0, 0, 255)  # Blue for objects closer to filter 1
-                label = 'Ball 2'
+                tmp_img = draw_prediction(tmp_img, label, row, color=color)
 
-            tmp_img = draw_prediction(tmp_img, label, row, color=color)
+        out.write(tmp_img)
 
-    out.write(tmp_img)
+    out.release()
 
-out.release()
 
 # from IPython.display import Video
 # Video("multiple_balls_kalman.mp4", embed=True)
@@ -282,4 +285,8 @@ out.release()
 #   # Create a DataFrame from the detection results
 #   df = pd.DataFrame({'xmin': boxes[:, 0], 'ymin': boxes[:, 1], 'xmax': boxes[:, 2], 'ymax': boxes[:, 3], 'class_id': class_ids, 'confidence': scores})
 #   df_multi_list.append(df)
-#   print(df)
\ No newline at end of file
+#   print(df)
+
+
+if __name__ == '__main__':
+    track_two_shuttles()
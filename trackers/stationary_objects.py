@@ -0,0 +1,190 @@
+import math
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+class Blacklist:
+    """
+    Stationary points (lights, logos, spare shuttles...) that the shuttle model keeps
+    detecting. The points are indexed once in a KD-tree, so rejecting the candidates of a
+    frame costs one vectorized query instead of a Python scan over every black listed point.
+    """
+    def __init__(self, points, threshold=15):
+        self.points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        self.threshold = threshold
+        self.tree = cKDTree(self.points) if len(self.points) else None
+
+    @classmethod
+    def from_stationary_objects(cls, stationary_coords, threshold=15):
+        """
+        Builds the black list from the (coord, freq) pairs of identify_stationary_objects.
+        """
+        return cls([coord for coord, freq in stationary_coords], threshold)
+
+    def __len__(self):
+        return len(self.points)
+
+    def __iter__(self):
+        for x, y in self.points.tolist():
+            yield x, y
+
+    def reject_mask(self, centers):
+        """
+        Boolean mask, True for every center within threshold of any black listed point.
+        """
+        centers = np.asarray(centers, dtype=np.float64).reshape(-1, 2)
+        if self.tree is None or len(centers) == 0:
+            return np.zeros(len(centers), dtype=bool)
+
+        # Nearest black listed point only, anything further than the threshold comes back as inf
+        distances, _ = self.tree.query(centers, k=1, distance_upper_bound=self.threshold * (1 + 1e-9))
+        return distances <= self.threshold
+
+    def is_close(self, coord):
+        return bool(self.reject_mask([coord])[0])
+
+
+def cluster_by_proximity(coords, weights=None, threshold=10):
+    """
+    Greedy proximity clustering with the semantics of the old pairwise loops: coordinates
+    are visited in order, every coordinate not yet in a group starts one and takes all the
+    later coordinates closer than threshold to it (so, as before, a coordinate can be counted
+    in more than one group). Coordinates are bucketed into a grid of threshold-sized cells,
+    so a group only searches the 3x3 cells around its seed and the whole pass is near-linear
+    instead of quadratic.
+
+    Returns a list of (mean coordinate tuple, summed weight, number of coordinates),
+    in the order the groups were started. weights default to 1 per coordinate.
+    """
+    coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    n = len(coords)
+    if weights is None:
+        weights = [1] * n
+    if n == 0:
+        return []
+
+    cells = np.floor(coords / threshold).astype(np.int64).tolist()
+    xs, ys = coords[:, 0].tolist(), coords[:, 1].tolist()
+
+    grid = {}
+    for i, cell in enumerate(cells):
+        grid.setdefault((cell[0], cell[1]), []).append(i)
+
+    used = [False] * n
+    groups = []
+
+    for i in range(n):
+        if used[i]:
+            continue
+        used[i] = True
+        members = [i]
+        cx, cy = cells[i]
+
+        for nx in (cx - 1, cx, cx + 1):
+            for ny in (cy - 1, cy, cy + 1):
+                bucket = grid.get((nx, ny))
+                if not bucket:
+                    continue
+                # Groups are started in index order, so coordinates before this seed can
+                # never join a later group and are dropped from the bucket
+                bucket[:] = [j for j in bucket if j > i]
+                for j in bucket:
+                    if math.hypot(xs[i] - xs[j], ys[i] - ys[j]) < threshold:
+                        members.append(j)
+                        used[j] = True
+
+        members.sort()
+        avg_coord = tuple(np.mean(coords[members], axis=0))
+        groups.append((avg_coord, sum(weights[j] for j in members), len(members)))
+
+    return groups
+
+
+class StationaryObjectDetector:
+    """
+    Online black list. Every shuttle detection adds a hit to its grid cell, hit counts decay
+    with a half-life of half_life seconds, a cell is black listed once its decayed count
+    reaches promote_seconds * fps hits and released again when it falls below
+    demote_seconds * fps. Static false positives are therefore picked up as frames stream in,
+    whenever they appear in the match, without a separate warm-up pass.
+
+    The black listed point of a cell is the mean of the detections that hit it. Once every
+    half-life, the cells that are not black listed and whose decayed count fell below
+    min_hits are forgotten, so the state stays small over a long match.
+    """
+    def __init__(self, fps, threshold=15, cell_size=30, half_life=3.0, promote_seconds=2.0, demote_seconds=0.5,
+                 min_hits=0.01):
+        self.threshold = threshold
+        self.cell_size = cell_size
+        self.decay = 0.5 ** (1 / (half_life * fps))
+        self.promote_hits = promote_seconds * fps
+        self.demote_hits = demote_seconds * fps
+        self.min_hits = min_hits
+        self.prune_interval = max(1, int(half_life * fps))
+        self.last_prune = 0
+
+        # cell -> [decayed hits, decayed sum of x, decayed sum of y, frame of the last update]
+        self.cells = {}
+        self.black_cells = set()
+        self.blacklist = Blacklist([], threshold)
+
+    def _decayed(self, cell, frame_index):
+        state = self.cells[cell]
+        factor = self.decay ** (frame_index - state[3])
+        state[0] *= factor
+        state[1] *= factor
+        state[2] *= factor
+        state[3] = frame_index
+        return state
+
+    def update(self, frame_index, centers):
+        """
+        Adds the shuttle detections of a frame (black listed or not, so that static objects
+        stay black listed) and returns the Blacklist to use for this frame.
+        """
+        changed = False
+
+        hit_cells = {}
+        for x, y in np.asarray(centers, dtype=np.float64).reshape(-1, 2).tolist():
+            cell = (math.floor(x / self.cell_size), math.floor(y / self.cell_size))
+            hit_cells.setdefault(cell, []).append((x, y))
+
+        for cell, hits in hit_cells.items():
+            if cell not in self.cells:
+                self.cells[cell] = [0.0, 0.0, 0.0, frame_index]
+            state = self._decayed(cell, frame_index)
+            # One hit per cell and frame, at the mean of the detections in it
+            state[0] += 1
+            state[1] += sum(x for x, _ in hits) / len(hits)
+            state[2] += sum(y for _, y in hits) / len(hits)
+
+            if cell not in self.black_cells and state[0] >= self.promote_hits:
+                self.black_cells.add(cell)
+                changed = True
+
+        for cell in list(self.black_cells):
+            if self._decayed(cell, frame_index)[0] < self.demote_hits:
+                self.black_cells.discard(cell)
+                changed = True
+
+        if frame_index - self.last_prune >= self.prune_interval:
+            self._prune(frame_index)
+
+        if changed:
+            self.blacklist = Blacklist(self.points(), self.threshold)
+
+        return self.blacklist
+
+    def _prune(self, frame_index):
+        for cell in list(self.cells):
+            if cell not in self.black_cells and self._decayed(cell, frame_index)[0] < self.min_hits:
+                del self.cells[cell]
+        self.last_prune = frame_index
+
+    def points(self):
+        points = []
+        for cell in sorted(self.black_cells):
+            hits, sum_x, sum_y, _ = self.cells[cell]
+            points.append((sum_x / hits, sum_y / hits))
+        return points
@@ -0,0 +1,65 @@
+"""
+Benchmark of the proximity clustering behind group_similar_coordinates and
+identify_stationary_objects: the old pairwise O(n^2) loop against the grid-bucketed
+cluster_by_proximity, on synthetic detections (jittered stationary objects plus
+shuttle positions spread over a 1080p frame).
+"""
+import time
+
+import numpy as np
+
+from trackers.stationary_objects import cluster_by_proximity
+
+
+def make_points(n, n_stationary=50, seed=0):
+    rng = np.random.default_rng(seed)
+    stationary = rng.uniform([0, 0], [1920, 1080], size=(n_stationary, 2))
+    n_static = n // 2
+    static = stationary[rng.integers(0, n_stationary, size=n_static)] + rng.normal(0, 2, size=(n_static, 2))
+    moving = rng.uniform([0, 0], [1920, 1080], size=(n - n_static, 2))
+    points = np.vstack([static, moving])
+    return points[rng.permutation(n)]
+
+
+def pairwise_clustering(coords, threshold=10):
+    grouped = []
+    used = [False] * len(coords)
+    for i in range(len(coords)):
+        if used[i]:
+            continue
+        current_group = [coords[i]]
+        used[i] = True
+        for j in range(i + 1, len(coords)):
+            dist = np.linalg.norm(np.array(coords[i]) - np.array(coords[j]))
+            if dist < threshold:
+                current_group.append(coords[j])
+                used[j] = True
+        grouped.append((tuple(np.mean(current_group, axis=0)), len(current_group)))
+    return grouped
+
+
+def main():
+    # Same groups as the old implementation
+    points = make_points(2000).tolist()
+    old = pairwise_clustering(points)
+    new = [(coord, count) for coord, _, count in cluster_by_proximity(points)]
+    assert len(old) == len(new)
+    for (a, na), (b, nb) in zip(old, new):
+        assert na == nb and np.allclose(a, b)
+
+    for n in (1000, 2000, 4000):
+        points = make_points(n).tolist()
+        start = time.perf_counter()
+        pairwise_clustering(points)
+        print(f"pairwise {n:7d} points: {time.perf_counter() - start:8.3f} s")
+
+    for n in (1000, 10000, 100000):
+        points = make_points(n)
+        start = time.perf_counter()
+        groups = cluster_by_proximity(points)
+        seconds = time.perf_counter() - start
+        print(f"grid     {n:7d} points: {seconds:8.3f} s ({1e6 * seconds / n:.1f} us/point, {len(groups)} groups)")
+
+
+if __name__ == '__main__':
+    main()
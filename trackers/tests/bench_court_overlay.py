@@ -0,0 +1,51 @@
+"""
+Benchmark of the court and net overlay: drawing every pair of keypoints with cv2.line on
+every frame against pasting the pre-rendered CourtOverlay, on 1080p frames with the
+keypoints of a typical broadcast view.
+"""
+import time
+
+import numpy as np
+
+from models.court_and_net_detection.om import draw_court_and_net_on_frame, CourtOverlay
+from trackers.tests.fixtures import COURT
+
+COURT_INFO, NET_INFO = COURT.court_pixels, COURT.net_pixels
+
+
+def main():
+    n_frames = 1000
+    rng = np.random.default_rng(0)
+    frames = [rng.integers(0, 256, size=(1080, 1920, 3), dtype=np.uint8) for _ in range(8)]
+
+    # Both only write the overlay pixels, so they can draw on the same frames over and over
+    drawn_frames = [frame.copy() for frame in frames]
+    start = time.perf_counter()
+    for i in range(n_frames):
+        draw_court_and_net_on_frame(drawn_frames[i % len(frames)], COURT_INFO, NET_INFO)
+    lines_seconds = time.perf_counter() - start
+
+    # The layer is rendered on the first frame, once per match, and timed on its own
+    overlay = CourtOverlay(COURT_INFO, NET_INFO)
+    pasted_frames = [frame.copy() for frame in frames]
+    start = time.perf_counter()
+    overlay.apply(frames[0].copy())
+    render_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i in range(n_frames):
+        overlay.apply(pasted_frames[i % len(frames)])
+    overlay_seconds = time.perf_counter() - start
+
+    assert all(np.array_equal(drawn, pasted) for drawn, pasted in zip(drawn_frames, pasted_frames))
+    assert not overlay.update(COURT_INFO, NET_INFO) and overlay.renders == 1
+
+    y0, y1, x0, x1 = overlay.layer.roi
+    print(f"{n_frames} frames of 1920x1080, overlay region {x1 - x0}x{y1 - y0}")
+    print(f"cv2.line per frame: {1e3 * lines_seconds / n_frames:6.2f} ms/frame")
+    print(f"CourtOverlay:       {1e3 * overlay_seconds / n_frames:6.2f} ms/frame, "
+          f"after rendering the layer once in {1e3 * render_seconds:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
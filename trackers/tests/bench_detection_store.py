@@ -0,0 +1,86 @@
+"""
+Benchmark of the player detection record: the old list of per-frame dictionaries saved
+with pickle against the columnar PlayerDetectionStore saved as .npz, on an hour of
+synthetic singles detections at 60 fps.
+"""
+import os
+import pickle as pkl
+import tempfile
+import time
+
+import numpy as np
+
+from utils import PlayerDetectionStore
+
+
+def make_frame_rows(n_frames, seed=0):
+    rng = np.random.default_rng(seed)
+    frame_rows = []
+    for _ in range(n_frames):
+        n = rng.integers(1, 3)
+        xy = rng.uniform(0, 1800, size=(n, 2))
+        boxes = np.hstack([xy, xy + [80, 180]]).astype(np.float32)
+        frame_rows.append((rng.integers(1, 5, size=n), np.arange(n, dtype=np.float64), boxes,
+                           rng.uniform(0.5, 1, size=n).astype(np.float32)))
+    return frame_rows
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def save_pickle(detected_players, path):
+    with open(path, 'wb+') as f:
+        pkl.dump(detected_players, f)
+
+
+def load_pickle(path):
+    with open(path, 'rb') as f:
+        return pkl.load(f)
+
+
+def main():
+    n_frames = 60 * 60 * 60
+    store = PlayerDetectionStore.from_frame_rows(make_frame_rows(n_frames))
+    detected_players = store.to_frames()
+
+    with tempfile.TemporaryDirectory() as directory:
+        pickle_path = os.path.join(directory, 'player_detections.pkl')
+        store_path = os.path.join(directory, 'player_detections.npz')
+
+        _, pickle_save = timed(save_pickle, detected_players, pickle_path)
+        loaded_dicts, pickle_load = timed(load_pickle, pickle_path)
+        _, store_save = timed(store.save, store_path)
+        loaded_store, store_load = timed(PlayerDetectionStore.load, store_path)
+
+        assert loaded_dicts[n_frames // 2] == loaded_store[n_frames // 2]
+
+        print(f"{n_frames} frames, {len(store.frame)} detections")
+        print(f"pickle: {os.path.getsize(pickle_path) / 1e6:7.1f} MB, save {pickle_save:6.3f}s, load {pickle_load:6.3f}s")
+        print(f"npz:    {os.path.getsize(store_path) / 1e6:7.1f} MB, save {store_save:6.3f}s, load {store_load:6.3f}s")
+
+    # A typical analytics query: the mean box height of every track
+    def per_track_dicts():
+        heights = {}
+        for player_dict in detected_players:
+            for track_info in player_dict.values():
+                x1, y1, x2, y2 = track_info['coordinates']
+                heights.setdefault(track_info['class_id'], []).append(y2 - y1)
+        return {track_id: sum(h) / len(h) for track_id, h in heights.items()}
+
+    def per_track_store():
+        tracks, inverse = np.unique(store.track_id, return_inverse=True)
+        heights = store.boxes[:, 3] - store.boxes[:, 1]
+        means = np.bincount(inverse, heights) / np.bincount(inverse)
+        return dict(zip(tracks.tolist(), means.tolist()))
+
+    expected, dicts_seconds = timed(per_track_dicts)
+    actual, store_seconds = timed(per_track_store)
+    assert all(np.isclose(expected[track_id], actual[track_id]) for track_id in expected)
+    print(f"mean height per track: dicts {1e3 * dicts_seconds:7.1f} ms, columns {1e3 * store_seconds:6.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
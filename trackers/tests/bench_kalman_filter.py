@@ -0,0 +1,81 @@
+"""
+Benchmark of the shuttle Kalman filters: KalmanFilter objects stepped one by one against one
+KalmanFilterBank stepping all the filters at once, in filter steps (predict + update) per
+second, and the memory the filters hold after a long run.
+"""
+import pickle as pkl
+import time
+
+import numpy as np
+
+from trackers.kalman_filter_tracking_2 import KalmanFilter
+from utils import KalmanFilterBank
+
+
+def make_measurements(n_filters, n_frames, seed=0):
+    rng = np.random.default_rng(seed)
+    start = rng.uniform(0, 1800, size=(n_filters, 1, 2))
+    velocity = rng.uniform(-20, 20, size=(n_filters, 1, 2))
+    noise = rng.normal(0, 2, size=(n_filters, n_frames, 2))
+    return start + velocity * np.arange(n_frames)[None, :, None] + noise
+
+
+def step_original(kf, z):
+    kf.pred_new_state()
+    kf.pred_next_uncertainity()
+    kf.get_Kalman_gain()
+    kf.state_correction(z)
+    kf.uncertainity_correction(z)
+
+
+def run_original(measurements, params):
+    n_filters, n_frames, _ = measurements.shape
+    filters = [KalmanFilter(*measurements[i, 0], **params) for i in range(n_filters)]
+    frames = [[measurements[i, t].tolist() for i in range(n_filters)] for t in range(1, n_frames)]
+
+    start = time.perf_counter()
+    for frame in frames:
+        for kf, z in zip(filters, frame):
+            step_original(kf, z)
+    seconds = time.perf_counter() - start
+    return filters, n_filters * (n_frames - 1) / seconds
+
+
+def run_bank(measurements, params):
+    n_filters, n_frames, _ = measurements.shape
+    bank = KalmanFilterBank(capacity=n_filters, **params)
+    ids = [bank.add(*measurements[i, 0]) for i in range(n_filters)]
+
+    start = time.perf_counter()
+    for t in range(1, n_frames):
+        bank.predict()
+        bank.update(ids, measurements[:, t])
+    seconds = time.perf_counter() - start
+    return bank, n_filters * (n_frames - 1) / seconds
+
+
+def main():
+    params = dict(fps=30, std_a=3000.0, std_x=3.0, std_y=3.0, cov=1e4)
+
+    for n_filters, n_frames in ((1, 20000), (4, 5000), (16, 2000), (100, 500)):
+        measurements = make_measurements(n_filters, n_frames)
+        original, original_rate = run_original(measurements, params)
+        bank, bank_rate = run_bank(measurements, params)
+
+        assert np.allclose(bank.states, [kf.S for kf in original])
+        print(f"{n_filters:3d} filters: KalmanFilter {original_rate:9.0f} steps/s, "
+              f"KalmanFilterBank {bank_rate:9.0f} steps/s ({bank_rate / original_rate:.1f}x)")
+
+    # One track followed through an hour at 30 fps
+    n_frames = 30 * 60 * 60
+    measurements = make_measurements(1, n_frames)
+    unbounded, _ = run_original(measurements, dict(params, history=None))
+    original, _ = run_original(measurements, params)
+    bank, _ = run_bank(measurements, params)
+    print(f"after {n_frames} steps: KalmanFilter holds {len(pkl.dumps(unbounded[0])) / 1e6:.1f} MB "
+          f"with its whole history, {len(pkl.dumps(original[0])) / 1e6:.2f} MB with the default "
+          f"{original[0].S_hist.maxlen} steps, KalmanFilterBank {len(pkl.dumps(bank)) / 1e6:.3f} MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+Benchmark of the shuttle trajectory smoothing: the old pandas linear interpolation with a
+5-sample moving average of the speed against the RTS smoother of interpolate_shuttle_tracking
+(smooth_shuttle_trajectory), on synthetic flights with detection noise and missed frames.
+Prints the time and the error of the positions and speeds against the true flight.
+"""
+import time
+
+import numpy as np
+import pandas as pd
+
+from trackers.kalman_filter_tracking_2 import smooth_shuttle_trajectory
+from trackers.tests.fixtures import COURT
+
+
+def make_flight(n_frames, fps, miss=0.3, seed=0):
+    # Shots of about a second between random points of the court, under a drag-like slow down
+    rng = np.random.default_rng(seed)
+    true = np.empty((n_frames, 2))
+    start = rng.uniform([500, 300], [1400, 950])
+    frame = 0
+    while frame < n_frames:
+        length = int(rng.integers(fps // 2, 2 * fps))
+        end = rng.uniform([500, 300], [1400, 950])
+        progress = 1 - np.exp(-3 * np.arange(1, length + 1) / length)
+        progress /= progress[-1]
+        true[frame:frame + length] = (start + progress[:, None] * (end - start))[:n_frames - frame]
+        start = end
+        frame += length
+
+    measured = true + rng.normal(0, 3, size=true.shape)
+    missed = rng.random(n_frames) < miss
+    # A few longer occlusions
+    for gap_start in rng.integers(0, n_frames, size=n_frames // 600):
+        missed[gap_start:gap_start + int(rng.integers(5, 20))] = True
+    measured[missed] = np.nan
+    return true, measured
+
+
+def true_speeds(true, fps):
+    velocity = np.gradient(true, axis=0) * fps
+    return np.hypot(velocity[:, 0] * COURT.width_scale, velocity[:, 1] * COURT.height_scale)
+
+
+def pandas_smoothing(measured, fps):
+    # The speed as RallyTracker used to give it: frame to frame speed, averaged over 5 detections
+    step = np.full(len(measured), np.nan)
+    rows = np.flatnonzero(~np.isnan(measured).any(axis=1))
+    delta = np.diff(measured[rows], axis=0)
+    step[rows[1:]] = np.hypot(delta[:, 0] * COURT.width_scale, delta[:, 1] * COURT.height_scale) / np.diff(rows) * fps
+    step[rows[0]] = 0
+    averaged = pd.Series(step[rows]).rolling(5, min_periods=1).mean().to_numpy()
+    speed = np.full(len(measured), np.nan)
+    speed[rows] = averaged
+
+    df = pd.DataFrame({'x_center': measured[:, 0], 'y_center': measured[:, 1], 'smoothened_speed': speed})
+    df = df.interpolate(method='linear').bfill().ffill()
+    return df[['x_center', 'y_center']].to_numpy(), df['smoothened_speed'].to_numpy()
+
+
+def rts_smoothing(measured, fps):
+    x, y, speed = smooth_shuttle_trajectory(measured, fps, COURT)
+    return np.stack([x, y], axis=1), speed
+
+
+def main():
+    fps = 30
+    for n_frames in (30 * 60, 30 * 60 * 60):
+        true, measured = make_flight(n_frames, fps)
+        speeds = true_speeds(true, fps)
+        print(f"{n_frames} frames, {np.isnan(measured[:, 0]).mean():.0%} without a detection")
+        for name, smoothing in (('pandas interpolation', pandas_smoothing), ('RTS smoother', rts_smoothing)):
+            start = time.perf_counter()
+            positions, speed = smoothing(measured, fps)
+            seconds = time.perf_counter() - start
+            position_error = np.linalg.norm(positions - true, axis=1)
+            print(f"  {name:20s} {1e3 * seconds:8.1f} ms, position error mean {position_error.mean():5.2f} px, "
+                  f"p99 {np.percentile(position_error, 99):6.2f} px, speed error mean "
+                  f"{np.abs(speed - speeds).mean():5.2f} m/s")
+
+
+if __name__ == '__main__':
+    main()
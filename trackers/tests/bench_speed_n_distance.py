@@ -0,0 +1,102 @@
+"""
+Benchmark of SpeedAndDistance_Estimator: the old frame by frame loops over the nested
+player dictionaries against the per-player trajectory arrays, on synthetic detections.
+Both use the same court projection, so their results must match.
+"""
+import copy
+import time
+
+import numpy as np
+
+from utils import measure_distance
+from speed_distance_estimator import SpeedAndDistance_Estimator
+from trackers.tests.fixtures import COURT
+
+
+def make_detections(n_frames, n_players, dropout=0.1, seed=0):
+    rng = np.random.default_rng(seed)
+    positions = rng.uniform([500, 300], [1400, 950], size=(n_players, 2))
+    detected_players = []
+    for _ in range(n_frames):
+        # Random walk that stays on the court
+        positions = np.clip(positions + rng.normal(0, 4, size=positions.shape), [500, 300], [1400, 950])
+        player_dict = {}
+        for player_id, (x, y) in enumerate(positions.tolist()):
+            if rng.random() < dropout:
+                continue
+            player_dict[player_id] = {'coordinates': [x - 40, y - 180, x + 40, y], 'class_id': player_id}
+        detected_players.append(player_dict)
+    return detected_players
+
+
+def loop_speed_n_distance(detected_players, frame_window, frame_rate, doubles):
+    # The estimator before it was vectorized, with the distance through the court projection
+    court_coord = COURT.court_info
+    net_coord = COURT.net_info
+    total_distance = {}
+    number_of_frames = len(detected_players)
+
+    for frame_num in range(0, number_of_frames, frame_window):
+        last_frame = min(frame_num + frame_window, number_of_frames - 1)
+
+        for player_id in detected_players[frame_num].keys():
+            if player_id not in detected_players[last_frame]:
+                continue
+            start_position = detected_players[frame_num][player_id]['coordinates']
+            if doubles and (start_position[2] < net_coord[0][0] or start_position[2] > net_coord[2][0]
+                            or start_position[3] < court_coord[0][1] or start_position[3] > court_coord[5][1]):
+                continue
+            end_position = detected_players[last_frame][player_id]['coordinates']
+
+            distance_covered = measure_distance(start_position, end_position, COURT)
+            time_elapsed = (last_frame - frame_num) / frame_rate if doubles else (last_frame - frame_num)
+            if time_elapsed == 0:
+                continue
+            speed = distance_covered / time_elapsed * (3.6 if doubles else 1)
+
+            total_distance[player_id] = total_distance.get(player_id, 0) + distance_covered
+
+            for frame_num_batch in range(frame_num, last_frame + 1):
+                if player_id not in detected_players[frame_num_batch]:
+                    continue
+                detected_players[frame_num_batch][player_id]['speed'] = speed
+                detected_players[frame_num_batch][player_id]['distance'] = total_distance[player_id]
+
+    return detected_players
+
+
+def assert_same(expected, actual):
+    for expected_dict, actual_dict in zip(expected, actual):
+        assert expected_dict.keys() == actual_dict.keys()
+        for player_id, info in expected_dict.items():
+            assert ('speed' in info) == ('speed' in actual_dict[player_id])
+            if 'speed' in info:
+                assert np.isclose(info['speed'], actual_dict[player_id]['speed'])
+                assert np.isclose(info['distance'], actual_dict[player_id]['distance'])
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    estimator = SpeedAndDistance_Estimator(COURT)
+
+    for n_frames, n_players in ((3000, 2), (3000, 4), (60 * 60 * 60, 4)):
+        detections = make_detections(n_frames, n_players)
+        for doubles in (False, True):
+            old, old_seconds = timed(loop_speed_n_distance, copy.deepcopy(detections),
+                                     estimator.frame_window, estimator.frame_rate, doubles)
+            method = estimator.speed_n_distance_doubles if doubles else estimator.speed_n_distance
+            new, new_seconds = timed(method, copy.deepcopy(detections))
+            assert_same(old, new)
+
+            print(f"{n_frames:6d} frames, {n_players} players, {'doubles' if doubles else 'singles'}: "
+                  f"loops {1e3 * old_seconds:8.1f} ms, arrays {1e3 * new_seconds:7.1f} ms, "
+                  f"{old_seconds / new_seconds:5.1f}x faster")
+
+
+if __name__ == '__main__':
+    main()
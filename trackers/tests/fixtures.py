@@ -0,0 +1,14 @@
+"""
+Shared by the benchmarks (bench_*.py) and tests (test_*.py) of this folder. They all run
+from the repository root, the benchmarks as modules and the tests with pytest:
+
+    python -m trackers.tests.bench_kalman_filter
+    python -m pytest trackers/tests
+
+COURT is the court of a 1920x1080 broadcast view, so nothing here needs coordinates.json;
+COURT.court_pixels and COURT.net_pixels are its keypoints as int32 arrays for drawing.
+"""
+from utils import CourtGeometry
+
+COURT = CourtGeometry([[560, 250], [1360, 250], [480, 560], [1440, 560], [380, 980], [1540, 980]],
+                      [[480, 420], [480, 560], [1440, 560], [1440, 420]])
@@ -0,0 +1,47 @@
+"""
+Checks that the pre-rendered court layer draws the same pixels as the court lines and is
+rendered again only when the keypoints change.
+"""
+import numpy as np
+
+from models.court_and_net_detection.om import CourtOverlay, draw_court_and_net_on_frame
+from trackers.tests.fixtures import COURT
+from utils import StaticLayer, Text, draw_annotations, labelled_box
+
+COURT_INFO, NET_INFO = COURT.court_pixels, COURT.net_pixels
+
+
+def random_frames(n, shape=(1080, 1920, 3)):
+    rng = np.random.default_rng(0)
+    return [rng.integers(0, 256, size=shape, dtype=np.uint8) for _ in range(n)]
+
+
+def test_layer_matches_the_drawn_lines():
+    overlay = CourtOverlay(COURT_INFO, NET_INFO)
+    for frame in random_frames(3):
+        drawn = draw_court_and_net_on_frame(frame.copy(), COURT_INFO, NET_INFO)
+        assert np.array_equal(overlay.apply(frame), drawn)
+    assert overlay.renders == 1
+
+
+def test_layer_is_rendered_again_only_for_new_keypoints():
+    overlay = CourtOverlay(COURT_INFO, NET_INFO)
+    frame, = random_frames(1)
+    overlay.apply(frame.copy())
+
+    assert not overlay.update(COURT_INFO.copy(), NET_INFO.copy())
+    overlay.apply(frame.copy())
+    assert overlay.renders == 1
+
+    moved = COURT_INFO + 7
+    assert overlay.update(moved, NET_INFO)
+    drawn = draw_court_and_net_on_frame(frame.copy(), moved, NET_INFO)
+    assert np.array_equal(overlay.apply(frame.copy()), drawn)
+    assert overlay.renders == 2
+
+
+def test_static_layer_matches_drawing_its_records():
+    records = labelled_box((30, 60, 200, 110), 'Player 1', (0, 0, 255)) + [Text('12 - 9', (40, 100), 1, (255, 255, 255), 2)]
+    frame, = random_frames(1, shape=(120, 320, 3))
+    drawn = draw_annotations(frame.copy(), records)
+    assert np.array_equal(StaticLayer(records, frame.shape).apply(frame), drawn)
@@ -0,0 +1,60 @@
+"""
+Checks that FrameSource decodes runs of frames starting anywhere in a video exactly as a
+decode from the beginning does.
+"""
+import cv2
+import numpy as np
+
+from utils import FrameSource
+
+N_FRAMES = 200
+
+
+def frame_number(image):
+    # Read back the 12 bit frame number written by make_video
+    return sum(1 << bit for bit in range(12) if image[2:18, bit * 20 + 2:bit * 20 + 18].mean() > 128)
+
+
+def make_video(path, n_frames=N_FRAMES, fourcc='mp4v'):
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*fourcc), 30, (320, 240))
+    for i in range(n_frames):
+        image = np.full((240, 320, 3), 60, np.uint8)
+        for bit in range(12):
+            image[0:20, bit * 20:(bit + 1) * 20] = 255 if i >> bit & 1 else 0
+        writer.write(image)
+    writer.release()
+    return str(path)
+
+
+class KeyframeSeekCapture:
+    # A capture that seeks to the keyframe before the requested frame, like some codecs do
+    VideoCapture = cv2.VideoCapture
+
+    def __init__(self, *args):
+        self.cap = self.VideoCapture(*args)
+
+    def set(self, prop, value):
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            value = int(value) // 50 * 50
+        return self.cap.set(prop, value)
+
+    def __getattr__(self, name):
+        return getattr(self.cap, name)
+
+
+def decoded_numbers(video, start_frame, max_frames):
+    return [frame_number(image) for image in FrameSource(video, start_frame=start_frame, max_frames=max_frames)]
+
+
+def test_runs_match_a_sequential_decode(tmp_path):
+    video = make_video(tmp_path / 'numbers.mp4')
+    assert decoded_numbers(video, 0, None) == list(range(N_FRAMES))
+    for start in (1, 49, 50, 51, 137, N_FRAMES - 1, N_FRAMES, N_FRAMES + 10):
+        assert decoded_numbers(video, start, 20) == list(range(start, min(start + 20, N_FRAMES)))
+
+
+def test_inexact_seek_falls_back_to_decoding_in_order(tmp_path, monkeypatch):
+    video = make_video(tmp_path / 'numbers.mp4')
+    monkeypatch.setattr(cv2, 'VideoCapture', KeyframeSeekCapture)
+    for start in (1, 49, 51, 137):
+        assert decoded_numbers(video, start, 20) == list(range(start, start + 20))
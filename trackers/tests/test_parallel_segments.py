@@ -0,0 +1,30 @@
+"""
+Checks that the segments of parallel player detection decode the same frames as one
+sequential decode of the video.
+"""
+import cv2
+import pytest
+
+from trackers.parallel_detection import plan_segments, segment_frames
+from trackers.tests.test_frame_source import KeyframeSeekCapture, frame_number, make_video
+from utils import FrameSource
+
+N_FRAMES = 230
+
+
+@pytest.mark.parametrize('inexact_seek', [False, True])
+def test_segments_match_a_sequential_decode(tmp_path, monkeypatch, inexact_seek):
+    video = make_video(tmp_path / 'numbers.mp4', N_FRAMES)
+    sequential = [frame_number(image) for image in FrameSource(video)]
+    if inexact_seek:
+        monkeypatch.setattr(cv2, 'VideoCapture', KeyframeSeekCapture)
+
+    joined = []
+    for decode_start, start, end in plan_segments(N_FRAMES, segment_size=60, overlap=15):
+        numbers = [frame_number(image) for image in segment_frames(video, decode_start, end)]
+        # The overlap head is the end of the previous segment, the rest the segment's own frames
+        head = start - decode_start
+        assert numbers[:head] == sequential[decode_start:start]
+        joined.extend(numbers[head:])
+
+    assert joined == sequential == list(range(N_FRAMES))
@@ -0,0 +1,112 @@
+"""
+Checks that batched player tracking (several frames per model.track call) gives the same
+per-frame rows and track ids as one call per frame, with a stub YOLO model whose tracker
+state persists between calls like model.track(persist=True).
+"""
+import numpy as np
+import pytest
+
+from trackers import PlayerTracker, Doubles_Tracking, DetectionPlan
+
+N_FRAMES = 37
+
+
+class StubArray:
+    def __init__(self, values):
+        self.values = np.asarray(values)
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self.values
+
+
+class StubBoxes:
+    def __init__(self, ids, cls, xyxy, conf):
+        self.id = StubArray(ids) if ids is not None else None
+        self.cls = StubArray(cls)
+        self.xyxy = StubArray(xyxy)
+        self.conf = StubArray(conf)
+
+
+class StubResult:
+    names = {0: 'person', 1: 'person', 2: 'racket'}
+
+    def __init__(self, boxes):
+        self.boxes = boxes
+
+
+class StubTrackingModel:
+    """
+    Frame i carries i in its first pixel. Two players and a racket are detected on every
+    frame but every 6th, where nothing is tracked. A player that comes back after such a
+    frame gets a new track id, so the ids depend on every frame having gone through the
+    tracker in order.
+    """
+    def __init__(self):
+        self.next_id = 0
+        self.ids = None
+        self.calls = 0
+
+    def track(self, frames, persist=False):
+        assert persist
+        self.calls += 1
+        results = []
+        for frame in frames:
+            i = int(frame[0, 0, 0])
+            if i % 6 == 5:
+                self.ids = None
+                results.append(StubResult(StubBoxes(None, np.empty(0), np.empty((0, 4)), np.empty(0))))
+                continue
+            if self.ids is None:
+                self.ids = [self.next_id, self.next_id + 1, self.next_id + 2]
+                self.next_id += 3
+            xyxy = np.array([[100 + i, 200, 150 + i, 300], [900 - i, 600, 960 - i, 720], [500, 500, 520, 540]],
+                            dtype=np.float32)
+            results.append(StubResult(StubBoxes(self.ids, [0, 1, 2], xyxy, [0.9, 0.8, 0.7])))
+        return results
+
+
+def video_frames():
+    frames = []
+    for i in range(N_FRAMES):
+        frame = np.zeros((4, 4, 3), dtype=np.uint8)
+        frame[0, 0, 0] = i
+        frames.append(frame)
+    return frames
+
+
+def run(tracker_cls, batch_size, plan=None):
+    tracker = tracker_cls('stub.pt', batch_size=batch_size)
+    tracker._model = StubTrackingModel()
+    store = tracker.detect_frames(video_frames(), plan=plan)
+    return store.to_frames(), tracker._model.calls
+
+
+@pytest.mark.parametrize('tracker_cls', [PlayerTracker, Doubles_Tracking])
+def test_batched_tracking_matches_per_frame_tracking(tracker_cls):
+    per_frame, per_frame_calls = run(tracker_cls, batch_size=1)
+    batched, batched_calls = run(tracker_cls, batch_size=8)
+
+    assert batched == per_frame
+    assert (per_frame_calls, batched_calls) == (N_FRAMES, 5)
+    assert per_frame[5] == {}
+    if tracker_cls is Doubles_Tracking:
+        # Only people, keyed by track id: tracks restart after every frame without ids, so the
+        # last frame is on the 7th set of ids
+        assert sorted(per_frame[-1]) == [18, 19]
+    else:
+        assert sorted(per_frame[-1]) == [0, 1, 2]
+
+
+@pytest.mark.parametrize('tracker_cls', [PlayerTracker, Doubles_Tracking])
+def test_skipped_frames_keep_the_last_detected_players(tracker_cls):
+    flags = [i % 3 == 0 for i in range(N_FRAMES)]
+    per_frame, _ = run(tracker_cls, batch_size=1, plan=DetectionPlan.fixed(flags))
+    batched, calls = run(tracker_cls, batch_size=8, plan=DetectionPlan.fixed(flags))
+
+    assert batched == per_frame
+    assert calls == 2
+    for i in range(N_FRAMES):
+        assert per_frame[i] == per_frame[i - i % 3]
@@ -0,0 +1,51 @@
+"""
+Checks of interpolate_shuttle_tracking on synthetic trajectories.
+"""
+import numpy as np
+
+from trackers.kalman_filter_tracking_2 import interpolate_shuttle_tracking, smooth_shuttle_trajectory
+from trackers.tests.fixtures import COURT
+
+
+def flight_gap_rest(fps=30, gap=340):
+    # 30 frames of a fast flight, a long gap without detections, then 30 frames at rest
+    t = np.arange(30) / fps
+    flight = np.stack([900 + 600 * t, 300 + 900 * t - 600 * t ** 2], axis=1)
+    rest = np.tile([600.0, 900.0], (30, 1))
+    return np.concatenate([flight, np.full((gap, 2), np.nan), rest])
+
+
+def test_long_gap_stays_between_its_ends():
+    z = flight_gap_rest()
+    x, y, speed = smooth_shuttle_trajectory(z, 30, COURT)
+
+    gap = slice(30, 370)
+    assert not np.isnan(x).any() and not np.isnan(y).any()
+    for filled, ends in ((x, (x[29], x[370])), (y, (y[29], y[370]))):
+        assert (filled[gap] >= min(ends) - 1e-6).all() and (filled[gap] <= max(ends) + 1e-6).all()
+    # The shuttle at rest keeps its place and has no speed
+    assert np.allclose(x[370:], 600, atol=1) and np.allclose(y[370:], 900, atol=1)
+    assert (speed[370:] < 0.5).all()
+
+
+def test_short_gap_is_smoothed_along_the_flight():
+    z = flight_gap_rest(gap=0)[:30]
+    truth = z.copy()
+    z[10:15] = np.nan
+    x, y, _ = smooth_shuttle_trajectory(z, 30, COURT)
+    assert np.hypot(x - truth[:, 0], y - truth[:, 1]).max() < 5
+
+
+def test_interpolate_shuttle_tracking_records(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'result' / 'shuttle_data').mkdir(parents=True)
+    z = flight_gap_rest()
+    tracking_data = {str(i): {'x_center': None if np.isnan(p[0]) else float(p[0]),
+                              'y_center': None if np.isnan(p[1]) else float(p[1])} for i, p in enumerate(z)}
+
+    smoothed = interpolate_shuttle_tracking(tracking_data, 30, COURT)
+    assert sorted(smoothed) == list(range(len(z)))
+    for axis in ('x_center', 'y_center'):
+        ends = smoothed[29][axis], smoothed[370][axis]
+        assert all(min(ends) - 1e-6 <= smoothed[i][axis] <= max(ends) + 1e-6 for i in range(30, 370))
+    assert (tmp_path / 'result' / 'shuttle_data' / 'shuttle_data.json').exists()
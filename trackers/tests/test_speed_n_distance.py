@@ -0,0 +1,31 @@
+"""
+Checks that the speeds of SpeedAndDistance_Estimator follow the frame rate of the video: the
+same walk filmed at 30 and at 60 fps gives the same speed in km/h, with and without the foot
+filters.
+"""
+import numpy as np
+import pytest
+
+from speed_distance_estimator import SpeedAndDistance_Estimator
+from trackers.tests.fixtures import COURT
+
+
+def walk(fps, seconds=4, speed=150.0, seed=0):
+    # One player walking across the court at speed pixels/s, with a little box jitter
+    rng = np.random.default_rng(seed)
+    detected_players = []
+    for t in np.arange(seconds * fps) / fps:
+        x, y = 700 + speed * t + rng.normal(0, 1), 700 + rng.normal(0, 1)
+        detected_players.append({1: {'coordinates': [x - 40, y - 180, x + 40, y], 'class_id': 1}})
+    return detected_players
+
+
+def median_speed(fps, smooth_feet):
+    estimator = SpeedAndDistance_Estimator(COURT, smooth_feet=smooth_feet, fps=fps)
+    detected_players = estimator.speed_n_distance_doubles(walk(fps))
+    return np.median([player_dict[1]['speed'] for player_dict in detected_players if 'speed' in player_dict[1]])
+
+
+@pytest.mark.parametrize('smooth_feet', [False, True])
+def test_speed_does_not_depend_on_the_frame_rate(smooth_feet):
+    assert median_speed(30, smooth_feet) == pytest.approx(median_speed(60, smooth_feet), rel=0.1)
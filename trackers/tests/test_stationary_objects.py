@@ -0,0 +1,61 @@
+"""
+Checks of the online black list on a synthetic match: a static false positive gets black
+listed, the shuttle resting on the floor does not.
+"""
+import numpy as np
+
+from trackers.kalman_filter_tracking_2 import RallyTracker, ShuttleHypothesisTracker
+from trackers.stationary_objects import StationaryObjectDetector
+from trackers.tests.fixtures import COURT
+
+FPS = 30
+LIGHT = (1725.0, 135.0)
+
+
+def box(x, y, size=10):
+    return [x - size / 2, y - size / 2, x + size / 2, y + size / 2]
+
+
+def rest_then_move(fps=FPS, rest_seconds=6):
+    # A flight into the court, the shuttle at rest on the floor, then picked up and hit again,
+    # with a light detected as a shuttle on every frame
+    flight_in = [(900 + 8 * t, 300 + 12 * t) for t in range(30)]
+    rest = [flight_in[-1]] * (rest_seconds * fps)
+    flight_out = [(rest[-1][0] - 10 * t, rest[-1][1] - 15 * t) for t in range(1, 31)]
+    positions = flight_in + rest + flight_out
+    rng = np.random.default_rng(0)
+    frames = []
+    for x, y in positions:
+        jitter = rng.normal(0, 1, size=4)
+        boxes = np.array([box(x + jitter[0], y + jitter[1]), box(LIGHT[0] + jitter[2], LIGHT[1] + jitter[3])],
+                         dtype=np.float32)
+        frames.append((boxes, np.zeros(2, dtype=np.int32), np.ones(2, dtype=np.float32)))
+    return frames, len(flight_in) + len(rest)
+
+
+def test_resting_shuttle_is_not_black_listed():
+    frames, moved_at = rest_then_move()
+    rally = RallyTracker(FPS, stationary_detector=StationaryObjectDetector(FPS), court_geometry=COURT,
+                         shuttle_tracker=ShuttleHypothesisTracker(FPS))
+    scoreboard, tracking_data, _ = rally.process(frames)
+
+    # The light is black listed within a few seconds and stays so
+    light_listed = [any(np.hypot(x - LIGHT[0], y - LIGHT[1]) < 15 for x, y in record['black_list'])
+                    for record in scoreboard]
+    assert all(light_listed[4 * FPS:])
+
+    # Nothing but the light is ever black listed, and the shuttle is tracked on its detections
+    # through the rest and after it is hit again
+    assert all(len(record['black_list']) <= 1 for record in scoreboard)
+    for frame in range(moved_at, len(frames)):
+        record = tracking_data[str(frame)]
+        assert record['x_center'] is not None and not record['predicted']
+        assert np.hypot(record['x_center'] - LIGHT[0], record['y_center'] - LIGHT[1]) > 100
+
+
+def test_static_detections_are_black_listed_without_a_tracker():
+    frames, _ = rest_then_move(rest_seconds=4)
+    rally = RallyTracker(FPS, stationary_detector=StationaryObjectDetector(FPS), court_geometry=COURT)
+    scoreboard, _, _ = rally.process(frames)
+    # Without tracks nothing tells the resting shuttle from a light, both get black listed
+    assert len(scoreboard[-31]['black_list']) == 2
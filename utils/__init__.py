@@ -1,2 +1,10 @@
-from .video_utils import read_video, write_video, read_video_few_frames
-from .box_utils import get_center_of_box, measure_distance, get_foot_position, get_bbox_width
\ No newline at end of file
+from .video_utils import read_video, write_video, encode_frames, FrameSource, VideoFrame, batch_frames
+from .pipeline import Pipeline
+from .box_utils import get_center_of_box, measure_distance, measure_distances, get_foot_position, get_foot_positions, get_bbox_width, box_iou
+from .model_registry import get_model, warm_up, evict, reset_tracking, get_tracking_state, set_tracking_state, cached_models, default_device
+from .court_geometry import CourtGeometry, CourtProjection, load_court_geometry, SINGLES_WIDTH, DOUBLES_WIDTH, VERTICAL_LENGTH
+from .detection_store import PlayerDetectionStore
+from .inference_cache import InferenceCache, inference_key, video_fingerprint, weights_fingerprint, load_json, save_json
+from .checkpoints import ChunkCheckpoints, DEFAULT_CHECKPOINT_DIR
+from .overlay import OverlayRenderer, StaticLayer, draw_annotations, labelled_box, Line, Rect, Circle, Text
+from .kalman import KalmanFilterBank, rts_smooth, constant_acceleration_model, OBSERVED
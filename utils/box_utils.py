@@ -1,13 +1,7 @@
-import json
+import numpy as np
 
-SINGLES_WIDTH = 5.18
-DOUBLES_WIDTH = 6.1
-VERTICAL_LENGTH = 13.4
+from .court_geometry import load_court_geometry
 
-with open('result/court_and_net/courts/court_kp/coordinates.json', 'r') as f:
-    data = json.load(f)
-
-court_coord = data["court_info"]
 def get_center_of_box(box):
     x1, x2, y1, y2 = box
     center_x = int((x1 + x2)/2)
@@ -15,29 +9,50 @@ def get_center_of_box(box):
 
     return center_x, center_y
 
-def measure_distance(p1, p2):
-    global court_coord, SINGLES_WIDTH, VERTICAL_LENGTH
-
-    # Convert court coordinates to float if they're not already
-    court_coord = [[float(x) for x in coord] for coord in court_coord]
+def measure_distance(p1, p2, court_geometry=None):
+    if court_geometry is None:
+        court_geometry = load_court_geometry()
 
-    # Get foot positions of players
-    x1, y1 = get_foot_position(p1)
-    x2, y2 = get_foot_position(p2)
+    # Distance in metres between the foot positions of the players, on the court plane
+    return float(court_geometry.projection.distances([get_foot_position(p1)], [get_foot_position(p2)])[0])
 
-    width_pixels = court_coord[5][0] - court_coord[0][0]
-    height_pixels = court_coord[5][1] - court_coord[0][1]
 
-    x_distance = abs(x1 - x2) * (SINGLES_WIDTH / width_pixels)
-    y_distance = abs(y1 - y2) * (VERTICAL_LENGTH / height_pixels)
+def measure_distances(boxes_a, boxes_b, court_geometry=None):
+    """
+    measure_distance for matching rows of two (n, 4) arrays of boxes.
+    """
+    if court_geometry is None:
+        court_geometry = load_court_geometry()
 
-    return (x_distance**2 + y_distance**2)**0.5
+    boxes_a = np.asarray(boxes_a, dtype=np.float64).reshape(-1, 4)
+    boxes_b = np.asarray(boxes_b, dtype=np.float64).reshape(-1, 4)
+    return court_geometry.projection.distances(get_foot_positions(boxes_a), get_foot_positions(boxes_b))
 
 
 def get_foot_position(bbox):
     x1,y1,x2,y2 = bbox
     return int((x1+x2)/2),int(y2)
 
+def get_foot_positions(boxes):
+    # Vectorized get_foot_position, with the same truncation to whole pixels
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    return np.stack([np.trunc((boxes[:, 0] + boxes[:, 2]) / 2), np.trunc(boxes[:, 3])], axis=1)
+
 def get_bbox_width(bbox):
     x1, x2, _, _ = bbox
     return x2 - x1
+
+def box_iou(boxes_a, boxes_b):
+    """
+    Intersection over union of every box of an (n, 4) array of x1, y1, x2, y2 boxes with
+    every box of an (m, 4) array, as an (n, m) matrix.
+    """
+    boxes_a = np.asarray(boxes_a, dtype=np.float64).reshape(-1, 1, 4)
+    boxes_b = np.asarray(boxes_b, dtype=np.float64).reshape(1, -1, 4)
+    width = np.clip(np.minimum(boxes_a[..., 2], boxes_b[..., 2]) - np.maximum(boxes_a[..., 0], boxes_b[..., 0]), 0, None)
+    height = np.clip(np.minimum(boxes_a[..., 3], boxes_b[..., 3]) - np.maximum(boxes_a[..., 1], boxes_b[..., 1]), 0, None)
+    intersection = width * height
+    area_a = (boxes_a[..., 2] - boxes_a[..., 0]) * (boxes_a[..., 3] - boxes_a[..., 1])
+    area_b = (boxes_b[..., 2] - boxes_b[..., 0]) * (boxes_b[..., 3] - boxes_b[..., 1])
+    union = area_a + area_b - intersection
+    return np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
@@ -0,0 +1,61 @@
+import os
+import pickle as pkl
+import shutil
+
+DEFAULT_CHECKPOINT_DIR = 'record/checkpoints'
+
+
+class ChunkCheckpoints:
+    """
+    Results of a long job saved chunk by chunk, so an interrupted run resumes after the last
+    completed chunk instead of starting over. A chunk is a dictionary of what the stages
+    produced for its frames, together with the state needed to carry on from there (tracker
+    state, score...). It is pickled to chunk_<index>.pkl once it is complete.
+
+    The directory must be specific to the job (video, models and settings, see inference_key)
+    so that checkpoints are never resumed into a different job.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, index):
+        return os.path.join(self.directory, f"chunk_{index:05d}.pkl")
+
+    def completed(self):
+        """
+        Number of consecutive completed chunks from the start of the job.
+        """
+        count = 0
+        while os.path.exists(self.path(count)):
+            count += 1
+        return count
+
+    def load(self, index):
+        """
+        Returns the saved chunk, or None when it has not been completed.
+        """
+        path = self.path(index)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'rb') as f:
+                return pkl.load(f)
+        except Exception as e:
+            # A truncated checkpoint is recomputed
+            print(f"Ignoring unreadable checkpoint {path}: {e}")
+            return None
+
+    def save(self, index, chunk):
+        # The checkpoint only appears once it is completely written
+        path = self.path(index)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pkl.dump(chunk, f, protocol=pkl.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    def clear(self):
+        """
+        Deletes the checkpoints, once the job has finished.
+        """
+        shutil.rmtree(self.directory, ignore_errors=True)
@@ -0,0 +1,135 @@
+import json
+import os
+
+import cv2
+import numpy as np
+
+SINGLES_WIDTH = 5.18
+DOUBLES_WIDTH = 6.1
+VERTICAL_LENGTH = 13.4
+
+COORDINATES_PATH = 'result/court_and_net/courts/court_kp/coordinates.json'
+
+
+class CourtProjection:
+    """
+    Perspective projection from image pixels to metres on the court plane, fitted once
+    per match to the six court keypoints:
+
+        0 (0, 0)          1 (width, 0)            far baseline
+        2 (0, length/2)   3 (width, length/2)     net line
+        4 (0, length)     5 (width, length)       near baseline
+
+    Only meaningful for points on the ground, e.g. the players' feet.
+    """
+    def __init__(self, court_points, width=SINGLES_WIDTH, length=VERTICAL_LENGTH):
+        court_points = np.asarray(court_points, dtype=np.float64).reshape(-1, 2)
+        metric_points = np.array([
+            [0, 0], [width, 0],
+            [0, length / 2], [width, length / 2],
+            [0, length], [width, length],
+        ], dtype=np.float64)
+
+        # Least squares over the six correspondences
+        homography, _ = cv2.findHomography(court_points, metric_points, 0)
+        if homography is None:
+            # Degenerate keypoints, fall back to the axis-aligned scale from the corners
+            sx = width / (court_points[5][0] - court_points[0][0])
+            sy = length / (court_points[5][1] - court_points[0][1])
+            homography = np.array([
+                [sx, 0, -sx * court_points[0][0]],
+                [0, sy, -sy * court_points[0][1]],
+                [0, 0, 1],
+            ])
+        self.homography = homography
+
+    def to_court(self, points):
+        """
+        Projects an (n, 2) array of pixel coordinates to (n, 2) court coordinates in metres.
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        projected = points @ self.homography[:, :2].T + self.homography[:, 2]
+        return projected[:, :2] / projected[:, 2:]
+
+    def distances(self, points_a, points_b):
+        """
+        Distances in metres between matching rows of two (n, 2) arrays of pixel coordinates.
+        """
+        delta = self.to_court(points_a) - self.to_court(points_b)
+        return np.hypot(delta[:, 0], delta[:, 1])
+
+
+class CourtGeometry:
+    """
+    Court and net keypoints of one video together with everything derived from them
+    (pixel to metre scale factors and projection, court halves as polygons), computed once
+    when the court is detected and passed to the trackers and the speed estimator.
+
+    court_info and net_info are kept as given, as lists of [x, y] pixel coordinates:
+    court points 0, 1 are the far baseline, 2, 3 the net line and 4, 5 the near baseline.
+    """
+    def __init__(self, court_info, net_info):
+        if court_info is None or net_info is None:
+            raise ValueError("Court geometry needs both the court and the net keypoints")
+
+        self.court_info = court_info
+        self.net_info = net_info
+
+        self.court_points = np.asarray(court_info, dtype=np.float64).reshape(-1, 2)
+        self.net_points = np.asarray(net_info, dtype=np.float64).reshape(-1, 2)
+
+        # Integer copies for drawing
+        self.court_pixels = self.court_points.astype(np.int32)
+        self.net_pixels = self.net_points.astype(np.int32)
+
+        # Axis-aligned pixel to metre scale, from the far left and near right corners
+        self.width_scale = SINGLES_WIDTH / (self.court_points[5][0] - self.court_points[0][0])
+        self.height_scale = VERTICAL_LENGTH / (self.court_points[5][1] - self.court_points[0][1])
+
+        # Perspective-aware pixel to metre mapping for positions on the ground
+        self.projection = CourtProjection(self.court_points)
+
+        # Court halves in the layout cv2.pointPolygonTest expects
+        self.near_court_polygon = np.array(court_info[2:], dtype=np.int32).reshape((-1, 1, 2))
+        self.far_court_polygon = np.array(court_info[:4], dtype=np.int32).reshape((-1, 1, 2))
+
+    @classmethod
+    def from_dict(cls, court_dict):
+        """
+        Builds the geometry from the dictionary written to coordinates.json.
+        """
+        return cls(court_dict["court_info"], court_dict["net_info"])
+
+    @classmethod
+    def load(cls, json_path=COORDINATES_PATH):
+        with open(json_path, 'r') as f:
+            return cls.from_dict(json.load(f))
+
+    def court_side(self, point):
+        """
+        1 if the point is in (or on) the court half near the camera, 2 if it is in the far
+        half, False if it is outside the court.
+        """
+        point = (float(point[0]), float(point[1]))
+        if cv2.pointPolygonTest(self.near_court_polygon, point, False) >= 0:
+            return 1
+        if cv2.pointPolygonTest(self.far_court_polygon, point, False) >= 0:
+            return 2
+        return False
+
+
+_loaded = {}
+
+
+def load_court_geometry(json_path=COORDINATES_PATH):
+    """
+    Fallback for callers that were not given a CourtGeometry: reads coordinates.json on
+    first use and again only when the file has been rewritten (e.g. for the next video).
+    """
+    key = os.path.abspath(json_path)
+    mtime = os.stat(key).st_mtime_ns
+    cached = _loaded.get(key)
+    if cached is None or cached[0] != mtime:
+        cached = (mtime, CourtGeometry.load(key))
+        _loaded[key] = cached
+    return cached[1]
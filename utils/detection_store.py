@@ -0,0 +1,197 @@
+import os
+import pickle as pkl
+
+import numpy as np
+
+
+class PlayerDetectionStore:
+    """
+    Player detections of a whole video as contiguous columns, one row per detection, sorted
+    by frame: frame, track_id, class_id, boxes (x1, y1, x2, y2), conf, plus the speed and
+    distance columns filled in by SpeedAndDistance_Estimator (NaN where there is no estimate).
+
+    Indexing or iterating gives the same per-frame dictionaries the trackers used to return,
+    built on the fly from the columns:
+        key_by='class'  {class_id: {'coordinates': [...], 'class_id': track_id}}   (singles)
+        key_by='track'  {track_id: {'coordinates': [...], 'class_id': class_id}}   (doubles)
+    With key_by='class' only the last detection of each class in a frame is kept, as the
+    dictionaries did.
+
+    The store is saved as a single .npz file.
+    """
+    def __init__(self, n_frames, frame, track_id, class_id, boxes, conf, speed=None, distance=None, key_by='class'):
+        self.n_frames = int(n_frames)
+        self.key_by = key_by
+        self.frame = np.asarray(frame, dtype=np.int32)
+        self.track_id = np.asarray(track_id, dtype=np.int32)
+        self.class_id = np.asarray(class_id, dtype=np.float32)
+        self.boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        self.conf = np.asarray(conf, dtype=np.float32)
+        self.speed = np.full(len(self.frame), np.nan) if speed is None else np.asarray(speed, dtype=np.float64)
+        self.distance = np.full(len(self.frame), np.nan) if distance is None else np.asarray(distance, dtype=np.float64)
+
+        # Rows of frame i are offsets[i]:offsets[i + 1]
+        self.offsets = np.searchsorted(self.frame, np.arange(self.n_frames + 1))
+
+    @property
+    def keys(self):
+        """
+        The per-frame dictionary key of every row.
+        """
+        return self.class_id if self.key_by == 'class' else self.track_id
+
+    @classmethod
+    def from_frame_rows(cls, frame_rows, key_by='class'):
+        """
+        Builds the store from one (track_ids, class_ids, boxes, confs) tuple of arrays per frame.
+        """
+        n_frames = len(frame_rows)
+        counts = [len(rows[0]) for rows in frame_rows]
+        frame = np.repeat(np.arange(n_frames), counts)
+
+        if sum(counts):
+            track_id = np.concatenate([rows[0] for rows in frame_rows])
+            class_id = np.concatenate([rows[1] for rows in frame_rows])
+            boxes = np.concatenate([np.asarray(rows[2]).reshape(-1, 4) for rows in frame_rows])
+            conf = np.concatenate([rows[3] for rows in frame_rows])
+        else:
+            track_id, class_id, boxes, conf = [], [], np.empty((0, 4)), []
+
+        if key_by == 'class' and len(frame):
+            # A later detection of the same class replaces the earlier one in the frame
+            class_id = np.asarray(class_id, dtype=np.float64)
+            reverse = np.arange(len(frame))[::-1]
+            _, first_in_reverse = np.unique(np.stack([frame[reverse], class_id[reverse]], axis=1),
+                                            axis=0, return_index=True)
+            keep = np.sort(reverse[first_in_reverse])
+            frame, track_id, class_id = frame[keep], np.asarray(track_id)[keep], class_id[keep]
+            boxes, conf = np.asarray(boxes)[keep], np.asarray(conf)[keep]
+
+        return cls(n_frames, frame, track_id, class_id, boxes, conf, key_by=key_by)
+
+    @classmethod
+    def from_frames(cls, detected_players, key_by='class'):
+        """
+        Converts a list of per-frame player dictionaries (e.g. an old pickle record).
+        """
+        frame_rows = []
+        for player_dict in detected_players:
+            track_ids, class_ids, boxes = [], [], []
+            for key, track_info in player_dict.items():
+                if key_by == 'class':
+                    class_ids.append(key)
+                    track_ids.append(track_info['class_id'])
+                else:
+                    track_ids.append(key)
+                    class_ids.append(track_info['class_id'])
+                boxes.append(track_info['coordinates'])
+            frame_rows.append((np.asarray(track_ids, dtype=np.int64), np.asarray(class_ids, dtype=np.float64),
+                               np.asarray(boxes, dtype=np.float32).reshape(-1, 4), np.ones(len(boxes), dtype=np.float32)))
+
+        store = cls.from_frame_rows(frame_rows, key_by)
+
+        # Keep any speed / distance that was already estimated
+        for row, (frame_num, key) in enumerate(zip(store.frame.tolist(), store.keys.tolist())):
+            track_info = detected_players[frame_num][key]
+            if track_info.get('speed') is not None:
+                store.speed[row] = track_info['speed']
+            if track_info.get('distance') is not None:
+                store.distance[row] = track_info['distance']
+        return store
+
+    @classmethod
+    def concatenate(cls, stores):
+        """
+        Joins the stores of consecutive runs of frames (e.g. the chunks of a match) into one,
+        frame numbers of each store are shifted by the frames of the stores before it.
+        """
+        if not stores:
+            return cls(0, [], [], [], np.empty((0, 4)), [])
+
+        def column(name):
+            return np.concatenate([getattr(store, name) for store in stores])
+
+        starts = np.cumsum([0] + [store.n_frames for store in stores])
+        frame = np.concatenate([store.frame + start for store, start in zip(stores, starts)])
+        return cls(starts[-1], frame, column('track_id'), column('class_id'), column('boxes'), column('conf'),
+                   column('speed'), column('distance'), key_by=stores[0].key_by)
+
+    def slice(self, start, end):
+        """
+        Detections of frames start to end (excluded) as a new store numbered from frame 0,
+        sharing the columns with this store.
+        """
+        end = min(end, self.n_frames)
+        start = min(start, end)
+        first, last = self.offsets[start], self.offsets[end]
+        return PlayerDetectionStore(end - start, self.frame[first:last] - start, self.track_id[first:last],
+                                    self.class_id[first:last], self.boxes[first:last], self.conf[first:last],
+                                    self.speed[first:last], self.distance[first:last], key_by=self.key_by)
+
+    def __len__(self):
+        return self.n_frames
+
+    def __getitem__(self, frame_num):
+        if frame_num < 0:
+            frame_num += self.n_frames
+        if not 0 <= frame_num < self.n_frames:
+            raise IndexError(f"frame {frame_num} out of range")
+        start, end = self.offsets[frame_num], self.offsets[frame_num + 1]
+        return self._player_dict(start, end)
+
+    def __iter__(self):
+        for player_dict in self.to_frames():
+            yield player_dict
+
+    def _player_dict(self, start, end):
+        player_dict = {}
+        rows = zip(self.keys[start:end].tolist(), self.track_id[start:end].tolist(), self.class_id[start:end].tolist(),
+                   self.boxes[start:end].tolist(), self.speed[start:end].tolist(), self.distance[start:end].tolist())
+        for key, track_id, class_id, box, speed, distance in rows:
+            track_info = {
+                'coordinates': box,
+                'class_id': track_id if self.key_by == 'class' else class_id
+            }
+            if speed == speed:
+                track_info['speed'] = speed
+            if distance == distance:
+                track_info['distance'] = distance
+            player_dict[key] = track_info
+        return player_dict
+
+    def to_frames(self):
+        """
+        All the per-frame dictionaries at once, e.g. for the JSON export.
+        """
+        frames = [{} for _ in range(self.n_frames)]
+        keys = self.keys.tolist()
+        values = self.class_id.tolist() if self.key_by == 'track' else self.track_id.tolist()
+        rows = zip(self.frame.tolist(), keys, values, self.boxes.tolist(), self.speed.tolist(), self.distance.tolist())
+        for frame_num, key, value, box, speed, distance in rows:
+            track_info = {'coordinates': box, 'class_id': value}
+            if speed == speed:
+                track_info['speed'] = speed
+            if distance == distance:
+                track_info['distance'] = distance
+            frames[frame_num][key] = track_info
+        return frames
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'wb') as f:
+            np.savez(f, n_frames=self.n_frames, key_by=self.key_by, frame=self.frame, track_id=self.track_id,
+                     class_id=self.class_id, boxes=self.boxes, conf=self.conf, speed=self.speed, distance=self.distance)
+
+    @classmethod
+    def load(cls, path, key_by='class'):
+        """
+        Loads a store saved with save(). Records in the old pickle format (a list of
+        per-frame dictionaries) are converted, keyed by key_by.
+        """
+        if path.endswith('.pkl'):
+            with open(path, 'rb') as f:
+                return cls.from_frames(pkl.load(f), key_by)
+
+        with np.load(path) as data:
+            return cls(int(data['n_frames']), data['frame'], data['track_id'], data['class_id'], data['boxes'],
+                       data['conf'], data['speed'], data['distance'], key_by=str(data['key_by']))
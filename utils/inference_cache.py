@@ -0,0 +1,154 @@
+import hashlib
+import json
+import os
+import threading
+
+# Bump when the layout of a cached result changes, so old entries are never read back
+CACHE_VERSION = 1
+
+DEFAULT_CACHE_DIR = 'record/cache'
+
+# Bytes hashed from the start, the middle and the end of a video
+_SAMPLE_SIZE = 1 << 20
+
+_weights_hashes = {}
+_lock = threading.Lock()
+
+
+def video_fingerprint(video_path):
+    """
+    Content fingerprint of a video: its size and a hash of three 1 MiB samples (start, middle,
+    end). Cheap even for hour-long matches, and a different or re-encoded video gets a
+    different fingerprint.
+    """
+    size = os.path.getsize(video_path)
+    digest = hashlib.sha256(str(size).encode())
+    with open(video_path, 'rb') as f:
+        for offset in (0, max(0, size // 2 - _SAMPLE_SIZE // 2), max(0, size - _SAMPLE_SIZE)):
+            f.seek(offset)
+            digest.update(f.read(_SAMPLE_SIZE))
+    return digest.hexdigest()
+
+
+def weights_fingerprint(weights_path):
+    """
+    SHA-256 of a weights file, computed once per process for each version of the file.
+    """
+    stat = os.stat(weights_path)
+    key = (os.path.abspath(weights_path), stat.st_size, stat.st_mtime_ns)
+    with _lock:
+        if key in _weights_hashes:
+            return _weights_hashes[key]
+
+    digest = hashlib.sha256()
+    with open(weights_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 24), b''):
+            digest.update(block)
+
+    with _lock:
+        _weights_hashes[key] = digest.hexdigest()
+    return _weights_hashes[key]
+
+
+def inference_key(stage, video_path, weights_paths=(), **params):
+    """
+    Key of the result of a stage on a video: changes with the video content, the model
+    weights, the stage parameters and CACHE_VERSION.
+    """
+    description = {
+        'version': CACHE_VERSION,
+        'stage': stage,
+        'video': video_fingerprint(video_path),
+        'weights': [weights_fingerprint(path) for path in weights_paths],
+        'params': params,
+    }
+    digest = hashlib.sha256(json.dumps(description, sort_keys=True, default=str).encode())
+    return f"{stage}-{digest.hexdigest()[:32]}"
+
+
+class InferenceCache:
+    """
+    Content-addressed cache of inference results on disk. An entry is addressed by the
+    stage name, the video fingerprint, the hashes of the model weights and the stage
+    parameters, so a result is only ever reused for the same footage, models and settings.
+
+    Each entry is one file. Reading an entry marks it as recently used, and the least
+    recently used entries are deleted once the cache grows past max_bytes.
+    """
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=4 << 30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, stage, video_path, weights_paths=(), **params):
+        return inference_key(stage, video_path, weights_paths, **params)
+
+    def path(self, key, suffix):
+        return os.path.join(self.directory, key + suffix)
+
+    def get(self, key, suffix, load):
+        """
+        Returns load(path) for a cached entry, or None when there is none.
+        """
+        path = self.path(key, suffix)
+        if not os.path.exists(path):
+            return None
+        try:
+            value = load(path)
+        except Exception as e:
+            # A truncated or unreadable entry is a miss, it gets recomputed and replaced
+            print(f"Ignoring unreadable cache entry {path}: {e}")
+            return None
+        # Mark as recently used for the eviction
+        os.utime(path)
+        return value
+
+    def put(self, key, suffix, value, save):
+        """
+        Stores value with save(value, path) and evicts least recently used entries if needed.
+        The entry only appears once it is completely written.
+        """
+        path = self.path(key, suffix)
+        tmp_path = path + '.tmp'
+        save(value, tmp_path)
+        os.replace(tmp_path, path)
+        self.evict(keep=path)
+        return value
+
+    def cached(self, key, suffix, compute, load, save):
+        """
+        Returns the cached value if there is one, otherwise computes and stores it.
+        """
+        value = self.get(key, suffix, load)
+        if value is None:
+            value = self.put(key, suffix, compute(), save)
+        return value
+
+    def evict(self, keep=None):
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith('.tmp') or not os.path.isfile(path):
+                continue
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            os.remove(path)
+            total -= size
+            print(f"Evicted {path} from the inference cache")
+
+
+def save_json(value, path):
+    with open(path, 'w') as f:
+        json.dump(value, f)
+
+
+def load_json(path):
+    with open(path, 'r') as f:
+        return json.load(f)
@@ -0,0 +1,315 @@
+import numpy as np
+
+# x and y, the positions the detections measure, in the state [x, vx, ax, y, vy, ay]
+OBSERVED = np.array([0, 3])
+
+
+def constant_acceleration_model(fps, std_a):
+    """
+    Transition matrix F and process noise Q of the constant acceleration model, for the
+    state [x, vx, ax, y, vy, ay].
+    """
+    dt = 1 / fps
+    block = np.array([[1, dt, 0.5 * dt * dt], [0, 1, dt], [0, 0, 1]])
+    noise = np.array([0.5 * dt * dt, dt, 1])
+    F = np.zeros((6, 6))
+    Q = np.zeros((6, 6))
+    for axis in (slice(0, 3), slice(3, 6)):
+        F[axis, axis] = block
+        Q[axis, axis] = np.outer(noise, noise) * std_a * std_a
+    return F, Q
+
+
+def _inverse_2x2(m):
+    # Closed form inverse of a stack of symmetric 2x2 matrices, far cheaper than np.linalg on small stacks
+    a, b, c = m[:, 0, 0], m[:, 0, 1], m[:, 1, 1]
+    det = a * c - b * b
+    inverse = np.empty_like(m)
+    inverse[:, 0, 0] = c / det
+    inverse[:, 1, 1] = a / det
+    inverse[:, 0, 1] = inverse[:, 1, 0] = -b / det
+    return inverse
+
+
+class KalmanFilterBank:
+    """
+    Many Kalman filters with the same constant acceleration model, stored as stacked arrays:
+    states (n, 6) and covariances (n, 6, 6), one row per filter. predict() steps all the
+    filters and update() corrects any subset of them, each with a few array operations
+    whatever the number of filters, instead of one Python call per filter.
+
+    Filters are addressed by the id add() returns; their rows move when others are removed.
+    A filter that is predicted but not updated on a frame coasts on its prediction.
+
+        bank = KalmanFilterBank(fps)
+        track = bank.add(x, y)
+        bank.predict()
+        bank.update([track], [(x, y)])
+        bank.remove([track])
+    """
+    def __init__(self, fps=30, std_a=0.001, std_x=0.0045, std_y=0.01, cov=100000, capacity=8):
+        self.F, self.Q = constant_acceleration_model(fps, std_a)
+        self.FT = np.ascontiguousarray(self.F.T)
+        self.R = np.diag([std_x * std_x, std_y * std_y])
+        self.cov = cov
+
+        # Preallocated rows, the first count are in use
+        self._S = np.empty((capacity, 6))
+        self._P = np.empty((capacity, 6, 6))
+        self._ids = np.empty(capacity, dtype=np.int64)
+        self._scratch = np.empty((capacity, 6, 6))
+        self.count = 0
+        self.next_id = 0
+        self._rows = {}
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, track_id):
+        return track_id in self._rows
+
+    @property
+    def states(self):
+        return self._S[:self.count]
+
+    @property
+    def covariances(self):
+        return self._P[:self.count]
+
+    @property
+    def ids(self):
+        return self._ids[:self.count]
+
+    @property
+    def positions(self):
+        return self.states[:, OBSERVED]
+
+    def rows(self, ids):
+        return np.array([self._rows[track_id] for track_id in ids], dtype=np.int64)
+
+    def state(self, track_id):
+        return self._S[self._rows[track_id]]
+
+    def covariance(self, track_id):
+        return self._P[self._rows[track_id]]
+
+    def predicted_covariance(self, track_id):
+        """
+        Covariance of a filter one frame ahead, F P F^T + Q, without stepping it.
+        """
+        return self.F @ self.covariance(track_id) @ self.FT + self.Q
+
+    def add(self, x, y, covariance=None):
+        """
+        Adds a filter at rest at (x, y), with the covariance given as a 6x6 matrix, the
+        diagonal of one, or by default cov on the diagonal. Returns the id of the filter.
+        """
+        if self.count == len(self._S):
+            self._grow()
+        row = self.count
+        self._S[row] = (x, 0, 0, y, 0, 0)
+        if covariance is None:
+            covariance = np.full(6, self.cov, dtype=np.float64)
+        covariance = np.asarray(covariance, dtype=np.float64)
+        self._P[row] = np.diag(covariance) if covariance.ndim == 1 else covariance
+
+        track_id = self.next_id
+        self.next_id += 1
+        self._ids[row] = track_id
+        self._rows[track_id] = row
+        self.count += 1
+        return track_id
+
+    def _grow(self):
+        capacity = 2 * len(self._S)
+        for name in ('_S', '_P', '_ids', '_scratch'):
+            old = getattr(self, name)
+            new = np.empty((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self.count] = old[:self.count]
+            setattr(self, name, new)
+
+    def remove(self, ids):
+        """
+        Removes the filters with the given ids; the other filters keep their order.
+        """
+        ids = [track_id for track_id in ids if track_id in self._rows]
+        if not ids:
+            return
+        keep = np.ones(self.count, dtype=bool)
+        keep[self.rows(ids)] = False
+        kept = int(keep.sum())
+        self._S[:kept] = self.states[keep]
+        self._P[:kept] = self.covariances[keep]
+        self._ids[:kept] = self.ids[keep]
+        self.count = kept
+        self._rows = {track_id: row for row, track_id in enumerate(self.ids.tolist())}
+
+    def predict(self):
+        """
+        Moves every filter one frame ahead: S = F S, P = F P F^T + Q.
+        """
+        n = self.count
+        if not n:
+            return
+        S, P, FP = self._S[:n], self._P[:n], self._scratch[:n]
+        np.matmul(S, self.FT, out=FP[:, 0])
+        S[:] = FP[:, 0]
+        np.matmul(self.F, P, out=FP)
+        np.matmul(FP, self.FT, out=P)
+        P += self.Q
+
+    def innovation_covariances(self):
+        """
+        Covariance of the next measurement of every filter, H P H^T + R, as (n, 2, 2).
+        """
+        return self.covariances[:, OBSERVED[:, None], OBSERVED] + self.R
+
+    def mahalanobis(self, z):
+        """
+        Squared Mahalanobis distances (filters x measurements) between the positions of the
+        filters and the measured (m, 2) positions, under each filter's innovation covariance.
+        """
+        z = np.asarray(z, dtype=np.float64).reshape(-1, 2)
+        innovation = z[None, :, :] - self.positions[:, None, :]
+        inverse = _inverse_2x2(self.innovation_covariances())
+        return np.einsum('nmi,nij,nmj->nm', innovation, inverse, innovation)
+
+    def update(self, ids, z):
+        """
+        Corrects the filters with the given ids with their measured (x, y), one row of z each.
+        """
+        z = np.asarray(z, dtype=np.float64).reshape(-1, 2)
+        if not len(z):
+            return
+        rows = self.rows(ids)
+        S, P = self._S[rows], self._P[rows]
+
+        # K = P H^T (H P H^T + R)^-1, for all the filters at once
+        PHt = P[:, :, OBSERVED]
+        K = np.matmul(PHt, _inverse_2x2(PHt[:, OBSERVED, :] + self.R))
+
+        innovation = z - S[:, OBSERVED]
+        self._S[rows] = S + np.einsum('nij,nj->ni', K, innovation)
+        # P = P - K H P
+        self._P[rows] = P - np.matmul(K, PHt.transpose(0, 2, 1))
+
+
+def _matvec(m, v):
+    return (m @ v[..., None])[..., 0]
+
+
+def _transpose(m):
+    return np.swapaxes(m, -1, -2)
+
+
+def _prefix_scan(elements, combine):
+    """
+    Inclusive scan of associative elements along axis 1: out[k] = e[0] * e[1] * ... * e[k].
+    Neighbouring pairs are combined, the pairs are scanned recursively and the even positions
+    are filled in from them, so there are O(log n) rounds of array operations in all.
+    """
+    n = elements[0].shape[1]
+    if n == 1:
+        return elements
+    even = n - n % 2
+    pairs = combine([e[:, 0:even:2] for e in elements], [e[:, 1:even:2] for e in elements])
+    pairs = _prefix_scan(pairs, combine)
+
+    scanned = [np.empty_like(e) for e in elements]
+    for out, e, pair in zip(scanned, elements, pairs):
+        out[:, 0] = e[:, 0]
+        out[:, 1::2] = pair
+    if n > 2:
+        rest = combine([pair[:, :(n - 1) // 2] for pair in pairs], [e[:, 2::2] for e in elements])
+        for out, r in zip(scanned, rest):
+            out[:, 2::2] = r
+    return scanned
+
+
+def _combine_filtering(earlier, later):
+    # Two consecutive stretches of the Kalman filter as one (A, b, C, eta, J)
+    Ai, bi, Ci, eta_i, Ji = earlier
+    Aj, bj, Cj, eta_j, Jj = later
+    # (I + J C)^-1 is the transpose of (I + C J)^-1, as C and J are symmetric
+    W = np.linalg.inv(np.eye(Ai.shape[-1]) + Ci @ Jj)
+    M = Aj @ W
+    N = _transpose(Ai) @ _transpose(W)
+    return [M @ Ai,
+            _matvec(M, bi + _matvec(Ci, eta_j)) + bj,
+            M @ Ci @ _transpose(Aj) + Cj,
+            _matvec(N, eta_j - _matvec(Jj, bi)) + eta_i,
+            N @ Jj @ Ai + Ji]
+
+
+def _combine_smoothing(later, earlier):
+    # Two consecutive stretches of the backward pass as one (E, g, L), scanned from the end
+    Ej, gj, Lj = later
+    Ei, gi, Li = earlier
+    return [Ei @ Ej, _matvec(Ei, gj) + gi, Ei @ Lj @ _transpose(Ei) + Li]
+
+
+def rts_smooth(z, fps=30, std_a=0.001, std_x=0.0045, std_y=0.01, cov=100000):
+    """
+    Offline Rauch-Tung-Striebel smoother of the constant acceleration model over a whole
+    track: every frame's state estimated from all the measurements, before and after it.
+    z is an (n, 2) array with the measured (x, y) of every frame, NaN on frames without a
+    measurement; those frames are filled in by the model. Returns the smoothed states
+    [x, vx, ax, y, vy, ay] as an (n, 6) array, NaN everywhere if nothing was measured.
+
+    The forward (filter) and backward (smoother) passes are associative scans (Sarkka and
+    Garcia-Fernandez, "Temporal parallelization of Bayesian smoothers"), so both run as
+    O(log n) rounds of array operations over all the frames rather than a loop over frames.
+    x and y are independent in this model and are smoothed side by side as 3-state problems.
+    """
+    z = np.asarray(z, dtype=np.float64).reshape(-1, 2)
+    n = len(z)
+    measured = ~np.isnan(z).any(axis=1)
+    if not measured.any():
+        return np.full((n, 6), np.nan)
+
+    # One axis of the model, in units of frames ([p, v dt, a dt^2]) so the matrices are well scaled
+    F, Q = constant_acceleration_model(fps, std_a)
+    dt = 1 / fps
+    scale = np.array([1, dt, dt * dt])
+    F = F[:3, :3] * scale[:, None] / scale
+    Q = Q[:3, :3] * np.outer(scale, scale)
+    P0 = np.diag(cov * scale * scale)
+    r = np.array([std_x * std_x, std_y * std_y])
+
+    # Elements of the forward pass, one per frame and axis (axis, frame, ...). On a measured
+    # frame they fold in the measurement y with gain K = Q H^T / (H Q H^T + r), H = [1, 0, 0]
+    y = np.where(measured, z.T, 0)
+    innovation = Q[0, 0] + r
+    K = Q[None, :, 0] / innovation[:, None]
+    I_KH = np.eye(3) - K[:, :, None] * np.array([1, 0, 0])
+    on = measured[None, :, None, None]
+    A = np.where(on, (I_KH @ F)[:, None], F)
+    C = np.where(on, (I_KH @ Q)[:, None], Q)
+    b = np.where(on[..., 0], K[:, None, :] * y[:, :, None], 0)
+    eta = np.where(on[..., 0], F[0] * (y / innovation[:, None])[:, :, None], 0)
+    J = np.where(on, (np.outer(F[0], F[0]) / innovation[:, None, None])[:, None], 0)
+
+    # The first frame starts at rest at the first measured position, with covariance cov
+    first = z[np.argmax(measured)]
+    b[:, 0] = 0
+    b[:, 0, 0] = first
+    C[:, 0] = P0
+    if measured[0]:
+        gain = P0[:, 0] / (P0[0, 0] + r)[:, None]
+        C[:, 0] = P0 - gain[:, :, None] * P0[0]
+    A[:, 0] = 0
+    eta[:, 0] = 0
+    J[:, 0] = 0
+    _, x, P, _, _ = _prefix_scan([A, b, C, eta, J], _combine_filtering)
+
+    # Backward pass: x_s[k] = E[k] x_s[k + 1] + g[k], from the end
+    E = P @ F.T @ np.linalg.inv(F @ P @ F.T + Q)
+    g = x - _matvec(E, x @ F.T)
+    L = P - E @ F @ P
+    E[:, -1] = 0
+    g[:, -1] = x[:, -1]
+    L[:, -1] = P[:, -1]
+    _, smoothed, _ = _prefix_scan([E[:, ::-1], g[:, ::-1], L[:, ::-1]], _combine_smoothing)
+
+    smoothed = smoothed[:, ::-1] / scale
+    return np.concatenate([smoothed[0], smoothed[1]], axis=1)
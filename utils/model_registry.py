@@ -0,0 +1,132 @@
+import threading
+
+# Models are loaded on first use and kept per (kind, path, device), so importing a module
+# never touches the weights and a long-lived worker loads each model once across matches.
+# torch and ultralytics are only imported when a model is actually loaded.
+_models = {}
+_lock = threading.Lock()
+
+
+def default_device():
+    import torch
+    return 'cuda' if torch.cuda.is_available() else 'cpu'
+
+
+def _load_yolo(path, device):
+    from ultralytics import YOLO
+    model = YOLO(path)
+    if device is not None:
+        model.to(device)
+    return model
+
+
+def _load_torch(path, device):
+    import torch
+    # The keypoint RCNNs are pickled whole modules, not state dicts
+    model = torch.load(path, map_location=device or 'cpu')
+    model.to(device or 'cpu').eval()
+    return model
+
+
+_LOADERS = {
+    'yolo': _load_yolo,
+    'torch': _load_torch,
+}
+
+
+def get_model(path, kind='yolo', device=None):
+    """
+    Returns the cached model for (kind, path, device), loading it on first use.
+    kind is 'yolo' for ultralytics weights or 'torch' for a pickled torch module.
+    """
+    key = (kind, path, device)
+    with _lock:
+        model = _models.get(key)
+        if model is None:
+            model = _LOADERS[kind](path, device)
+            _models[key] = model
+    return model
+
+
+def reset_tracking(model):
+    """
+    Clears the track state that model.track(persist=True) keeps on a YOLO model, so a
+    cached model starts a new video with fresh track ids.
+    """
+    predictor = getattr(model, 'predictor', None)
+    for tracker in getattr(predictor, 'trackers', None) or []:
+        tracker.reset()
+
+
+def get_tracking_state(model):
+    """
+    Copy of the track state of a YOLO model after model.track(persist=True) (the trackers and
+    the next track id), e.g. to checkpoint it between the chunks of a long video.
+    None if the model has not tracked anything yet.
+    """
+    import copy
+    from ultralytics.trackers.basetrack import BaseTrack
+
+    trackers = getattr(getattr(model, 'predictor', None), 'trackers', None)
+    if trackers is None:
+        return None
+    try:
+        return {'trackers': copy.deepcopy(trackers), 'next_id': BaseTrack._count}
+    except Exception as e:
+        # e.g. a tracker holding an OpenCV feature detector, the next chunk starts new tracks
+        print(f"Track state cannot be copied, it is not checkpointed: {e}")
+        return None
+
+
+def set_tracking_state(model, state, frame_shape=(640, 640, 3)):
+    """
+    Restores a state from get_tracking_state, so the next model.track(persist=True) call
+    continues the same tracks with the same ids.
+    """
+    import copy
+    import numpy as np
+    from ultralytics.trackers.basetrack import BaseTrack
+
+    if state is None:
+        reset_tracking(model)
+        return
+    if getattr(model, 'predictor', None) is None:
+        # Track one blank frame to set up the predictor and its tracker callbacks,
+        # the trackers it creates are replaced right after
+        model.track(np.zeros(frame_shape, dtype=np.uint8), persist=True, verbose=False)
+    model.predictor.trackers = copy.deepcopy(state['trackers'])
+    BaseTrack._count = state['next_id']
+
+
+def warm_up(path, kind='yolo', device=None, imgsz=640):
+    """
+    Loads the model and, for YOLO weights, runs one inference on a blank frame so the
+    predictor is set up before the first real frame arrives.
+    """
+    model = get_model(path, kind, device)
+    if kind == 'yolo':
+        import numpy as np
+        model.predict(np.zeros((imgsz, imgsz, 3), dtype=np.uint8), verbose=False)
+    return model
+
+
+def evict(path=None, kind=None, device=None):
+    """
+    Drops cached models. With no arguments everything is dropped, otherwise only the
+    models matching the given path / kind / device.
+    """
+    with _lock:
+        for key in list(_models):
+            model_kind, model_path, model_device = key
+            if path is not None and model_path != path:
+                continue
+            if kind is not None and model_kind != kind:
+                continue
+            if device is not None and model_device != device:
+                continue
+            del _models[key]
+
+
+def cached_models():
+    with _lock:
+        return list(_models)
@@ -0,0 +1,133 @@
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+# Annotation records: what a subsystem wants drawn on a frame, without touching the frame.
+# thickness cv2.FILLED (-1) fills rectangles and circles. Text uses cv2.FONT_HERSHEY_SIMPLEX.
+Line = namedtuple('Line', ['pt1', 'pt2', 'color', 'thickness'])
+Rect = namedtuple('Rect', ['pt1', 'pt2', 'color', 'thickness'])
+Circle = namedtuple('Circle', ['center', 'radius', 'color', 'thickness'])
+Text = namedtuple('Text', ['text', 'org', 'scale', 'color', 'thickness'])
+
+
+def _draw_line(frame, record):
+    cv2.line(frame, record.pt1, record.pt2, record.color, record.thickness)
+
+
+def _draw_rect(frame, record):
+    cv2.rectangle(frame, record.pt1, record.pt2, record.color, record.thickness)
+
+
+def _draw_circle(frame, record):
+    cv2.circle(frame, record.center, record.radius, record.color, record.thickness)
+
+
+def _draw_text(frame, record):
+    cv2.putText(frame, record.text, record.org, cv2.FONT_HERSHEY_SIMPLEX, record.scale, record.color, record.thickness)
+
+
+_DRAW = {
+    Line: _draw_line,
+    Rect: _draw_rect,
+    Circle: _draw_circle,
+    Text: _draw_text,
+}
+
+
+def labelled_box(box, text, box_color, text_color=(36, 255, 12), thickness=3, font_scale=1):
+    """
+    Records of a box with its label written on a filled background above it.
+    """
+    x1, y1, x2, y2 = map(int, box)
+    (text_w, text_h), _ = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, font_scale, thickness)
+    return [
+        Rect((x1, y1), (x2, y2), box_color, thickness),
+        Rect((x1, y1 - text_h - 10), (x1 + text_w, y1), box_color, cv2.FILLED),
+        Text(text, (x1, y1 - 5), font_scale, text_color, thickness),
+    ]
+
+
+def draw_annotations(frame, records):
+    """
+    Draws annotation records on the frame in place, in order, and returns the frame.
+    """
+    for record in records:
+        _DRAW[type(record)](frame, record)
+    return frame
+
+
+class StaticLayer:
+    """
+    Annotations that are the same on every frame (e.g. the court lines), drawn once instead
+    of on every frame. Drawing them turns each pixel into background * keep + ink, and both
+    are recovered by drawing the records on a black and on a white image.
+
+    apply() copies the fully covered pixels, exactly as drawing would, and blends the
+    partly covered ones (antialiased text edges), within one grey level of drawing. Only
+    the bounding box of the annotations (roi, as y0, y1, x0, x1) is kept and touched.
+    """
+    def __init__(self, records, frame_shape):
+        records = list(records)
+        self.shape = tuple(frame_shape)
+        ink = draw_annotations(np.zeros(frame_shape, dtype=np.uint8), records)
+        white = draw_annotations(np.full(frame_shape, 255, dtype=np.uint8), records)
+        keep = (white.astype(np.float32) - ink) / 255
+
+        touched = (keep < 1).any(axis=2)
+        rows, cols = np.nonzero(touched.any(axis=1))[0], np.nonzero(touched.any(axis=0))[0]
+        if len(rows):
+            self.roi = (rows[0], rows[-1] + 1, cols[0], cols[-1] + 1)
+        else:
+            self.roi = (0, 0, 0, 0)
+        y0, y1, x0, x1 = self.roi
+        ink, keep, touched = ink[y0:y1, x0:x1], keep[y0:y1, x0:x1], touched[y0:y1, x0:x1]
+
+        covered = (keep == 0).all(axis=2)
+        self.image = ink
+        # uint8 for cv2.copyTo, far faster than a masked np.copyto over the whole region
+        self.mask = covered.astype(np.uint8)
+        # Pixels the records cover only partly, with their own keep factors
+        self.partial = np.nonzero(touched & ~covered)
+        self.partial_keep = keep[self.partial]
+        self.partial_ink = ink[self.partial].astype(np.float32)
+
+    def apply(self, frame):
+        y0, y1, x0, x1 = self.roi
+        if y0 == y1:
+            return frame
+        view = frame[y0:y1, x0:x1]
+        cv2.copyTo(self.image, self.mask, view)
+        if len(self.partial[0]):
+            blended = view[self.partial] * self.partial_keep + self.partial_ink + 0.5
+            view[self.partial] = np.clip(blended, 0, 255).astype(np.uint8)
+        return frame
+
+
+class OverlayRenderer:
+    """
+    Draws the overlays of all the subsystems on a frame in a single pass. Every layer is
+    either a function returning the annotation records of a frame number, or a static layer
+    with an apply(frame) method (a StaticLayer, or e.g. a CourtOverlay) used on every frame.
+    Layers are drawn in order, so later layers are on top.
+
+    records() gives the annotations of a frame without drawing them, e.g. to export them
+    or to draw them somewhere else.
+    """
+    def __init__(self, layers):
+        self.layers = list(layers)
+
+    def records(self, frame_num):
+        records = []
+        for layer in self.layers:
+            if not hasattr(layer, 'apply'):
+                records.extend(layer(frame_num))
+        return records
+
+    def render(self, frame, frame_num):
+        for layer in self.layers:
+            if hasattr(layer, 'apply'):
+                layer.apply(frame)
+            else:
+                draw_annotations(frame, layer(frame_num))
+        return frame
@@ -0,0 +1,296 @@
+import queue
+import threading
+import time
+
+_END = object()
+
+# How often blocked threads check whether the pipeline has been aborted
+_POLL_SECONDS = 0.1
+
+
+class Pipeline:
+    """
+    Stage graph scheduler. Every stage runs on its own thread(s) and reads its input from a
+    bounded queue filled by the stage before it, so all the stages work at the same time on
+    different frames and the wall time approaches that of the slowest stage instead of the
+    sum of all of them. A full queue blocks the stage feeding it, which keeps memory bounded.
+
+        pipeline = Pipeline()
+        frames = pipeline.source("decode", FrameSource(video_path))
+        drawn = pipeline.map("draw", draw_frame, frames, workers=2)
+        pipeline.map("encode", video_writer.write, drawn)
+        pipeline.run()
+
+    A stage with several downstream stages hands every item to each of them. Heavy work
+    (inference, decoding, drawing, encoding) releases the GIL, so threads are enough.
+
+    run() prints and returns per-stage metrics: items, busy time, throughput while busy,
+    time spent waiting for input and blocked on a full output queue, and the depth of the
+    input queue. The stage with the most busy time per worker is the bottleneck.
+    """
+    def __init__(self, queue_size=32):
+        self.queue_size = queue_size
+        self.stages = []
+        self.abort = threading.Event()
+
+    def source(self, name, iterable):
+        """
+        Stage producing the items of an iterable, e.g. a FrameSource.
+        """
+        return self._add(_Stage(self, name, 'source', iterable))
+
+    def map(self, name, fn, upstream, workers=1, queue_size=None):
+        """
+        Stage calling fn on every item of upstream. Its output is fn's return values, in
+        input order even with several workers. Used as the last stage (e.g. encode), the
+        return values are dropped.
+        """
+        return self._add(_Stage(self, name, 'map', fn, upstream, workers, queue_size))
+
+    def consume(self, name, fn, upstream, max_items=None, queue_size=None):
+        """
+        Stage calling fn once with an iterable of the items of upstream (e.g. a tracker's
+        detect_frames), limited to the first max_items items. stage.result() returns what
+        fn returned. When fn returns early, the stage simply stops receiving items.
+        """
+        return self._add(_Stage(self, name, 'consume', fn, upstream, 1, queue_size, max_items))
+
+    def _add(self, stage):
+        self.stages.append(stage)
+        return stage
+
+    def run(self, report=True):
+        start = time.perf_counter()
+        for stage in self.stages:
+            stage.start()
+        for stage in self.stages:
+            stage.join()
+        self.wall_seconds = time.perf_counter() - start
+
+        for stage in self.stages:
+            if stage.error is not None:
+                raise stage.error
+
+        metrics = self.metrics()
+        if report:
+            self.print_report(metrics)
+        return metrics
+
+    def metrics(self):
+        return {stage.name: stage.metrics() for stage in self.stages}
+
+    def print_report(self, metrics):
+        print(f"Pipeline: {self.wall_seconds:.2f}s wall time")
+        print(f"  {'stage':<16}{'items':>8}{'busy s':>9}{'items/s':>10}{'wait in s':>11}{'wait out s':>12}{'queue avg/max':>15}")
+        for name, m in metrics.items():
+            depth = f"{m['queue_mean']:.1f}/{m['queue_max']}" if m['queue_size'] else "-"
+            print(f"  {name:<16}{m['items']:>8}{m['busy_seconds']:>9.2f}{m['busy_fps']:>10.1f}"
+                  f"{m['wait_in_seconds']:>11.2f}{m['wait_out_seconds']:>12.2f}{depth:>15}")
+        if metrics:
+            slowest = max(metrics, key=lambda name: metrics[name]['busy_seconds'] / metrics[name]['workers'])
+            print(f"  slowest stage: {slowest}")
+
+
+class _Stage:
+    def __init__(self, pipeline, name, kind, fn, upstream=None, workers=1, queue_size=None, max_items=None):
+        self.pipeline = pipeline
+        self.name = name
+        self.kind = kind
+        self.fn = fn
+        self.workers = workers
+        self.max_items = max_items
+        self.downstream = []
+        self.queue = None
+        if upstream is not None:
+            self.queue = queue.Queue(maxsize=queue_size or pipeline.queue_size)
+            upstream.downstream.append(self)
+
+        self.lock = threading.Lock()
+        self.turn = threading.Condition(self.lock)
+        self.next_out = 0
+        self.received = 0
+        self.closed = False
+        self.finished_workers = 0
+        # Set once the stage reads no more input, because it has finished or stopped early
+        self.stopped = threading.Event()
+        self.done = threading.Event()
+        self.threads = []
+        self.value = None
+        self.error = None
+
+        # Metrics
+        self.items = 0
+        self.wait_in_seconds = 0.0
+        self.wait_out_seconds = 0.0
+        self.active_seconds = 0.0
+        self.depth_sum = 0
+        self.depth_max = 0
+        self.depth_samples = 0
+
+    def start(self):
+        target = {'source': self._run_source, 'map': self._run_map, 'consume': self._run_consume}[self.kind]
+        self.threads = [threading.Thread(target=self._guarded, args=(target,), daemon=True, name=f"{self.name}-{i}")
+                        for i in range(self.workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def join(self):
+        for thread in self.threads:
+            thread.join()
+
+    def result(self):
+        """
+        What the function of a consume stage returned, once the pipeline has run.
+        """
+        self.join()
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+    def _guarded(self, target):
+        start = time.perf_counter()
+        try:
+            target()
+        except BaseException as e:
+            self.error = e
+            self.pipeline.abort.set()
+        finally:
+            with self.lock:
+                self.active_seconds += time.perf_counter() - start
+                self.finished_workers += 1
+                last = self.finished_workers == self.workers
+            if last:
+                self.stopped.set()
+                self.done.set()
+                for stage in self.downstream:
+                    stage.close()
+
+    # Input side
+
+    def accepting(self):
+        if self.closed or self.stopped.is_set():
+            return False
+        return self.max_items is None or self.received < self.max_items
+
+    def put(self, item):
+        # Items are numbered as they arrive, so workers can restore the order on the way out
+        self._blocking_put((self.received, item))
+        self.received += 1
+        if self.max_items is not None and self.received >= self.max_items:
+            self.close()
+
+    def close(self):
+        # Called by the upstream stage when it has no more items
+        if not self.closed:
+            self.closed = True
+            self._blocking_put(_END)
+
+    def stop(self):
+        # Called by the stage itself to stop reading early
+        self.closed = True
+        self.stopped.set()
+
+    def _blocking_put(self, item):
+        # Gives up once this stage has stopped reading or the pipeline has been aborted
+        while not (self.stopped.is_set() or self.pipeline.abort.is_set()):
+            try:
+                self.queue.put(item, timeout=_POLL_SECONDS)
+                return
+            except queue.Full:
+                continue
+
+    def _get(self):
+        depth = self.queue.qsize()
+        wait_start = time.perf_counter()
+        while True:
+            if self.pipeline.abort.is_set() or self.stopped.is_set():
+                item = _END
+                break
+            try:
+                item = self.queue.get(timeout=_POLL_SECONDS)
+                break
+            except queue.Empty:
+                continue
+        with self.lock:
+            self.wait_in_seconds += time.perf_counter() - wait_start
+            self.depth_sum += depth
+            self.depth_max = max(self.depth_max, depth)
+            self.depth_samples += 1
+        return item
+
+    def _items(self):
+        # (number, item) pairs in arrival order
+        while True:
+            item = self._get()
+            if item is _END:
+                # Let the other workers of this stage see the end too
+                self.stop()
+                return
+            yield item
+
+    # Output side
+
+    def _emit(self, item):
+        """
+        Hands an item to every downstream stage still accepting items. Returns False once
+        none of them is, so the stage can stop early.
+        """
+        if not self.downstream:
+            return True
+        wait_start = time.perf_counter()
+        accepted = False
+        for stage in self.downstream:
+            if stage.accepting():
+                stage.put(item)
+                accepted = True
+        self.wait_out_seconds += time.perf_counter() - wait_start
+        return accepted
+
+    # Stage loops
+
+    def _run_source(self):
+        for item in self.fn:
+            if self.pipeline.abort.is_set():
+                return
+            self.items += 1
+            if not self._emit(item):
+                return
+
+    def _run_map(self):
+        for number, item in self._items():
+            result = self.fn(item)
+            # With several workers, results leave the stage in input order
+            turn_start = time.perf_counter()
+            with self.turn:
+                while self.next_out != number and not self.pipeline.abort.is_set():
+                    self.turn.wait(_POLL_SECONDS)
+                self.wait_out_seconds += time.perf_counter() - turn_start
+                self.items += 1
+                keep_going = self._emit(result)
+                self.next_out += 1
+                self.turn.notify_all()
+            if not keep_going:
+                self.stop()
+                return
+
+    def _run_consume(self):
+        def items():
+            for _, item in self._items():
+                self.items += 1
+                yield item
+        self.value = self.fn(items())
+
+    def metrics(self):
+        # Summed over the workers, busy_seconds / workers is the time the stage needs on its own
+        busy = max(0.0, self.active_seconds - self.wait_in_seconds - self.wait_out_seconds)
+        return {
+            'items': self.items,
+            'workers': self.workers,
+            'busy_seconds': busy,
+            'busy_fps': self.items * self.workers / busy if busy > 0 else 0.0,
+            'wait_in_seconds': self.wait_in_seconds,
+            'wait_out_seconds': self.wait_out_seconds,
+            'queue_size': self.queue.maxsize if self.queue is not None else 0,
+            'queue_mean': self.depth_sum / self.depth_samples if self.depth_samples else 0.0,
+            'queue_max': self.depth_max,
+        }
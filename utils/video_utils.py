@@ -1,35 +1,177 @@
+import threading
+import queue
+from collections import namedtuple
+
 import cv2
 
-def read_video(video_path):
-    cap = cv2.VideoCapture(video_path, cv2.CAP_FFMPEG)
-    fps = cap.get(cv2.CAP_PROP_FPS)
+# A decoded frame together with its position in the video
+VideoFrame = namedtuple('VideoFrame', ['index', 'timestamp', 'image'])
 
-    frames = []
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-        frames.append(frame)
-    cap.release()
-    return frames, fps
+_END_OF_STREAM = object()
+
+
+class FrameSource:
+    """
+    Streams frames from a video file instead of decoding the whole match into memory.
+    Decoding runs on a background thread and stays at most `prefetch` frames ahead of
+    the consumer, so memory is flat regardless of video length and decode overlaps
+    with whatever the consumer is doing (inference, drawing, encoding).
+
+    Iterating yields plain BGR frames, so a FrameSource can be passed anywhere a list
+    of frames was used before. Use `indexed()` to also get the frame index and timestamp.
+
+    `start_frame` and `max_frames` select a run of frames, e.g. one chunk of a long match;
+    indices and timestamps stay those of the whole video, and the run starts on the same
+    frame as a decode from the beginning (see _open_at_frame).
+    """
+    def __init__(self, video_path, prefetch=32, max_frames=None, start_frame=0):
+        self.video_path = video_path
+        self.prefetch = prefetch
+        self.max_frames = max_frames
+        self.start_frame = start_frame
+
+        # Read the video properties once, without decoding anything
+        cap = cv2.VideoCapture(video_path, cv2.CAP_FFMPEG)
+        self.fps = cap.get(cv2.CAP_PROP_FPS)
+        self.width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self.total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        cap.release()
+
+        self.total_frames = max(0, self.total_frames - start_frame)
+        if self.max_frames is not None:
+            self.total_frames = min(self.total_frames, self.max_frames)
+
+    def __len__(self):
+        # Container frame count, may be off by a few frames for some codecs
+        return self.total_frames
+
+    def __iter__(self):
+        for video_frame in self.indexed():
+            yield video_frame.image
+
+    def indexed(self):
+        """
+        Yields VideoFrame(index, timestamp, image) tuples in decode order.
+        Every call starts a fresh decode from start_frame.
+        """
+        frame_queue = queue.Queue(maxsize=self.prefetch)
+        stop = threading.Event()
+
+        decoder = threading.Thread(target=self._decode, args=(frame_queue, stop), daemon=True)
+        decoder.start()
+
+        try:
+            while True:
+                item = frame_queue.get()
+                if item is _END_OF_STREAM:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            # The consumer may stop early, make sure the decoder does not block on a full queue
+            stop.set()
+            while decoder.is_alive():
+                try:
+                    frame_queue.get_nowait()
+                except queue.Empty:
+                    decoder.join(timeout=0.01)
+
+    def _decode(self, frame_queue, stop):
+        cap = _open_at_frame(self.video_path, self.start_frame, self.fps)
+        try:
+            index = self.start_frame
+            while not stop.is_set():
+                if self.max_frames is not None and index - self.start_frame >= self.max_frames:
+                    break
+                ret, image = cap.read()
+                if not ret:
+                    break
+                timestamp = index / self.fps if self.fps else cap.get(cv2.CAP_PROP_POS_MSEC) / 1000
+                _put(frame_queue, VideoFrame(index, timestamp, image), stop)
+                index += 1
+        except Exception as e:
+            _put(frame_queue, e, stop)
+        finally:
+            cap.release()
+            _put(frame_queue, _END_OF_STREAM, stop)
 
-def read_video_few_frames(video_path):
+
+def _open_at_frame(video_path, frame_index, fps):
+    """
+    Opens video_path so that the next read() gives frame frame_index, as a decode from the
+    beginning would. Seeking with CAP_PROP_POS_FRAMES lands on a nearby keyframe instead for
+    some codecs, so the seek goes to the frame before and checks the timestamp of that frame;
+    when it does not match, the frames up to frame_index are grabbed in order instead.
+    """
     cap = cv2.VideoCapture(video_path, cv2.CAP_FFMPEG)
-    fps = cap.get(cv2.CAP_PROP_FPS)
+    if frame_index <= 0:
+        return cap
+    if fps and cap.set(cv2.CAP_PROP_POS_FRAMES, frame_index - 1) and cap.grab():
+        # Timestamp of the frame just decoded, within half a frame of where it should be
+        if abs(cap.get(cv2.CAP_PROP_POS_MSEC) - 1000 * (frame_index - 1) / fps) < 500 / fps:
+            return cap
 
-    frames = []
-    for i in range(int(fps * 5)):
-        ret, frame = cap.read()
-        if not ret:
-            break
-        frames.append(frame)
     cap.release()
-    return frames, fps
+    cap = cv2.VideoCapture(video_path, cv2.CAP_FFMPEG)
+    for _ in range(frame_index):
+        if not cap.grab():
+            break
+    return cap
 
-def write_video(frames, output_path, fps):
-    height, width, _ = frames[0].shape
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-    video_writer = cv2.VideoWriter(output_path, fourcc, fps, (width, height))
+
+def _put(frame_queue, item, stop):
+    # Blocking put that gives up once the consumer has gone away
+    while not stop.is_set():
+        try:
+            frame_queue.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            continue
+
+
+def batch_frames(frames, batch_size):
+    """
+    Groups any iterable of frames into lists of at most batch_size consecutive frames.
+    """
+    batch = []
     for frame in frames:
-        video_writer.write(frame)
-    video_writer.release()
\ No newline at end of file
+        batch.append(frame)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def read_video(video_path):
+    source = FrameSource(video_path)
+    frames = list(source)
+    return frames, source.fps
+
+
+def encode_frames(frames, output_path, fps, fourcc='mp4v'):
+    """
+    Encodes frames with cv2.VideoWriter on the calling thread, e.g. as the encode stage of a
+    Pipeline, which already gives it a thread and a bounded queue. The writer is sized from
+    the first frame. Returns the number of frames written.
+    """
+    video_writer = None
+    count = 0
+    try:
+        for frame in frames:
+            if video_writer is None:
+                height, width = frame.shape[:2]
+                video_writer = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*fourcc), fps, (width, height))
+            video_writer.write(frame)
+            count += 1
+    finally:
+        if video_writer is not None:
+            video_writer.release()
+    return count
+
+
+def write_video(frames, output_path, fps):
+    # frames may be any iterable (e.g. a generator of rendered frames)
+    return encode_frames(frames, output_path, fps)